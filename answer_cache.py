@@ -0,0 +1,155 @@
+# 海龟汤主持人的答案缓存：同一道题的不同对局之间共享主持人的判定
+#
+# 同一道题被反复玩时，玩家问的问题大同小异（"他是不是吃过人肉？"）。主持人的判定只取决于题目和问题，
+# 所以把验证过的判定按题目持久化，下次遇到足够相似的问题直接取回，不再调用模型。
+#
+# 相似度完全在本地计算：问题规范化（question_index.normalize）后取字符 1-gram + 2-gram 的计数向量，
+# 用倒排索引找候选、按余弦相似度打分，超过置信阈值才算命中；否定词不同的问题不会命中。
+#
+# 每道题一个 JSONL 文件（answer_cache/<题目哈希>.jsonl），只追加。多个进程可以同时读写同一道题的缓存：
+# 查找前会读入其他进程新追加的行。
+#
+# 只缓存"验证过"的判定：能解析出合法的 answer、且不是破解（solved 为 true 的回答会揭晓答案，每局都交给模型判断）。
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from host_verdict import ANSWERS, parse_host_verdict
+from question_index import NEGATIONS, normalize
+
+DEFAULT_CACHE_DIR = os.getenv("QDD_ANSWER_CACHE", "answer_cache")
+CONFIDENCE_THRESHOLD = 0.85
+
+
+def cache_path(puzzle_title, directory=DEFAULT_CACHE_DIR):
+    """一道题的缓存文件路径"""
+    digest = hashlib.sha1(puzzle_title.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"{digest}.jsonl")
+
+
+def vector(key):
+    """规范化问题的字符 1-gram + 2-gram 计数向量"""
+    grams = Counter(key)
+    grams.update(key[i:i + 2] for i in range(len(key) - 1))
+    return grams
+
+
+def cosine(a, b, norm_a, norm_b):
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    return dot / (norm_a * norm_b) if norm_a and norm_b else 0.0
+
+
+def is_verified(response):
+    """主持人的回答能否放进缓存：合法的判定，且不是破解"""
+    verdict = parse_host_verdict(response)
+    return verdict["answer"] in ANSWERS and not verdict["solved"]
+
+
+class AnswerCache:
+    """一道题的答案缓存（线程安全，可被同一进程内的多局共享）"""
+
+    def __init__(self, puzzle_title, directory=DEFAULT_CACHE_DIR, threshold=CONFIDENCE_THRESHOLD):
+        self.puzzle_title = puzzle_title
+        self.threshold = threshold
+        self.path = cache_path(puzzle_title, directory)
+        os.makedirs(directory, exist_ok=True)
+
+        self.entries = []   # [(规范化问题, 向量, 向量长度, 原问题, 主持人回答)]
+        self.exact = {}     # 规范化问题 -> entries 下标
+        self.postings = {}  # gram -> entries 下标集合
+        self.offset = 0     # 已读入的文件位置
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._refresh()
+
+    def _refresh(self):
+        """读入文件中新追加的行（包括其他进程写入的）"""
+        try:
+            if os.path.getsize(self.path) <= self.offset:
+                return
+        except FileNotFoundError:
+            return
+        # 二进制读取：offset 是字节位置（文本模式的 seek 只接受 tell() 的返回值，换行符转换时按字节算的位置也不对）
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        *lines, partial = data.split(b"\n")  # 最后一段没有换行结尾：其他进程正在写的半行，下次再读
+        self.offset += len(data) - len(partial)
+        for line in lines:
+            try:
+                entry = json.loads(line.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                continue
+            self._index(entry["question"], entry["response"])
+
+    def _index(self, question, response):
+        key = normalize(question)
+        if not key or key in self.exact:
+            return False
+        grams = vector(key)
+        index = len(self.entries)
+        self.entries.append((key, grams, math.sqrt(sum(c * c for c in grams.values())), question, response))
+        self.exact[key] = index
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(index)
+        return True
+
+    def lookup(self, question):
+        """返回 (缓存中的原问题, 主持人回答, 相似度)；没有足够相似的问题时返回 None"""
+        key = normalize(question)
+        with self.lock:
+            self._refresh()
+            if key in self.exact:
+                self.hits += 1
+                _, _, _, asked, response = self.entries[self.exact[key]]
+                return asked, response, 1.0
+
+            grams = vector(key)
+            norm = math.sqrt(sum(c * c for c in grams.values()))
+            negations = NEGATIONS & set(key)
+            candidates = set()
+            for gram in grams:
+                candidates |= self.postings.get(gram, set())
+            best, best_score = None, self.threshold
+            for i in candidates:
+                other_key, other_grams, other_norm, _, _ = self.entries[i]
+                if NEGATIONS & set(other_key) != negations:
+                    continue
+                score = cosine(grams, other_grams, norm, other_norm)
+                if score >= best_score:
+                    best, best_score = i, score
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            _, _, _, asked, response = self.entries[best]
+            return asked, response, best_score
+
+    def add(self, question, response):
+        """把模型给出的判定放进缓存（未通过验证或已有相同问题时忽略）"""
+        if not is_verified(response):
+            return
+        with self.lock:
+            if not self._index(question, response):
+                return
+            line = json.dumps({"question": question, "response": response, "created_at": time.time()}, ensure_ascii=False)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def open_answer_cache(puzzle_title, directory=DEFAULT_CACHE_DIR):
+    """取得一道题的答案缓存；同一进程内同一道题共享一个实例"""
+    key = (os.path.abspath(directory), puzzle_title)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = AnswerCache(puzzle_title, directory)
+        return _caches[key]
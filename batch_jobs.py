@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# 分片批量任务：任务清单 + 多进程/多机 worker，崩溃后可从断点继续
+#
+# 任务清单（manifest）是 JSONL，每行一个对话任务：
+#   {"scenario": "debate", "persona": "你是一名资深律师", "model": "gpt-4o", "seed": 1}
+#   {"scenario": "turtle_soup", "puzzle": "海龟汤", "model": "deepseek-chat", "seed": 7}
+# 海龟汤任务可以用 "corpus" 指定题库路径（默认 QDD_PUZZLE_CORPUS / 内置题目）；init 时换成绝对路径写进任务行，
+# 之后不论 worker 在哪个目录、环境变量如何都从同一个题库找题。
+# 可选字段 "id"（默认按行号生成）。persona 也可以是 {角色: 人设} 字典。
+# camel 场景可以用 "options" 传入场景的 run_session 参数，如 {"format": "standard"}（辩论赛制）、{"panel": true}（面试小组）。
+#
+# 用法：
+#   python batch_jobs.py init manifest.jsonl jobs/run1 --shard-size 50
+#   python batch_jobs.py work jobs/run1 --processes 4 --concurrency 8    # 多台机器可共享同一目录
+#   python batch_jobs.py status jobs/run1
+#
+# 目录结构：
+#   job.json            任务元信息（任务 id、分片大小、行数）
+#   manifest.jsonl      任务清单副本
+#   locks/shard-N.lock  分片锁（worker 定期刷新 mtime 作为心跳，超时视为失效可被接管）
+#   done/shard-N.done   分片完成标记
+#   results/<id>.json   每个任务的结果（原子写入；存在即视为已完成，重启时跳过）
+#   failed/<id>.json    最近一次失败的信息（重跑时会再次尝试）
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from puzzle_corpus import DEFAULT_CORPUS
+from session_runner import SCENARIOS, load_scenario
+from transcript_store import DEFAULT_DB, TranscriptStore
+
+TURTLE_SOUP = "turtle_soup"
+
+
+# ============ 文件工具 ============
+def write_json_atomic(path, data):
+    """先写临时文件再 rename，保证读者永远看不到写了一半的文件"""
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path):
+    """读取任务清单，为没有 id 的行按行号生成 id"""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            row.setdefault("id", f"row-{line_no:06d}")
+            rows.append(row)
+    return rows
+
+
+class JobDir:
+    """共享任务目录的路径约定"""
+
+    def __init__(self, root):
+        self.root = root
+        self.locks = os.path.join(root, "locks")
+        self.done = os.path.join(root, "done")
+        self.results = os.path.join(root, "results")
+        self.failed = os.path.join(root, "failed")
+
+    def init(self, manifest_path, shard_size):
+        for d in (self.root, self.locks, self.done, self.results, self.failed):
+            os.makedirs(d, exist_ok=True)
+        rows = load_manifest(manifest_path)
+        ids = [row["id"] for row in rows]
+        if len(set(ids)) != len(ids):
+            raise ValueError("任务清单中存在重复的 id")
+        for row in rows:
+            if row.get("scenario") not in SCENARIOS and row.get("scenario") != TURTLE_SOUP:
+                raise ValueError(f"{row['id']}: 未知场景 {row.get('scenario')}")
+            if row["scenario"] == TURTLE_SOUP and not row.get("puzzle"):
+                raise ValueError(f"{row['id']}: 海龟汤任务缺少 puzzle 字段")
+            if row["scenario"] == TURTLE_SOUP:
+                corpus = row.get("corpus", DEFAULT_CORPUS)
+                row["corpus"] = os.path.abspath(corpus) if corpus else None
+        with open(self.manifest_path, "w", encoding="utf-8") as f:  # 副本里的每行都带上 id（海龟汤任务还有题库）
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        write_json_atomic(os.path.join(self.root, "job.json"), {
+            "job_id": uuid.uuid4().hex[:8],  # 会话 id 的前缀，避免不同任务的同名行在转录库中冲突
+            "shard_size": shard_size,
+            "num_rows": len(rows),
+            "created_at": time.time(),
+        })
+        return len(rows)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, "manifest.jsonl")
+
+    def meta(self):
+        with open(os.path.join(self.root, "job.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def shards(self):
+        """按分片大小切分任务清单，返回 [(分片号, 行列表), ...]"""
+        rows = load_manifest(self.manifest_path)
+        size = self.meta()["shard_size"]
+        return [(i // size, rows[i:i + size]) for i in range(0, len(rows), size)]
+
+    def lock_path(self, shard_id):
+        return os.path.join(self.locks, f"shard-{shard_id:05d}.lock")
+
+    def done_path(self, shard_id):
+        return os.path.join(self.done, f"shard-{shard_id:05d}.done")
+
+    def result_path(self, row_id):
+        return os.path.join(self.results, f"{row_id}.json")
+
+    def failed_path(self, row_id):
+        return os.path.join(self.failed, f"{row_id}.json")
+
+
+# ============ 分片锁 ============
+def try_claim(job, shard_id, worker_id, stale_after):
+    """尝试用 O_EXCL 创建锁文件来认领分片；锁超过 stale_after 秒未刷新视为失效，可以接管"""
+    lock_path = job.lock_path(shard_id)
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.path.getmtime(lock_path)
+            except FileNotFoundError:
+                continue
+            if age < stale_after:
+                return False
+            # 先把失效的锁改名（原子操作，只有一个 worker 能成功），再重新创建
+            try:
+                os.rename(lock_path, f"{lock_path}.stale.{worker_id}")
+                os.remove(f"{lock_path}.stale.{worker_id}")
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w") as f:
+            json.dump({"worker": worker_id, "claimed_at": time.time()}, f)
+        return True
+    return False
+
+
+def release(job, shard_id):
+    try:
+        os.remove(job.lock_path(shard_id))
+    except FileNotFoundError:
+        pass
+
+
+async def heartbeat(path, interval):
+    """定期刷新锁文件的 mtime，表明 worker 仍然存活"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+
+
+# ============ 执行单个任务 ============
+class RowRunner:
+    """在一个 worker 进程内执行任务行：camel 场景走 astep 协程，海龟汤走线程池"""
+
+    def __init__(self, concurrency, job_id, store=None):
+        self.models = {}  # (scenario, model, seed) -> 共享的模型后端
+        self.thread_pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.job_id = job_id
+        self.store = store  # 转录库（本进程内所有任务共享）
+
+    def session_id(self, row):
+        return f"{self.job_id}/{row['id']}"
+
+    def get_model(self, module, scenario, model_id, seed):
+        key = (scenario, model_id, seed)
+        if key not in self.models:
+            self.models[key] = module.create_model(model_id, seed=seed)
+        return self.models[key]
+
+    async def run(self, row):
+        scenario = row["scenario"]
+        if self.store:
+            # 失败重跑或接管失效分片时 session_id 不变：先删掉上次写了一半的发言，导出和统计时才不会重复计数
+            self.store.discard_session(self.session_id(row))
+        if scenario == TURTLE_SOUP:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.thread_pool, run_turtle_soup_row, row, self.session_id(row), self.store)
+
+        from camel_session import CamelSession
+
+        module = load_scenario(scenario)
+        model = self.get_model(module, scenario, row.get("model"), row.get("seed"))
+        session = CamelSession(scenario, session_id=self.session_id(row), verbose=False, store=self.store,
+                               options=row.get("options"))
+        await module.run_session(session, module.create_agents(model, persona=row.get("persona")), **row.get("options", {}))
+        record = session.to_record()
+        record.update(model=row.get("model") or module.MODEL_ID, seed=row.get("seed"), persona=row.get("persona"),
+                      options=row.get("options"))
+        return record
+
+
+def run_turtle_soup_row(row, session_id, store=None):
+    """在线程中无交互地跑一局海龟汤"""
+    import turtle_soup_multi_agent as turtle_soup
+
+    corpus = turtle_soup.puzzle_corpus(row.get("corpus", DEFAULT_CORPUS))  # 早期任务目录的行没有记录题库
+    puzzle = turtle_soup.find_puzzle(row["puzzle"], corpus)
+    game = turtle_soup.GameSession(
+        model_id=row.get("model"), seed=row.get("seed"), verbose=False, session_id=session_id, store=store,
+        corpus=corpus,
+    )
+    turtle_soup.play_multi_agent_game(puzzle, game)
+    return game.to_record(puzzle)
+
+
+async def run_shard(job, shard_id, rows, runner, concurrency, stale_after):
+    """并发执行一个分片中尚未完成的任务，返回失败数"""
+    pending = [row for row in rows if not os.path.exists(job.result_path(row["id"]))]
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def run_one(row):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                record = await runner.run(row)
+                error = record.get("error")
+            except Exception as e:
+                record, error = None, f"{type(e).__name__}: {e}"
+            if error:
+                failures += 1
+                write_json_atomic(job.failed_path(row["id"]), {"row": row, "error": error, "failed_at": time.time()})
+                print(f"   ❌ {row['id']} 失败: {error}", flush=True)
+                return
+            record["elapsed"] = round(time.perf_counter() - start, 3)
+            write_json_atomic(job.result_path(row["id"]), record)
+            try:
+                os.remove(job.failed_path(row["id"]))
+            except FileNotFoundError:
+                pass
+            print(f"   ✅ {row['id']} ({record['elapsed']:.1f}s)", flush=True)
+
+    beat = asyncio.create_task(heartbeat(job.lock_path(shard_id), max(stale_after / 3, 1)))
+    try:
+        await asyncio.gather(*(run_one(row) for row in pending))
+    finally:
+        beat.cancel()
+    return failures
+
+
+def work(job_root, concurrency=8, stale_after=300, store_path=None):
+    """worker 进程入口"""
+    asyncio.run(work_async(job_root, concurrency, stale_after, store_path))
+
+
+async def work_async(job_root, concurrency, stale_after, store_path=None):
+    """worker 主循环：依次认领未完成的分片并执行，直到没有可认领的分片
+
+    整个 worker 只用一个事件循环，模型后端（及其连接池）在分片之间复用。
+    """
+    job = JobDir(job_root)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    job_id = job.meta().get("job_id") or os.path.basename(os.path.abspath(job_root))
+    runner = RowRunner(concurrency, job_id, store=TranscriptStore(store_path) if store_path else None)
+    attempted = set()  # 本次运行已处理过的分片（有失败的分片留给下次重跑）
+
+    print(f"👷 worker {worker_id} 启动", flush=True)
+    for shard_id, rows in job.shards():
+        if shard_id in attempted or os.path.exists(job.done_path(shard_id)):
+            continue
+        if not try_claim(job, shard_id, worker_id, stale_after):
+            continue
+        attempted.add(shard_id)
+        try:
+            print(f"📦 worker {worker_id} 认领分片 {shard_id}（{len(rows)} 条）", flush=True)
+            failures = await run_shard(job, shard_id, rows, runner, concurrency, stale_after)
+            if failures == 0:
+                write_json_atomic(job.done_path(shard_id), {"worker": worker_id, "finished_at": time.time()})
+        finally:
+            release(job, shard_id)
+    runner.thread_pool.shutdown()
+    if runner.store:
+        runner.store.close()
+    print(f"🏁 worker {worker_id} 没有更多可认领的分片，退出", flush=True)
+
+
+def status(job_root):
+    job = JobDir(job_root)
+    meta = job.meta()
+    shards = job.shards()
+    done_shards = sum(os.path.exists(job.done_path(i)) for i, _ in shards)
+    locked = sum(os.path.exists(job.lock_path(i)) for i, _ in shards)
+    results = len([f for f in os.listdir(job.results) if f.endswith(".json")])
+    failed = len([f for f in os.listdir(job.failed) if f.endswith(".json")])
+    print("="*70)
+    print(f"📋 任务目录: {job_root}")
+    print("="*70)
+    print(f"任务总数: {meta['num_rows']}（分片大小 {meta['shard_size']}，共 {len(shards)} 片）")
+    print(f"已完成任务: {results}")
+    print(f"失败待重跑: {failed}")
+    print(f"已完成分片: {done_shards}，进行中: {locked}")
+    print("="*70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分片批量生成对话（可断点续跑）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_init = sub.add_parser("init", help="根据任务清单创建任务目录")
+    p_init.add_argument("manifest", help="任务清单 JSONL")
+    p_init.add_argument("job_dir", help="共享任务目录")
+    p_init.add_argument("--shard-size", type=int, default=50, help="每个分片的任务数")
+
+    p_work = sub.add_parser("work", help="启动 worker 认领并执行分片")
+    p_work.add_argument("job_dir")
+    p_work.add_argument("--processes", type=int, default=1, help="本机 worker 进程数")
+    p_work.add_argument("--concurrency", type=int, default=8, help="每个进程内同时进行的任务数")
+    p_work.add_argument("--stale-after", type=float, default=300, help="锁超过多少秒未刷新视为 worker 已失效")
+    p_work.add_argument("--store", default=DEFAULT_DB, help=f"转录库路径（默认 {DEFAULT_DB}，多个 worker 共用）")
+    p_work.add_argument("--no-store", action="store_true", help="不写转录库")
+
+    p_status = sub.add_parser("status", help="查看任务进度")
+    p_status.add_argument("job_dir")
+
+    args = parser.parse_args()
+    if args.command == "init":
+        num_rows = JobDir(args.job_dir).init(args.manifest, args.shard_size)
+        print(f"✅ 已创建任务目录 {args.job_dir}，共 {num_rows} 条任务")
+    elif args.command == "work":
+        store_path = None if args.no_store else args.store
+        if args.processes <= 1:
+            work(args.job_dir, args.concurrency, args.stale_after, store_path)
+        else:
+            procs = [
+                multiprocessing.Process(target=work, args=(args.job_dir, args.concurrency, args.stale_after, store_path))
+                for _ in range(args.processes)
+            ]
+            for proc in procs:
+                proc.start()
+            for proc in procs:
+                proc.join()
+        status(args.job_dir)
+    else:
+        status(args.job_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# 多方对话的共享黑板记忆
+#
+# 三方对话里每个 ChatAgent 原来只收到上一位发言者的输出，听不到第三方说了什么。黑板上每条发言只存一份
+# （就是会话的 turns 列表），每个 agent 有一个游标，记录它读到了哪里：轮到它发言时，把游标之后其他人的发言
+# （它上次发言以来的新内容）拼成一条输入消息，再把游标移到末尾。
+#
+# 读过的内容已经在 agent 自己的记忆里（受 message_window_size / token_limit 限制），所以每条发言对每个 agent
+# 只送一次，提示词不会随参与人数成倍增长。一次要送的新内容超过 token 预算时只保留最近的几条。
+from token_accounting import count_tokens
+
+VIEW_TOKEN_BUDGET = 2000  # 一次送给 agent 的新发言最多多少 token（至少保留最新的一条）
+
+
+class Blackboard:
+    """会话的共享黑板
+
+    turns: 会话的发言列表（CamelSession.turns，直接引用，不复制）
+    names: 角色 -> 在黑板上显示的名字（如 {"pro": "正方辩手"}）
+    """
+
+    def __init__(self, turns, names, token_budget=VIEW_TOKEN_BUDGET):
+        self.turns = turns
+        self.names = names
+        self.token_budget = token_budget
+        self.cursors = {}  # 角色 -> 下一条未读发言的下标
+        self.tokens = []   # 每条发言的 token 数（每条只算一次）
+
+    def _tokens(self, index):
+        while len(self.tokens) <= index:
+            self.tokens.append(count_tokens(self.turns[len(self.tokens)]["content"]))
+        return self.tokens[index]
+
+    def unread(self, speaker):
+        """返回 (speaker 还没读过的其他人的发言, 因超出预算省略的条数)"""
+        start = self.cursors.get(speaker, 0)
+        indexes = [i for i in range(start, len(self.turns)) if self.turns[i]["speaker"] != speaker]
+        kept, used = [], 0
+        for i in reversed(indexes):
+            cost = self._tokens(i)
+            if kept and used + cost > self.token_budget:
+                break
+            kept.append(i)
+            used += cost
+        kept.reverse()
+        return [self.turns[i] for i in kept], len(indexes) - len(kept)
+
+    def read(self, speaker):
+        """取出 speaker 的未读内容拼成一段文本，并把游标移到末尾；没有未读内容时返回 None"""
+        turns, omitted = self.unread(speaker)
+        self.cursors[speaker] = len(self.turns)
+        if not turns:
+            return None
+        parts = [f"（省略了更早的 {omitted} 条发言）"] if omitted else []
+        parts += [f"【{self.names.get(turn['speaker'], turn['speaker'])}】\n{turn['content']}" for turn in turns]
+        return "\n\n".join(parts)
+
+    def seek(self, index, *speakers):
+        """把这些角色的游标移到 index：之前的发言视为已读（例如已经合并进一条汇总发言）"""
+        for speaker in speakers:
+            self.cursors[speaker] = index
@@ -0,0 +1,594 @@
+# camel 场景脚本共用的会话工具：模型创建、异步发言、转录记录
+import re
+import json
+import time
+import asyncio
+import contextvars
+import uuid
+import argparse
+import traceback
+
+from camel.agents.chat_agent import AsyncStreamingChatAgentResponse
+from camel.memories import ChatHistoryMemory, ContextRecord, MemoryRecord, ScoreBasedContextCreator
+from camel.messages import BaseMessage
+from camel.models import ModelFactory, ModelManager
+from camel.types import ModelPlatformType, ModelType, OpenAIBackendRole
+from camel.utils import BaseTokenCounter, OpenAITokenCounter
+
+from blackboard import VIEW_TOKEN_BUDGET, Blackboard
+from checkpoint import SessionCheckpoint, default_checkpoint_path, read_checkpoint_meta
+from compact_transcript import Transcript
+from model_router import get_router
+from rolling_memory import SUMMARY_HEADER, RollingMemory, summary_request
+from token_accounting import cached_count, content_key, count_tokens
+from transcript_store import DEFAULT_DB, TranscriptStore
+
+from dotenv import load_dotenv
+load_dotenv()  # 自动加载 .env 文件
+
+
+# ============ 模型 ============
+class RoutedModelManager(ModelManager):
+    """一个角色的多条候选线路（model_router.py）
+
+    调度策略 fastest_healthy 选当前最快的健康线路；调用失败时按排好的顺序换下一条线路重试，
+    每次调用的耗时和成败都记入路由器，下次调度据此重新排序。
+    同一个 manager 由并发的会话共享（RoleModels），本次调用用的是哪个后端（current_model）
+    记在 contextvars 里：每个 asyncio 任务 / 线程各自一份，并发会话之间不会互相覆盖。
+    """
+
+    def __init__(self, router, routes, backends):
+        self._current = contextvars.ContextVar(f"routed_model_{id(self)}", default=None)
+        super().__init__(backends, scheduling_strategy="always_first")
+        self.router = router
+        self.routes = routes
+        self.add_strategy("fastest_healthy", lambda manager: manager.models[manager.router.rank(manager.routes)[0]])
+
+    @property
+    def current_model(self):
+        return self._current.get() or self.models[0]
+
+    @current_model.setter
+    def current_model(self, backend):
+        self._current.set(backend)
+
+    def _attempts(self):
+        return [(self.routes[i], self.models[i]) for i in self.router.rank(self.routes)]
+
+    def run(self, messages, response_format=None, tools=None):
+        last_error = None
+        for route, backend in self._attempts():
+            self.current_model = backend
+            start = time.perf_counter()
+            try:
+                response = backend.run(messages, response_format, tools)
+            except Exception as e:
+                self.router.record(route, ok=False)
+                last_error = e
+                continue
+            self.router.record(route, time.perf_counter() - start)
+            return response
+        raise last_error
+
+    async def arun(self, messages, response_format=None, tools=None):
+        last_error = None
+        for route, backend in self._attempts():
+            self.current_model = backend
+            start = time.perf_counter()
+            try:
+                response = await backend.arun(messages, response_format, tools)
+            except Exception as e:
+                self.router.record(route, ok=False)
+                last_error = e
+                continue
+            self.router.record(route, time.perf_counter() - start)
+            return response
+        raise last_error
+
+
+class CachedTokenCounter(BaseTokenCounter):
+    """按消息内容缓存计数结果的 token 计数器（token_accounting.py 的缓存）
+
+    ScoreBasedContextCreator 每一步都把记忆里的每条消息重新计一遍 token 来执行 token_limit；
+    包一层缓存后每条消息只分词一次，每步的开销只与新增的消息有关。
+    """
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.base = counter.count_tokens_from_messages([])  # 与消息无关的固定开销（回复开头）
+
+    def count_tokens_from_messages(self, messages):
+        total = self.base
+        for message in messages:
+            key = ("camel", content_key(json.dumps(message, ensure_ascii=False, sort_keys=True, default=str)))
+            total += cached_count(key, lambda: self.counter.count_tokens_from_messages([message]) - self.base)
+        return total
+
+    def encode(self, text):
+        return self.counter.encode(text)
+
+    def decode(self, token_ids):
+        return self.counter.decode(token_ids)
+
+
+class LedgerContextCreator(ScoreBasedContextCreator):
+    """记住每条记录 token 数和累计值的上下文构造器（每个 agent 的记忆一个）
+
+    ScoreBasedContextCreator 每一步都把记忆里的每条记录重新计一遍 token。这里按记录 uuid 记下计过的数，
+    并维护按时间顺序的前缀和：记忆只追加时每步只计新增的记录，总数是 O(新增记录)；
+    全部放得进 token_limit 时直接按时间顺序输出，放不下时才交给父类按分数裁剪。
+    """
+
+    def __init__(self, token_counter, token_limit):
+        super().__init__(token_counter, token_limit)
+        self.uuids = []    # 上次计数时的记录（按传入的顺序）
+        self.prefix = [0]  # prefix[i] = 前 i 条记录的 token 数
+        self.counts = {}   # uuid -> token 数
+
+    @classmethod
+    def install(cls, agent):
+        """把 agent 记忆的上下文构造器换成本类（沿用原来的计数器和 token_limit）"""
+        memory = agent.memory
+        creator = memory.get_context_creator()
+        if not isinstance(creator, cls):
+            memory._context_creator = cls(creator.token_counter, creator.token_limit)
+        return memory._context_creator
+
+    def total(self, records):
+        """records 的 token 总数：与上次的记录列表对齐，只计新增（或末尾被替换）的记录"""
+        keep = min(len(self.uuids), len(records))
+        while keep and self.uuids[keep - 1] != records[keep - 1].memory_record.uuid:
+            keep -= 1
+        dropped = self.uuids[keep:]
+        del self.uuids[keep:]
+        del self.prefix[keep + 1:]
+        for record in records[keep:]:
+            uuid = record.memory_record.uuid
+            if uuid not in self.counts:
+                self.counts[uuid] = self.token_counter.count_tokens_from_messages([record.memory_record.to_openai_message()])
+            self.uuids.append(uuid)
+            self.prefix.append(self.prefix[-1] + self.counts[uuid])
+        if dropped:  # 不再出现的记录（如每步重新生成的摘要）不再保留计数
+            current = set(self.uuids[keep:])
+            for uuid in dropped:
+                if uuid not in current:
+                    self.counts.pop(uuid, None)
+        return self.prefix[-1]
+
+    def create_context(self, records):
+        if not records or self.total(records) > self.token_limit:
+            return super().create_context(records)
+        system = records[0].memory_record.role_at_backend == OpenAIBackendRole.SYSTEM
+        head, rest = (records[:1], records[1:]) if system else ([], records)
+        rest = sorted(rest, key=lambda record: (record.timestamp, -record.score))  # 与父类的输出顺序相同
+        return [record.memory_record.to_openai_message() for record in head + rest], self.prefix[-1]
+
+
+class RoleModels:
+    """按角色分配的模型后端，传给各场景的 create_agents
+
+    model_id 不为空时所有角色都用这个模型（仍在路由表给角色配置的端点之间切换），否则按路由表给每个角色选模型，
+    路由表里没有的角色用 default_model。后端在所有会话间共享，复用连接池。
+    """
+
+    def __init__(self, model_id, model_config_dict, default_model=None):
+        self.model_id = model_id
+        self.default_model = default_model or model_id
+        self.model_config_dict = model_config_dict
+        self.router = get_router()
+        self.backends = {}  # 线路名 -> 模型后端（不同角色用同一条线路时共享）
+        self.roles = {}     # 角色 -> 后端或 RoutedModelManager
+
+    def backend(self, route):
+        if route.name not in self.backends:
+            self.backends[route.name] = ModelFactory.create(
+                model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
+                model_type=route.model,
+                api_key=route.api_key,
+                url=route.base_url,
+                model_config_dict=dict(self.model_config_dict),
+                token_counter=CachedTokenCounter(OpenAITokenCounter(ModelType.GPT_4O_MINI)),  # 与默认计数器相同，加上缓存
+            )
+        return self.backends[route.name]
+
+    def for_role(self, role):
+        """角色的模型：只有一条线路时是普通后端，多条时是带故障切换的 RoutedModelManager"""
+        if role not in self.roles:
+            routes = self.router.routes((role,), self.default_model, self.model_id)
+            backends = [self.backend(route) for route in routes]
+            self.roles[role] = backends[0] if len(routes) == 1 else RoutedModelManager(self.router, routes, backends)
+        return self.roles[role]
+
+
+def create_model(model_id, model_config_dict, default_model=None, **overrides):
+    """创建按角色分配的模型（RoleModels）
+
+    model_id 为空时按路由表给每个角色选模型，没有配置的角色用 default_model。
+    overrides: 覆盖默认配置的参数（如 seed / temperature），值为 None 的项忽略
+    """
+    config = dict(model_config_dict)
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    return RoleModels(model_id, config, default_model)
+
+
+# ============ 记忆 ============
+class SummaryChatMemory(ChatHistoryMemory):
+    """完整保存对话历史，但发给模型的只有 系统提示词 + 之前对话的摘要 + token 预算内最近的消息（rolling_memory.py）
+
+    代替 message_window_size / token_limit 直接丢弃最早的消息。摘要在后台线程里提前生成；
+    后台没跟上时在取上下文时同步补做（会短暂阻塞事件循环）。
+    summarize(之前的摘要, 滑出窗口的消息, 结束位置) -> 新摘要
+    """
+
+    def __init__(self, context_creator, summarize, budget, storage=None, agent_id=None):
+        super().__init__(context_creator, storage=storage, agent_id=agent_id)
+        self.rolling = RollingMemory(summarize, budget)
+
+    @classmethod
+    def replace(cls, agent, summarize, budget):
+        """把 agent 现有的记忆换成滚动摘要记忆（沿用原来的存储，已有的消息不丢）"""
+        old = agent.memory
+        agent.memory = cls(old.get_context_creator(), summarize, budget,
+                           storage=old._chat_history_block.storage, agent_id=old.agent_id)
+        return agent.memory
+
+    def retrieve(self):
+        records = self._chat_history_block.retrieve()
+        if not records:
+            return records
+        records.sort(key=lambda record: record.timestamp)
+        self.rolling.pinned = 1 if records[0].memory_record.role_at_backend == OpenAIBackendRole.SYSTEM else 0
+        messages = [{"role": record.memory_record.role_at_backend.value, "content": record.memory_record.message.content}
+                    for record in records]
+        summary, start = self.rolling.plan(messages)
+        window = records[:self.rolling.pinned]
+        if summary:
+            window.append(ContextRecord(
+                memory_record=MemoryRecord(
+                    message=BaseMessage.make_user_message(role_name="Summary", content=f"{SUMMARY_HEADER}{summary}"),
+                    role_at_backend=OpenAIBackendRole.USER,
+                ),
+                score=1.0,
+                timestamp=records[start].timestamp - 1e-6,  # 排在窗口里第一条消息之前
+            ))
+        return window + records[start:]
+
+
+def with_persona(prompt, role, persona, default_role):
+    """把批量任务指定的补充人设追加到角色提示词末尾
+
+    persona 可以是字符串（作用于场景的 default_role），也可以是 {角色: 人设} 字典。
+    """
+    if isinstance(persona, str):
+        persona = {default_role: persona}
+    extra = (persona or {}).get(role)
+    if not extra:
+        return prompt
+    return prompt + f"\n补充人设: {extra}\n"
+
+
+# ============ 结束信号 ============
+# 可以结束对话的角色在输出格式末尾带一行 "对话状态: 继续 / 结束"，循环只根据这一行判断是否结束，
+# 不再在正文里找 "再见" / "感谢" 之类的字眼。
+END_FIELD = "对话状态"
+END_STATUS_LINE = re.compile(rf"^\s*{END_FIELD}\s*[:：]\s*(继续|结束)", re.M)
+
+
+def end_field(when):
+    """角色输出格式中的结束信号行；when 描述什么时候应该写 结束"""
+    return f"{END_FIELD}: <继续 或 结束；{when}时写 结束，否则写 继续>\n"
+
+
+def wants_to_end(content):
+    """角色是否发出了结束信号（以最后一个 对话状态 行为准）"""
+    matches = END_STATUS_LINE.findall(content or "")
+    return bool(matches) and matches[-1] == "结束"
+
+
+class TurnPolicy:
+    """场景的轮数策略：至少 min_turns 轮之后才接受结束信号，最多 max_turns 轮"""
+
+    def __init__(self, min_turns, max_turns):
+        self.min_turns = min_turns
+        self.max_turns = max_turns
+
+    def rounds(self):
+        return range(self.max_turns)
+
+    def should_end(self, round_num, msg):
+        """round_num 从 0 开始；msg 为本轮有权结束对话的角色的发言"""
+        return round_num + 1 >= self.min_turns and wants_to_end(msg.content)
+
+
+class CamelSession:
+    """一次对话会话：调用 agent 发言、打印输出、记录转录
+
+    每个会话持有自己的 agent（互不共享记忆），因此可以在同一个事件循环上并发运行多个会话。
+    verbose=False 时不打印任何内容，供批量生成使用。
+    checkpoint 不为空时每轮发言都会写入存档；存档中已有的发言直接回放进 agent 记忆，不再调用模型。
+    store 不为空时每轮发言都追加到转录库（TranscriptStore，可被多个会话共享）；回放的发言不重复写入。
+    use_blackboard() 之后每个 agent 发言前收到的是其他人上次以来的全部发言（blackboard.py），而不只是上一位的输出。
+    memory_budget 不为空时每个 agent 发给模型的历史不超过这么多 token，较早的对话在后台合并成摘要（SummaryChatMemory）。
+    options 为场景 run_session 的参数（如辩论赛制 format、面试小组 panel），随角色配置一起写入转录库。
+    """
+
+    def __init__(self, scenario, session_id=None, verbose=True, checkpoint=None, store=None, memory_budget=None,
+                 options=None):
+        self.scenario = scenario
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.verbose = verbose
+        self.checkpoint = checkpoint
+        self.store = store
+        self.owns_store = False
+        self.turns = Transcript()  # 发言记录（紧凑表示，turn["content"] 等按字典方式读取）
+        self.error = None
+        self.outcome = None  # ended（角色发出结束信号）/ max_turns（达到最大轮数）
+        self.model = None
+        self.config = {}  # 角色 -> 模型配置和记忆窗口，写入转录库供事后分析
+        self.blackboard = None
+        self.memory_budget = memory_budget
+        self.memories = {}  # 角色 -> SummaryChatMemory
+        self.options = dict(options or {})
+        if self.options:
+            self.config["options"] = self.options
+        self.started_at = time.time()
+        self.finished_at = None
+        if store:
+            store.start_session(self.session_id, scenario, started_at=self.started_at)
+
+    def echo(self, text=""):
+        """打印一行（仅在 verbose 模式下）"""
+        if self.verbose:
+            print(text)
+
+    def use_blackboard(self, names, token_budget=VIEW_TOKEN_BUDGET):
+        """多方对话：通过共享黑板把其他人的发言传给每个 agent；names 为角色 -> 显示名"""
+        self.blackboard = Blackboard(self.turns, names, token_budget)
+
+    def record(self, speaker, content, replayed=False, **extra):
+        """记录一条发言（包括开场白等非模型生成的内容），返回 Turn"""
+        turn = self.turns.append(speaker, content, **extra)
+        if self.store and not replayed:
+            self.store.add_turn(
+                self.session_id,
+                self.scenario,
+                speaker,
+                content,
+                turn_index=turn.index,
+                model=turn.get("model"),
+                prompt_tokens=turn.get("prompt_tokens"),
+                completion_tokens=turn.get("completion_tokens"),
+                latency=turn.get("latency"),
+                finish_reason=turn.get("finish_reason"),
+            )
+        return turn
+
+    def describe_agent(self, agent, speaker):
+        """记下角色使用的模型和记忆配置（每个角色只记一次）；设置了 memory_budget 时换上滚动摘要记忆"""
+        if speaker in self.config:
+            return
+        backend = agent.model_backend
+        self.model = self.model or str(backend.model_type)
+        LedgerContextCreator.install(agent)
+        if self.memory_budget:
+            model = str(backend.model_type)
+            self.memories[speaker] = SummaryChatMemory.replace(
+                agent, lambda summary, chunk, end: self._summarize(speaker, model, summary, chunk, end), self.memory_budget)
+        self.config[speaker] = {
+            "model": str(backend.model_type),
+            "model_config": backend.model_config_dict,
+            "message_window_size": getattr(agent.memory, "window_size", getattr(agent.memory, "_window_size", None)),
+            "token_limit": getattr(agent.memory.get_context_creator(), "token_limit", None),
+            "blackboard_tokens": self.blackboard.token_budget if self.blackboard else None,
+            "memory_budget": self.memory_budget,
+        }
+
+    def _summarize(self, speaker, model, summary, messages, end):
+        """把滑出窗口的消息合并进摘要（在后台线程中调用，按路由表选线路；结果写入存档，恢复 / 分叉时直接回放）"""
+        key = f"摘要:{speaker}:{end}"
+        recorded = self.checkpoint.replay(key) if self.checkpoint else None
+        if recorded is not None:
+            return recorded["content"]
+        response, _ = get_router().complete(
+            ("摘要", speaker),
+            model,
+            messages=summary_request(summary, messages),
+            temperature=0.2,
+            max_tokens=self.memories[speaker].rolling.summary_budget,
+        )
+        content = response.choices[0].message.content
+        if not content:
+            raise RuntimeError("模型返回了空摘要")
+        if self.checkpoint:
+            self.checkpoint.save(key, {"content": content, "model": response.model or model})
+        return content
+
+    async def speak(self, agent, input_msg, speaker, label):
+        """让 agent 回应 input_msg（异步 astep），打印并记录这一轮发言
+
+        使用黑板时 agent 收到的是黑板上它还没读过的发言，input_msg 只在没有未读内容时使用。
+        """
+        return (await self.speak_together([(agent, input_msg, speaker, label)]))[0]
+
+    async def speak_together(self, speakers):
+        """几个 agent 同时回应（asyncio.gather），返回各自的发言
+
+        speakers: [(agent, input_msg, speaker, label)]。所有人看到的是同一时刻的黑板，存档 key 在发言前确定，
+        发言按给出的顺序（而不是完成的顺序）记录，所以恢复时与原来的会话完全一致。
+        模型开启了流式输出（stream）且只有一人发言时边生成边打印；多人同时发言时生成完再按顺序打印。
+        """
+        base = len(self.turns)
+        live = self.verbose and len(speakers) == 1
+        calls = []
+        for agent, input_msg, speaker, label in speakers:
+            self.describe_agent(agent, speaker)
+            if self.blackboard:
+                view = self.blackboard.read(speaker)
+                if view:
+                    input_msg = BaseMessage.make_user_message(role_name="Blackboard", content=view)
+            calls.append(self._respond(agent, input_msg, speaker, f"{base}:{speaker}", label if live else None))
+        results = await asyncio.gather(*calls)
+
+        messages = []
+        for (_, _, speaker, label), (key, msg, fields, replayed, printed) in zip(speakers, results):
+            turn = self.record(speaker, msg.content, replayed=replayed, **fields)
+            if self.checkpoint and not replayed:
+                self.checkpoint.save(key, {k: v for k, v in turn.items() if k not in ("index", "speaker")})
+            if not printed:
+                self.echo(f"{label}{'（存档）' if replayed else ''}:\n{msg.content}\n")
+            if turn.get("ttft") is not None and not replayed:
+                rate = f"，{turn['tokens_per_second']:.1f} tokens/s" if turn.get("tokens_per_second") else ""
+                self.echo(f"   [首 token {turn['ttft']:.2f}s{rate}]")
+            messages.append(msg)
+        return messages
+
+    async def _respond(self, agent, input_msg, speaker, key, label=None):
+        """调用模型（或从存档回放）得到一轮发言，不记录
+
+        label 不为空且模型流式输出时边生成边打印。返回 (key, 发言, 转录字段, 是否回放, 是否已打印)。
+        """
+        recorded = self.checkpoint.replay(key) if self.checkpoint else None
+        if recorded is not None:
+            return key, self._replay(agent, input_msg, recorded), {k: v for k, v in recorded.items() if k != "content"}, True, False
+
+        start = time.perf_counter()
+        response = await agent.astep(input_msg)
+        ttft = None
+        streamed = isinstance(response, AsyncStreamingChatAgentResponse)
+        if streamed:
+            response, ttft = await self._stream(response, start, label)
+        latency = time.perf_counter() - start
+
+        msg = response.msgs[0]
+        usage = response.info.get("usage") or {}
+        finish_reasons = response.info.get("termination_reasons") or [None]
+        fields = {
+            "model": self.config[speaker]["model"],
+            "prompt_tokens": usage.get("prompt_tokens") or None,
+            "completion_tokens": usage.get("completion_tokens") or None,
+            "latency": round(latency, 3),
+            "finish_reason": finish_reasons[0],
+        }
+        if streamed:
+            # 流式输出多数接口不返回 usage，吞吐量用本地计数的输出 token 估算
+            completion = fields["completion_tokens"] or count_tokens(msg.content)
+            generating = latency - ttft if ttft is not None else 0
+            fields["ttft"] = round(ttft, 3) if ttft is not None else None
+            fields["tokens_per_second"] = round(completion / generating, 1) if generating > 0 else None
+        return key, msg, fields, False, bool(label and streamed)
+
+    async def _stream(self, response, start, label=None):
+        """消费流式回复（agent 在流结束时把完整发言写入记忆，与非流式一致）
+
+        label 不为空时边生成边打印。返回 (最终回复, 首 token 耗时)。
+        """
+        ttft, printed, final = None, 0, None
+        if label:
+            print(f"{label}:")
+        async for partial in response:
+            final = partial
+            content = partial.msgs[0].content if partial.msgs else ""
+            if content and ttft is None:
+                ttft = time.perf_counter() - start
+            if label and len(content) > printed:
+                print(content[printed:], end="", flush=True)
+                printed = len(content)
+        if label:
+            print("\n")
+        return final or await response, ttft
+
+    def _replay(self, agent, input_msg, recorded):
+        """把存档中的一轮发言写回 agent 记忆（与 astep 写入的内容一致），不调用模型"""
+        msg = BaseMessage(
+            role_name=agent.role_name,
+            role_type=agent.role_type,
+            meta_dict={},
+            content=recorded["content"],
+        )
+        agent.update_memory(input_msg, OpenAIBackendRole.USER)
+        agent.update_memory(msg, OpenAIBackendRole.ASSISTANT)
+        return msg
+
+    @classmethod
+    def from_args(cls, scenario, args, options=None, defaults=None):
+        """根据命令行参数创建交互模式的会话（默认开启存档）
+
+        options 为命令行指定的 run_session 参数（值为 None 表示没有指定），defaults 为没有指定时的默认值；
+        运行时用 session.options。赛制等参数决定存档 key 的布局，所以和 memory_budget 一起写入存档元信息：
+        恢复时没有指定的沿用存档记录的值，指定了与存档不同的值时报错（否则会错过所有记录、悄悄重新调用模型）。
+        """
+        requested = {k: v for k, v in (options or {}).items() if v is not None}
+        options = {**(defaults or {}), **requested}
+        memory_budget = args.memory_budget
+        checkpoint = None
+        if not args.no_checkpoint:
+            path = args.checkpoint or default_checkpoint_path(scenario)
+            stored = (read_checkpoint_meta(path) or {}) if args.resume else {}
+            if "options" in stored:
+                options = {**stored["options"], **requested}
+            if memory_budget is None:
+                memory_budget = stored.get("memory_budget")
+            meta = {"scenario": scenario, "options": options, "memory_budget": memory_budget}
+            if not stored:
+                meta["stream"] = args.stream  # 只是输出方式，恢复时可以不同；分叉时沿用
+            checkpoint = SessionCheckpoint(path, meta=meta, resume=args.resume)
+            if args.resume:
+                print(f"♻️ 从存档恢复: {path}（已完成 {checkpoint.resumed_turns} 轮发言）")
+        session = cls(scenario, checkpoint=checkpoint, store=None if args.no_store else TranscriptStore(args.store),
+                      memory_budget=memory_budget, options=options)
+        session.owns_store = session.store is not None
+        return session
+
+    def fail(self, e):
+        """记录会话中的异常"""
+        self.error = f"{type(e).__name__}: {e}"
+        if self.verbose:
+            print(f"\n❌ 错误: {self.error}")
+            traceback.print_exc()
+
+    def finish(self):
+        self.finished_at = time.time()
+        if self.checkpoint:
+            self.checkpoint.close()
+        if self.store:
+            self.store.finish_session(
+                self.session_id,
+                self.scenario,
+                "error" if self.error else "completed",
+                outcome=self.outcome,
+                error=self.error,
+                model=self.model,
+                config=self.config,
+            )
+            if self.owns_store:
+                self.store.close()
+        return self
+
+    def to_record(self):
+        """转换为可写入 JSONL 的会话记录"""
+        return {
+            "scenario": self.scenario,
+            "session_id": self.session_id,
+            "status": "error" if self.error else "completed",
+            "outcome": self.outcome,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "turns": self.turns.to_list(),
+        }
+
+
+def parse_cli_args(description, extra=None):
+    """场景脚本的通用命令行参数；extra(parser) 可以添加场景自己的参数"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--resume", action="store_true", help="从存档的最后一轮继续，不重新调用已完成的轮次")
+    parser.add_argument("--checkpoint", default=None, help="存档文件路径（默认 checkpoints/<场景>.jsonl）")
+    parser.add_argument("--no-checkpoint", action="store_true", help="不写存档")
+    parser.add_argument("--store", default=DEFAULT_DB, help=f"转录库路径（默认 {DEFAULT_DB}）")
+    parser.add_argument("--no-store", action="store_true", help="不写转录库")
+    parser.add_argument("--stream", action="store_true", help="流式输出：边生成边打印每个角色的发言")
+    parser.add_argument("--memory-budget", type=int, default=None,
+                        help="每个角色发给模型的历史最多多少 token，较早的对话在后台合并成摘要（默认按 message_window_size 截断）")
+    if extra:
+        extra(parser)
+    return parser.parse_args()
@@ -0,0 +1,166 @@
+# 会话存档：每完成一次模型调用 / 人类输入就追加一行，崩溃或中断后可以从最后一轮继续
+#
+# 存档是 JSONL：
+#   第一行 {"type": "meta", ...}        会话元信息（场景、题目等）
+#   之后   {"type": "turn", "key": ..., "value": ...}  按 key 记录的模型输出或人类输入
+#
+# 只记录"不可重现"的输入（模型输出、人类输入），对话历史（player_history / host_history /
+# conversation_log / ChatAgent 记忆）都由它们确定性地推导出来，所以存档很小、且是增量写入。
+# 恢复时重新执行对话流程，凡是存档里有的 key 直接取回记录的结果，不再调用模型。
+#
+# 分支存档：meta 中带 {"parent": 父存档路径, "fork_at": N} 时，表示沿用父存档的前 N 条记录，
+# 本文件只保存分叉之后的新记录，共同前缀只在父存档里存一份。
+import json
+import os
+import threading
+
+
+class SessionCheckpoint:
+    """追加写入的会话存档"""
+
+    def __init__(self, path, meta=None, resume=False):
+        self.path = path
+        self.meta = dict(meta or {})
+        self.records = {}
+        self._replayed = set()
+        self._lock = threading.Lock()  # 同一会话可能有多个线程同时调用模型（如海龟汤的并行起草）
+
+        if resume and os.path.exists(path):
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"type": "meta", **self.meta}, ensure_ascii=False) + "\n")
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        truncate_partial_line(self.path)  # 之后以追加方式续写，半行残留会和下一条记录粘在同一行
+        if os.path.getsize(self.path) == 0:  # 连 meta 行都没写完整
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"type": "meta", **self.meta}, ensure_ascii=False) + "\n")
+        stored, records = read_checkpoint(self.path)
+        for k, v in self.meta.items():
+            if k in stored and stored[k] != v:
+                raise ValueError(f"存档 {self.path} 的 {k}={stored[k]!r} 与当前会话 {v!r} 不一致")
+        self.meta = {**stored, **self.meta}
+        self.records = dict(records)
+
+    @property
+    def resumed_turns(self):
+        """存档中已完成的记录数"""
+        return len(self.records)
+
+    @property
+    def replaying(self):
+        """是否还有尚未回放的存档记录"""
+        return len(self._replayed) < len(self.records)
+
+    def replay(self, key):
+        """取回 key 对应的记录；没有记录时返回 None"""
+        if key not in self.records:
+            return None
+        self._replayed.add(key)
+        return self.records[key]
+
+    def save(self, key, value):
+        """追加一条记录并立即落盘"""
+        line = json.dumps({"type": "turn", "key": key, "value": value}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.records[key] = value
+            self._replayed.add(key)
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def default_checkpoint_path(scenario):
+    return os.path.join("checkpoints", f"{scenario}.jsonl")
+
+
+def truncate_partial_line(path):
+    """截掉文件末尾没有换行结尾的半行（崩溃时只写了一半的记录），返回截掉的字节数"""
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return 0
+        # 从末尾往前找最后一个换行
+        end = size
+        while end > 0:
+            start = max(end - 65536, 0)
+            f.seek(start)
+            chunk = f.read(end - start)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                keep = start + newline + 1
+                break
+            end = start
+        else:
+            keep = 0
+        f.truncate(keep)
+    print(f"⚠️ 存档 {path} 末尾有 {size - keep} 字节不完整的记录，已截掉")
+    return size - keep
+
+
+def read_checkpoint(path):
+    """读取存档，返回 (meta, [(key, value), ...])；分支存档会先接上父存档的前缀"""
+    meta, records = {}, []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # 只跳过这一行（通常是崩溃时写了一半的最后一行），后面的记录照常读取
+                print(f"⚠️ 存档 {path} 第 {line_no} 行无法解析，已跳过")
+                continue
+            if entry.get("type") == "meta":
+                meta = {k: v for k, v in entry.items() if k != "type"}
+            elif entry.get("type") == "turn":
+                records.append((entry["key"], entry["value"]))
+
+    if meta.get("parent"):
+        _, parent_records = read_checkpoint(meta["parent"])
+        if meta["fork_at"] > len(parent_records):
+            raise ValueError(f"父存档 {meta['parent']} 只有 {len(parent_records)} 条记录，无法在第 {meta['fork_at']} 条处分叉")
+        records = parent_records[:meta["fork_at"]] + records
+    return meta, records
+
+
+def fork_checkpoint(parent_path, child_path, fork_at, branch=None, options=None):
+    """在父存档的第 fork_at 条记录处分叉出一个新存档，返回可直接继续运行的 SessionCheckpoint
+
+    branch: 本分支的配置（如 seed / temperature / model），写入 meta 便于事后对比
+    options: 本分支实际使用的会话参数（父会话的参数加上 branch 的覆盖），替换父存档 meta 中的 options，
+             这样从分支再分叉时沿用的是分支自己的配置
+    """
+    parent_meta, parent_records = read_checkpoint(parent_path)
+    if not 0 <= fork_at <= len(parent_records):
+        raise ValueError(f"分叉位置 {fork_at} 超出范围（父存档共 {len(parent_records)} 条记录）")
+
+    meta = {k: v for k, v in parent_meta.items() if k not in ("parent", "fork_at", "branch")}
+    meta.update(parent=os.path.abspath(parent_path), fork_at=fork_at, branch=branch or {})
+    if options is not None:
+        meta["options"] = options
+    os.makedirs(os.path.dirname(os.path.abspath(child_path)), exist_ok=True)
+    with open(child_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "meta", **meta}, ensure_ascii=False) + "\n")
+    return SessionCheckpoint(child_path, resume=True)
+
+
+def read_checkpoint_meta(path):
+    """只读取存档的元信息（例如上次的题目）；存档不存在时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        try:
+            entry = json.loads(f.readline())
+        except json.JSONDecodeError:
+            return None
+    if entry.get("type") != "meta":
+        return None
+    return {k: v for k, v in entry.items() if k != "type"}
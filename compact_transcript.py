@@ -0,0 +1,187 @@
+# 紧凑的对话记录：进程内批量运行成千上万局时，每局占用的内存更小
+#
+# 原来一条发言要在好几个地方各存一份：conversation_log 里的 f"【名字】内容" 字符串、玩家自己 history 里的
+# {"role", "content"} 字典、camel 会话 turns 里的字典；玩家每轮的提示词又把最近 15 条对话整段拼进去再存一遍。
+# 这里：
+#   - 一局的所有文本都追加到同一个文本缓冲（bytearray）里，记录本身只保存位置（__slots__ 对象，没有 __dict__）；
+#     纯 ASCII 的文本按 1 字节 / 字符存，其他按 UTF-16 存（中文 2 字节 / 字，与 str 内部表示相当，但没有对象头）
+#   - 角色 / 发言人的名字驻留成小整数（进程内共享一张表）
+#   - 同一条发言在对话记录和 agent 历史里只存一份（History.append_turn）；
+#     玩家每轮的提示词不保存，只记下当时对话记录的长度，需要时重新生成（History.append_rendered）
+#
+# 发给模型时才转换成 OpenAI 消息（History.messages()），用完即释放。Turn 支持 turn["content"] / turn.get()
+# 这样的读取方式，原来按字典读取发言的代码（黑板、存档、导出）不需要修改。
+import threading
+
+_names = []   # 驻留的名字（角色、发言人），下标即 id
+_name_ids = {}
+_names_lock = threading.Lock()
+
+
+def intern_name(name):
+    """名字 -> 小整数 id（同一个名字在整个进程里只存一份）"""
+    try:
+        return _name_ids[name]
+    except KeyError:
+        with _names_lock:
+            if name not in _name_ids:
+                _name_ids[name] = len(_names)
+                _names.append(name)
+            return _name_ids[name]
+
+
+def name_of(name_id):
+    return _names[name_id]
+
+
+SYSTEM, USER, ASSISTANT = intern_name("system"), intern_name("user"), intern_name("assistant")
+
+
+class Turn:
+    """对话记录里的一条发言（文本在所属 Transcript 的缓冲里）"""
+
+    __slots__ = ("transcript", "index", "speaker_id", "start", "end", "wide", "meta")
+
+    def __init__(self, transcript, index, speaker_id, start, end, wide, meta):
+        self.transcript = transcript
+        self.index = index
+        self.speaker_id = speaker_id
+        self.start = start
+        self.end = end
+        self.wide = wide
+        self.meta = meta  # 其他字段（模型、token、耗时等），没有时为 None
+
+    @property
+    def speaker(self):
+        return _names[self.speaker_id]
+
+    @property
+    def content(self):
+        return self.transcript.read(self.start, self.end, self.wide)
+
+    def __getitem__(self, key):
+        if key == "index":
+            return self.index
+        if key == "speaker":
+            return self.speaker
+        if key == "content":
+            return self.content
+        if self.meta and key in self.meta:
+            return self.meta[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return self.to_dict().items()
+
+    def to_dict(self):
+        turn = {"index": self.index, "speaker": self.speaker, "content": self.content}
+        turn.update(self.meta or {})
+        return turn
+
+    def __repr__(self):
+        return f"Turn({self.index}, {self.speaker!r}, {self.end - self.start} bytes)"
+
+
+class Transcript:
+    """一局的对话记录和文本缓冲（这一局所有 agent 的 History 共用同一个缓冲）"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.turns = []
+        self.lock = threading.Lock()
+
+    # ============ 文本缓冲 ============
+    def store(self, text):
+        """把一段文本追加到缓冲，返回 (start, end, wide)"""
+        wide = not text.isascii()
+        data = text.encode("utf-16-le" if wide else "ascii")
+        with self.lock:
+            start = len(self.buffer)
+            self.buffer += data
+        return start, start + len(data), wide
+
+    def read(self, start, end, wide):
+        return self.buffer[start:end].decode("utf-16-le" if wide else "ascii")
+
+    # ============ 发言 ============
+    def append(self, speaker, content, **meta):
+        """记录一条发言，返回 Turn"""
+        start, end, wide = self.store(content or "")
+        turn = Turn(self, len(self.turns), intern_name(speaker), start, end, wide, meta or None)
+        self.turns.append(turn)
+        return turn
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __getitem__(self, index):
+        return self.turns[index]
+
+    def __iter__(self):
+        return iter(self.turns)
+
+    def lines(self, start=0, end=None):
+        """对话记录的文本行 "【发言人】内容"（与原来的 conversation_log 相同；按切片规则取 turns[start:end]）"""
+        return [f"【{turn.speaker}】{turn.content}" for turn in self.turns[start:end]]
+
+    def to_list(self):
+        """转换为字典列表（写入 JSONL / 转录记录）"""
+        return [turn.to_dict() for turn in self.turns]
+
+
+class Message:
+    """agent 历史里的一条消息：引用文本缓冲里的一段；start 为 -1 时是按需生成的提示词，end 为当时的对话记录长度"""
+
+    __slots__ = ("role", "start", "end", "wide")
+
+    def __init__(self, role, start, end, wide):
+        self.role = role
+        self.start = start
+        self.end = end
+        self.wide = wide
+
+
+class History:
+    """一个 agent 的对话历史（发给模型的消息）
+
+    system: 系统提示词（通常是模块里的常量或每道题一份，直接引用、不复制进缓冲）
+    render: render(对话记录长度) -> 提示词，用于 append_rendered 记下的消息
+    """
+
+    def __init__(self, transcript, system=None, render=None):
+        self.transcript = transcript
+        self.system = system
+        self.render = render
+        self.items = []
+
+    def append(self, role, content):
+        """追加一条新文本（如主持人收到的问题、主持人的原始判定）"""
+        start, end, wide = self.transcript.store(content or "")
+        self.items.append(Message(intern_name(role), start, end, wide))
+
+    def append_turn(self, role, turn):
+        """追加对话记录里已有的一条发言（不再复制文本）"""
+        self.items.append(Message(intern_name(role), turn.start, turn.end, turn.wide))
+
+    def append_rendered(self, role, position):
+        """追加一条按需生成的消息：只记下当时对话记录的长度，转换时用 render(position) 生成内容"""
+        self.items.append(Message(intern_name(role), -1, position, False))
+
+    def message(self, item):
+        if item.start < 0:
+            return {"role": _names[item.role], "content": self.render(item.end)}
+        return {"role": _names[item.role], "content": self.transcript.read(item.start, item.end, item.wide)}
+
+    def messages(self):
+        """OpenAI 格式的消息列表（每次调用都重新生成，调用方用完即可释放）"""
+        head = [{"role": "system", "content": self.system}] if self.system is not None else []
+        return head + [self.message(item) for item in self.items]
+
+    def __len__(self):
+        return len(self.items) + (self.system is not None)
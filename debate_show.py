@@ -1,203 +1,269 @@
 # 三人对话：辩论赛
 import os
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType
+import asyncio
 from camel.agents import ChatAgent
 from camel.messages import BaseMessage
 
 from dotenv import load_dotenv
 load_dotenv()  # 自动加载 .env 文件
 
+from camel_session import CamelSession, create_model as create_camel_model, parse_cli_args, with_persona
+
 
-BASE_URL = os.getenv("QDD_BASE_URL")
-API_KEY  = os.getenv("QDD_API_KEY")
 MODEL_ID = os.getenv("QDD_MODEL",    "deepseek-ai/DeepSeek-R1-Distill-Llama-70B")
+SCENARIO = "debate"
+PERSONA_ROLE = "pro"  # 批量任务中字符串形式的 persona 作用的角色
 
-# 🔧 修复：确保 BASE_URL 以 /v1 结尾（OpenAI 兼容接口需要）
-if BASE_URL and not BASE_URL.endswith('/v1'):
-    BASE_URL = BASE_URL.rstrip('/') + '/v1'
 
-model = ModelFactory.create(
-    model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-    model_type=MODEL_ID,
-    api_key=API_KEY,
-    url=BASE_URL,
-    model_config_dict={
+def create_model(model_id=None, seed=None, temperature=None, stream=False):
+    """model_id 为空时按路由表（model_routes.json）给每个角色选模型，没有配置的角色用 MODEL_ID；stream=True 时流式输出"""
+    config = {
         "temperature": 0.8,  # 辩论需要较高创意
         "max_tokens": 1500,
-    },
-)
-
-# ==== 创建主持人 Agent ====
-moderator_system_message = BaseMessage.make_assistant_message(
-    role_name="Moderator",
-    content=(
-        "你是辩论赛的主持人。你的职责：\n"
-        "1. 保持中立，不偏袒任何一方\n"
-        "2. 控制辩论节奏和时间\n"
-        "3. 引导双方围绕核心问题展开辩论\n"
-        "4. 适时总结双方观点\n"
-        "5. 提出关键问题让双方深入讨论\n"
-        "6. 维持辩论秩序和礼仪\n\n"
-        "请严格使用以下格式输出：\n"
-        "[MODERATOR]\n"
-        "主持内容: <串场、提问、规则说明>\n"
-        "观点总结: <总结双方已提出的观点>\n"
-        "下一环节: <引导下一步>\n"
+    }
+    return create_camel_model(model_id, config, default_model=MODEL_ID, seed=seed, temperature=temperature,
+                              stream=stream or None)
+
+
+def create_agents(model, persona=None):
+    """创建一组新的 agent（每个会话独立一份，记忆互不干扰）
+
+    persona: 批量任务给出的补充人设，字符串或 {角色: 人设} 字典
+    """
+    # ==== 创建主持人 Agent ====
+    moderator_system_message = BaseMessage.make_assistant_message(
+        role_name="Moderator",
+        content=with_persona((
+            "你是辩论赛的主持人。你的职责：\n"
+            "1. 保持中立，不偏袒任何一方\n"
+            "2. 控制辩论节奏和时间\n"
+            "3. 引导双方围绕核心问题展开辩论\n"
+            "4. 适时总结双方观点\n"
+            "5. 提出关键问题让双方深入讨论\n"
+            "6. 维持辩论秩序和礼仪\n\n"
+            "请严格使用以下格式输出：\n"
+            "[MODERATOR]\n"
+            "主持内容: <串场、提问、规则说明>\n"
+            "观点总结: <总结双方已提出的观点>\n"
+            "下一环节: <引导下一步>\n"
+        ), "moderator", persona, PERSONA_ROLE)
+    )
+
+    moderator_agent = ChatAgent(
+        system_message=moderator_system_message,
+        model=model.for_role("moderator"),
+        message_window_size=30,
+        token_limit=10240,
+    )
+
+    # ==== 创建正方辩手 Agent ====
+    pro_system_message = BaseMessage.make_assistant_message(
+        role_name="Pro Side",
+        content=with_persona((
+            "你是辩论赛正方辩手，立场：【人工智能的发展利大于弊】\n\n"
+            "你的特点：\n"
+            "1. 论点清晰，逻辑严密\n"
+            "2. 用数据、案例、理论支持观点\n"
+            "3. 积极驳斥反方论点，找出其逻辑漏洞\n"
+            "4. 强调AI在医疗、教育、科研等领域的贡献\n"
+            "5. 论述AI提高效率、解放人类创造力\n"
+            "6. 保持礼貌但态度坚定\n\n"
+            "请严格使用以下格式输出：\n"
+            "[PRO]\n"
+            "立论/驳论: <陈述观点或反驳对方>\n"
+            "论据支撑: <数据、案例、理论>\n"
+            "小结: <强化本方立场>\n"
+        ), "pro", persona, PERSONA_ROLE)
     )
-)
-
-moderator_agent = ChatAgent(
-    system_message=moderator_system_message,
-    model=model,
-    message_window_size=30,
-    token_limit=10240,
-)
-
-# ==== 创建正方辩手 Agent ====
-pro_system_message = BaseMessage.make_assistant_message(
-    role_name="Pro Side",
-    content=(
-        "你是辩论赛正方辩手，立场：【人工智能的发展利大于弊】\n\n"
-        "你的特点：\n"
-        "1. 论点清晰，逻辑严密\n"
-        "2. 用数据、案例、理论支持观点\n"
-        "3. 积极驳斥反方论点，找出其逻辑漏洞\n"
-        "4. 强调AI在医疗、教育、科研等领域的贡献\n"
-        "5. 论述AI提高效率、解放人类创造力\n"
-        "6. 保持礼貌但态度坚定\n\n"
-        "请严格使用以下格式输出：\n"
-        "[PRO]\n"
-        "立论/驳论: <陈述观点或反驳对方>\n"
-        "论据支撑: <数据、案例、理论>\n"
-        "小结: <强化本方立场>\n"
+
+    pro_agent = ChatAgent(
+        system_message=pro_system_message,
+        model=model.for_role("pro"),
+        message_window_size=30,
+        token_limit=10240,
+    )
+
+    # ==== 创建反方辩手 Agent ====
+    con_system_message = BaseMessage.make_assistant_message(
+        role_name="Con Side",
+        content=with_persona((
+            "你是辩论赛反方辩手，立场：【人工智能的发展弊大于利】\n\n"
+            "你的特点：\n"
+            "1. 论点犀利，能抓住关键问题\n"
+            "2. 用反例、风险、道德困境质疑AI\n"
+            "3. 反驳正方论据，指出其片面性\n"
+            "4. 强调AI带来的失业、隐私、伦理风险\n"
+            "5. 论述人类对AI失控的担忧\n"
+            "6. 保持理性但立场鲜明\n\n"
+            "请严格使用以下格式输出：\n"
+            "[CON]\n"
+            "立论/驳论: <陈述观点或反驳对方>\n"
+            "论据支撑: <反例、风险分析、逻辑推理>\n"
+            "小结: <强化本方立场>\n"
+        ), "con", persona, PERSONA_ROLE)
     )
-)
-
-pro_agent = ChatAgent(
-    system_message=pro_system_message,
-    model=model,
-    message_window_size=30,
-    token_limit=10240,
-)
-
-# ==== 创建反方辩手 Agent ====
-con_system_message = BaseMessage.make_assistant_message(
-    role_name="Con Side",
-    content=(
-        "你是辩论赛反方辩手，立场：【人工智能的发展弊大于利】\n\n"
-        "你的特点：\n"
-        "1. 论点犀利，能抓住关键问题\n"
-        "2. 用反例、风险、道德困境质疑AI\n"
-        "3. 反驳正方论据，指出其片面性\n"
-        "4. 强调AI带来的失业、隐私、伦理风险\n"
-        "5. 论述人类对AI失控的担忧\n"
-        "6. 保持理性但立场鲜明\n\n"
-        "请严格使用以下格式输出：\n"
-        "[CON]\n"
-        "立论/驳论: <陈述观点或反驳对方>\n"
-        "论据支撑: <反例、风险分析、逻辑推理>\n"
-        "小结: <强化本方立场>\n"
+
+    con_agent = ChatAgent(
+        system_message=con_system_message,
+        model=model.for_role("con"),
+        message_window_size=30,
+        token_limit=10240,
     )
-)
-
-con_agent = ChatAgent(
-    system_message=con_system_message,
-    model=model,
-    message_window_size=30,
-    token_limit=10240,
-)
-
-# ==== 开始辩论赛 ====
-print("="*70)
-print("🎓 辩论赛：人工智能的发展是利大于弊还是弊大于利？")
-print("="*70)
-print("正方观点：人工智能的发展利大于弊")
-print("反方观点：人工智能的发展弊大于利")
-print("主持人：保持中立，引导辩论")
-print("="*70)
-
-# 主持人开场
-current_msg = BaseMessage.make_assistant_message(
-    role_name="Moderator",
-    content=(
-        "[MODERATOR]\n"
-        "主持内容: 各位观众，欢迎来到本场辩论赛！\n"
-        "今天的辩题是：人工智能的发展是利大于弊还是弊大于利？\n"
-        "正方认为利大于弊，反方认为弊大于利。\n"
-        "辩论分为：开篇立论、攻辩、自由辩论、总结陈词四个环节。\n"
-        "首先请正方进行开篇立论，时间3分钟。\n"
-        "观点总结: 辩论尚未开始\n"
-        "下一环节: 正方开篇立论"
+
+    return {"moderator": moderator_agent, "pro": pro_agent, "con": con_agent}
+
+
+# 辩论流程设计：每个环节为 (环节名, 发言角色, 依赖的环节)
+# 没有依赖的环节回应主持人的开场；依赖多个环节时输入为最后一个依赖环节的发言（使用黑板时还能看到其他未读发言）。
+# 相邻且互不依赖的环节会同时进行（schedule_stages），输出仍按这里的顺序显示和记录。
+DEBATE_FORMATS = {
+    # 原来的赛制：每个环节回应上一个环节，完全串行
+    "classic": [
+        ("正方立论", "pro", ()),
+        ("反方立论", "con", ("正方立论",)),
+        ("主持人提问", "moderator", ("反方立论",)),
+        ("正方回应", "pro", ("主持人提问",)),
+        ("反方反驳", "con", ("正方回应",)),
+        ("主持人引导", "moderator", ("反方反驳",)),
+        ("正方深入论述", "pro", ("主持人引导",)),
+        ("反方深入论述", "con", ("正方深入论述",)),
+        ("主持人总结", "moderator", ("反方深入论述",)),
+    ],
+    # 双方各自立论、各自深入论述（同时进行），主持人在双方都发言后提问和总结
+    "standard": [
+        ("正方立论", "pro", ()),
+        ("反方立论", "con", ()),
+        ("主持人提问", "moderator", ("正方立论", "反方立论")),
+        ("正方回应", "pro", ("主持人提问",)),
+        ("反方反驳", "con", ("正方回应",)),
+        ("主持人引导", "moderator", ("反方反驳",)),
+        ("正方深入论述", "pro", ("主持人引导",)),
+        ("反方深入论述", "con", ("主持人引导",)),
+        ("主持人总结", "moderator", ("正方深入论述", "反方深入论述")),
+    ],
+}
+DEFAULT_FORMAT = "classic"
+
+
+def schedule_stages(stages):
+    """把环节按顺序分批：一批内的环节互不依赖、发言角色也不重复，可以同时进行
+
+    依赖必须是排在前面的环节（保证没有环路）；不满足时抛出 ValueError。
+    """
+    done, waves = set(), []
+    for name, speaker, inputs in stages:
+        missing = [i for i in inputs if i not in done]
+        if missing or name in done:
+            raise ValueError(f"环节 {name!r} 重名或依赖了排在它后面 / 不存在的环节 {missing}")
+        wave = waves[-1] if waves else None
+        if wave is None or any(i in {s[0] for s in wave} for i in inputs) or speaker in {s[1] for s in wave}:
+            wave = []
+            waves.append(wave)
+        wave.append((name, speaker, inputs))
+        done.add(name)
+    return waves
+
+# 黑板上显示的角色名
+SPEAKER_NAMES = {
+    "moderator": "主持人",
+    "pro": "正方辩手",
+    "con": "反方辩手",
+}
+
+# 各角色的显示标签
+SPEAKER_LABELS = {
+    "pro": "\n✅ 正方辩手",
+    "con": "❌ 反方辩手",
+    "moderator": "⚖️ 主持人",
+}
+
+
+async def run_session(session=None, agents=None, format=DEFAULT_FORMAT):
+    """完整跑一场辩论赛，返回会话记录
+
+    format: 赛制（DEBATE_FORMATS 中的名字），决定环节和它们之间的依赖
+    """
+    stages = DEBATE_FORMATS[format]
+    waves = schedule_stages(stages)
+    session = session or CamelSession(SCENARIO, options={"format": format})
+    agents = agents or create_agents(create_model())
+    session.use_blackboard(SPEAKER_NAMES)  # 每个角色都能看到另外两人的发言
+    echo = session.echo
+
+    # ==== 开始辩论赛 ====
+    echo("="*70)
+    echo("🎓 辩论赛：人工智能的发展是利大于弊还是弊大于利？")
+    echo("="*70)
+    echo("正方观点：人工智能的发展利大于弊")
+    echo("反方观点：人工智能的发展弊大于利")
+    echo("主持人：保持中立，引导辩论")
+    echo("="*70)
+
+    # 主持人开场
+    current_msg = BaseMessage.make_assistant_message(
+        role_name="Moderator",
+        content=(
+            "[MODERATOR]\n"
+            "主持内容: 各位观众，欢迎来到本场辩论赛！\n"
+            "今天的辩题是：人工智能的发展是利大于弊还是弊大于利？\n"
+            "正方认为利大于弊，反方认为弊大于利。\n"
+            "辩论分为：开篇立论、攻辩、自由辩论、总结陈词四个环节。\n"
+            "首先请正方进行开篇立论，时间3分钟。\n"
+            "观点总结: 辩论尚未开始\n"
+            "下一环节: 正方开篇立论"
+        )
     )
-)
-
-print(f"\n{'='*70}")
-print("【开场】")
-print(f"{'='*70}")
-print(f"⚖️ 主持人:\n{current_msg.content}\n")
-
-# 辩论流程设计
-debate_stages = [
-    ("正方立论", "pro"),
-    ("反方立论", "con"),
-    ("主持人提问", "moderator"),
-    ("正方回应", "pro"),
-    ("反方反驳", "con"),
-    ("主持人引导", "moderator"),
-    ("正方深入论述", "pro"),
-    ("反方深入论述", "con"),
-    ("主持人总结", "moderator"),
-]
-
-for stage_num, (stage_name, speaker) in enumerate(debate_stages):
-    try:
-        print(f"\n{'='*70}")
-        print(f"【{stage_name}】 - 第 {stage_num + 1} 环节")
-        print(f"{'='*70}")
-        
-        if speaker == "pro":
-            # 正方发言
-            response = pro_agent.step(current_msg)
-            msg = response.msgs[0]
-            print(f"\n✅ 正方辩手:\n{msg.content}\n")
-            current_msg = msg
-            
-        elif speaker == "con":
-            # 反方发言
-            response = con_agent.step(current_msg)
-            msg = response.msgs[0]
-            print(f"❌ 反方辩手:\n{msg.content}\n")
-            current_msg = msg
-            
-        else:  # moderator
-            # 主持人发言
-            response = moderator_agent.step(current_msg)
-            msg = response.msgs[0]
-            print(f"⚖️ 主持人:\n{msg.content}\n")
-            current_msg = msg
-            
-    except Exception as e:
-        print(f"\n❌ 错误: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        break
-
-print(f"\n{'='*70}")
-print("🎓 辩论赛结束")
-print("="*70)
-
-# ==== 辩论统计 ====
-print("\n" + "="*70)
-print("📊 辩论数据")
-print("="*70)
-print(f"辩论环节数: {len(debate_stages)}")
-print(f"正方发言次数: {len([x for x in debate_stages if x[1] == 'pro'])}")
-print(f"反方发言次数: {len([x for x in debate_stages if x[1] == 'con'])}")
-print(f"主持人发言次数: {len([x for x in debate_stages if x[1] == 'moderator'])}")
-print("\n辩论核心议题：")
-print("1. AI对就业的影响")
-print("2. AI的伦理与安全问题")
-print("3. AI对人类社会的整体价值")
+    session.record("moderator", current_msg.content)
+
+    echo(f"\n{'='*70}")
+    echo("【开场】")
+    echo(f"{'='*70}")
+    echo(f"⚖️ 主持人:\n{current_msg.content}\n")
+
+    outputs = {}  # 环节名 -> 发言
+    stage_num = 0
+    for wave in waves:
+        try:
+            # 正方 / 反方 / 主持人发言（同一批的环节同时进行，按环节顺序显示）
+            speakers = []
+            for stage_name, speaker, inputs in wave:
+                stage_num += 1
+                header = f"\n{'='*70}\n【{stage_name}】 - 第 {stage_num} 环节\n{'='*70}\n"
+                input_msg = outputs[inputs[-1]] if inputs else current_msg
+                speakers.append((agents[speaker], input_msg, speaker, header + SPEAKER_LABELS[speaker]))
+            for (stage_name, _, _), msg in zip(wave, await session.speak_together(speakers)):
+                outputs[stage_name] = msg
+
+        except Exception as e:
+            session.fail(e)
+            break
+
+    echo(f"\n{'='*70}")
+    echo("🎓 辩论赛结束")
+    echo("="*70)
+
+    # ==== 辩论统计 ====
+    echo("\n" + "="*70)
+    echo("📊 辩论数据")
+    echo("="*70)
+    echo(f"赛制: {format}（{len(stages)} 个环节，分 {len(waves)} 批进行）")
+    echo(f"正方发言次数: {len([x for x in stages if x[1] == 'pro'])}")
+    echo(f"反方发言次数: {len([x for x in stages if x[1] == 'con'])}")
+    echo(f"主持人发言次数: {len([x for x in stages if x[1] == 'moderator'])}")
+    echo("\n辩论核心议题：")
+    echo("1. AI对就业的影响")
+    echo("2. AI的伦理与安全问题")
+    echo("3. AI对人类社会的整体价值")
+    return session.finish()
+
+
+def add_cli_args(parser):
+    parser.add_argument("--format", choices=sorted(DEBATE_FORMATS), default=None,
+                        help=f"赛制（默认 {DEFAULT_FORMAT}，恢复存档时沿用存档的赛制；standard 中互不依赖的环节同时进行）")
 
 
+if __name__ == "__main__":
+    args = parse_cli_args("辩论赛（三人对话）", add_cli_args)
+    agents = create_agents(create_model(stream=args.stream))
+    session = CamelSession.from_args(SCENARIO, args, {"format": args.format}, {"format": DEFAULT_FORMAT})
+    asyncio.run(run_session(session, agents, **session.options))
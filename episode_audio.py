@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# 离线渲染整期节目的音频：把一次完成的会话按角色配音，拼接成一个 WAV 文件
+#
+#   1. 每条发言按角色选音色（EPISODE_VOICES，与海龟汤的 TTS_VOICES 类似），去掉 [PRO] / 对话状态 等格式行
+#   2. 所有发言同时提交给线程池合成（--concurrency 限制同时进行的请求数），已经合成过的直接读缓存
+#      （tts_cache/，按 模型 + 音色 + 文本 的哈希命名），所以总耗时约等于最慢的一条，而不是所有发言之和
+#   3. 按发言顺序依次写入 WAV：前面的发言合成好就立即写出，不等后面的；每条发言统一响度（RMS 归一化 +
+#      峰值限制），发言之间插入固定长度的静音
+#
+# 合成使用 OpenAI TTS 的 pcm 输出（24kHz、16 位、单声道），不需要额外的音频解码库。
+#
+# 数据来源：默认读取转录库中的会话（--session 指定 id，不给时取最近完成的一个）；
+# 也可以给出 session_runner / session_fork 输出的 JSONL、或 batch_jobs 的 results 目录。
+#
+# 用法示例：
+#   python episode_audio.py --session debate-3f9a1c-000000 -o episodes/
+#   python episode_audio.py debates.jsonl --session debate-3f9a1c-000002 --gap 0.8
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+import wave
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from model_router import normalize_base_url
+from transcript_export import iter_records, record_rows
+from transcript_store import DEFAULT_DB
+
+try:
+    import audioop  # 标准库（3.13 起移除），有的话用它做响度计算更快
+except ImportError:
+    audioop = None
+
+load_dotenv()
+
+TTS_MODEL = "gpt-4o-mini-tts"
+SAMPLE_RATE = 24000  # OpenAI TTS pcm 输出：24kHz、16 位有符号小端、单声道
+SAMPLE_WIDTH = 2
+DEFAULT_CACHE_DIR = os.getenv("QDD_TTS_CACHE", "tts_cache")
+TARGET_DBFS = -20.0   # 每条发言归一化到的响度
+PEAK_LIMIT = 0.95     # 归一化后的峰值上限（满幅的比例），避免削波
+MAX_GAIN = 8.0        # 很安静的发言最多放大几倍（避免把底噪放大）
+MAX_CHARS = 4000      # OpenAI TTS 单次输入上限约 4096 字符
+
+# 各场景的角色音色（可选: alloy, echo, fable, onyx, nova, shimmer）
+EPISODE_VOICES = {
+    "debate": {"moderator": "onyx", "pro": "echo", "con": "nova"},
+    "food": {"host": "shimmer", "chef": "onyx", "critic": "fable"},
+    "interview": {"interviewer": "echo", "hr": "nova", "candidate": "alloy", "panel": "echo"},
+    "hospital": {"doctor": "onyx", "patient": "shimmer"},
+    "turtle_soup": {"主持人": "onyx", "福尔摩斯": "echo", "柯南": "nova", "波洛": "fable"},
+}
+EPISODE_VOICES["turtle_soup_tts"] = EPISODE_VOICES["turtle_soup"]
+DEFAULT_VOICE = "alloy"
+
+TAG_LINE = re.compile(r"^\s*\[[A-Z_]+\]\s*$")            # [PRO] / [MODERATOR] 等角色标记行
+STATUS_LINE = re.compile(r"^\s*对话状态\s*[:：].*$")       # 结束信号行（camel_session.end_field）
+
+
+def clean_line(text):
+    """去掉不需要朗读的格式行和标记"""
+    lines = [line for line in (text or "").replace("【向主持人提问】", "").splitlines()
+             if not TAG_LINE.match(line) and not STATUS_LINE.match(line)]
+    clean = "\n".join(lines).strip()
+    if len(clean) > MAX_CHARS:
+        clean = clean[:MAX_CHARS] + "..."
+    return clean
+
+
+# ============ 读取会话 ============
+def load_session_turns(inputs=None, session_id=None, db=DEFAULT_DB):
+    """返回 (会话 id, 场景, [(角色, 内容)])"""
+    if inputs:
+        for record in iter_records(inputs):
+            if session_id is None or record.get("session_id") == session_id:
+                session, turns = record_rows(record)
+                return session["session_id"], session["scenario"], [(t["role"], t["content"]) for t in turns]
+        raise ValueError(f"输入中没有会话 {session_id!r}")
+
+    if not os.path.exists(db):
+        raise FileNotFoundError(f"转录库不存在: {db}")
+    conn = sqlite3.connect(db)
+    try:
+        if session_id is None:
+            row = conn.execute(
+                "SELECT session_id, scenario FROM sessions WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT 1"
+            ).fetchone()
+        else:
+            row = conn.execute("SELECT session_id, scenario FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"转录库中没有会话 {session_id!r}" if session_id else "转录库中没有完成的会话")
+        turns = conn.execute(
+            "SELECT role, content FROM turns WHERE session_id = ? ORDER BY turn_index, id", (row[0],)
+        ).fetchall()
+        return row[0], row[1], turns
+    finally:
+        conn.close()
+
+
+# ============ 合成 ============
+class SpeechCache:
+    """合成结果的磁盘缓存：一条发言一个 .pcm 文件"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        self.hits = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, model, voice, text):
+        digest = hashlib.sha1(json.dumps([model, voice, SAMPLE_RATE, text], ensure_ascii=False).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pcm")
+
+    def get(self, model, voice, text):
+        if not self.directory:
+            return None
+        try:
+            with open(self.path(model, voice, text), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, model, voice, text, data):
+        if not self.directory:
+            return
+        path = self.path(model, voice, text)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # 原子替换，并发渲染同一条发言也不会读到半个文件
+
+
+def synthesize(client, text, voice, cache, model=TTS_MODEL):
+    """合成一条发言，返回 16 位 PCM 字节"""
+    data = cache.get(model, voice, text)
+    if data is None:
+        response = client.audio.speech.create(model=model, voice=voice, input=text, response_format="pcm")
+        data = response.read()
+        cache.put(model, voice, text, data)
+    return data
+
+
+def normalize_loudness(pcm):
+    """把一条发言的响度归一化到 TARGET_DBFS，并限制峰值"""
+    pcm = pcm[:len(pcm) - len(pcm) % SAMPLE_WIDTH]
+    if not pcm:
+        return pcm
+    if audioop:
+        rms, peak = audioop.rms(pcm, SAMPLE_WIDTH), audioop.max(pcm, SAMPLE_WIDTH)
+    else:
+        samples = array("h", pcm)
+        rms = math.sqrt(sum(s * s for s in samples) / len(samples))
+        peak = max(abs(min(samples)), max(samples))
+    if rms == 0:
+        return pcm
+    gain = 32768 * 10 ** (TARGET_DBFS / 20) / rms
+    gain = min(gain, MAX_GAIN, PEAK_LIMIT * 32767 / peak)
+    if audioop:
+        return audioop.mul(pcm, SAMPLE_WIDTH, gain)
+    return array("h", (max(-32768, min(32767, int(s * gain))) for s in samples)).tobytes()
+
+
+# ============ 渲染 ============
+def render_episode(turns, out_path, scenario=None, voices=None, gap=0.6, concurrency=6,
+                   cache_dir=DEFAULT_CACHE_DIR, model=TTS_MODEL, client=None, verbose=True):
+    """把 [(角色, 内容)] 渲染成一个 WAV 文件，返回统计信息
+
+    合成在线程池中并发进行；按发言顺序依次写出，某条合成失败时跳过（不影响其他发言）。
+    """
+    client = client or OpenAI(api_key=os.getenv("QDD_API_KEY"), base_url=normalize_base_url(os.getenv("QDD_BASE_URL")))
+    voices = voices or EPISODE_VOICES.get(scenario, {})
+    cache = SpeechCache(cache_dir)
+    lines = [(role, voices.get(role, DEFAULT_VOICE), clean_line(content)) for role, content in turns]
+    lines = [line for line in lines if len(line[2]) >= 2]
+    silence = b"\x00" * (int(SAMPLE_RATE * gap) * SAMPLE_WIDTH)
+
+    start = time.perf_counter()
+    stats = {"lines": len(lines), "failed": 0, "seconds": 0.0}
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool, wave.open(out_path, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(SAMPLE_WIDTH)
+        out.setframerate(SAMPLE_RATE)
+        futures = [pool.submit(synthesize, client, text, voice, cache, model) for _, voice, text in lines]
+        written = 0
+        for (role, voice, text), future in zip(lines, futures):
+            try:
+                pcm = normalize_loudness(future.result())
+            except Exception as e:
+                stats["failed"] += 1
+                if verbose:
+                    print(f"   ⚠️ TTS 错误（{role}）: {e}")
+                continue
+            if written:
+                out.writeframes(silence)
+            out.writeframes(pcm)
+            written += 1
+            if verbose:
+                print(f"🔊 [{written}/{len(lines)}] {role}（{voice}）{len(pcm) / SAMPLE_WIDTH / SAMPLE_RATE:.1f}s")
+        stats["seconds"] = out.getnframes() / SAMPLE_RATE
+    stats["cache_hits"] = cache.hits
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把一次会话渲染成整期节目音频（WAV）")
+    parser.add_argument("inputs", nargs="*", help="会话记录 JSONL 或 batch_jobs 的 results 目录（不给则读取转录库）")
+    parser.add_argument("--session", default=None, help="会话 id（不给时：转录库取最近完成的会话，JSONL 取第一条）")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"转录库路径（默认 {DEFAULT_DB}）")
+    parser.add_argument("-o", "--out-dir", default="episodes", help="输出目录（文件名为 <会话 id>.wav）")
+    parser.add_argument("--gap", type=float, default=0.6, help="发言之间的静音秒数")
+    parser.add_argument("--concurrency", type=int, default=6, help="同时进行的合成请求数")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"合成缓存目录（默认 {DEFAULT_CACHE_DIR}）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用合成缓存")
+    args = parser.parse_args()
+
+    session_id, scenario, turns = load_session_turns(args.inputs, args.session, args.db)
+    out_path = os.path.join(args.out_dir, f"{session_id.replace('/', '_')}.wav")
+    print(f"🎬 渲染 {scenario} 会话 {session_id}（{len(turns)} 条发言）")
+    stats = render_episode(
+        turns,
+        out_path,
+        scenario=scenario,
+        gap=args.gap,
+        concurrency=args.concurrency,
+        cache_dir=None if args.no_cache else args.cache_dir,
+    )
+    print(f"✅ {out_path}：{stats['seconds']:.1f}s 音频，{stats['lines']} 条发言"
+          f"（缓存命中 {stats['cache_hits']}，失败 {stats['failed']}），耗时 {stats['elapsed']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
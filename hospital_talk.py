@@ -1,129 +1,148 @@
 # demo_openai_compatible_single.py
 import os
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType
+import asyncio
 from camel.agents import ChatAgent
 from camel.messages import BaseMessage
 
 from dotenv import load_dotenv
 load_dotenv()  # 自动加载 .env 文件
 
-BASE_URL = os.getenv("QDD_BASE_URL")
-API_KEY  = os.getenv("QDD_API_KEY")
+from camel_session import CamelSession, TurnPolicy, create_model as create_camel_model, end_field, parse_cli_args, with_persona
+
 MODEL_ID = os.getenv("QDD_MODEL",    "gpt-4o")
+SCENARIO = "hospital"
+PERSONA_ROLE = "patient"  # 批量任务中字符串形式的 persona 作用的角色
+TURN_POLICY = TurnPolicy(min_turns=2, max_turns=6)  # 由医生发出结束信号
 
-# 🔧 修复：确保 BASE_URL 以 /v1 结尾（OpenAI 兼容接口需要）
-if BASE_URL and not BASE_URL.endswith('/v1'):
-    BASE_URL = BASE_URL.rstrip('/') + '/v1'
 
-model = ModelFactory.create(
-    model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-    model_type=MODEL_ID,
-    api_key=API_KEY,
-    url=BASE_URL,
-    model_config_dict={
+def create_model(model_id=None, seed=None, temperature=None, stream=False):
+    """model_id 为空时按路由表（model_routes.json）给每个角色选模型，没有配置的角色用 MODEL_ID；stream=True 时流式输出"""
+    config = {
         "temperature": 0.9,
         "max_tokens": 1500,  # 增加每次回复的最大 token 数
-    },
-)
-
-# ==== 创建医生 Agent ====
-doctor_system_message = BaseMessage.make_assistant_message(
-    role_name="Doctor",
-    content=(
-        "你是一名专业的医生。你的职责是：\n"
-        "1. 仔细询问患者的症状、病史和生活习惯\n"
-        "2. 根据患者描述进行初步诊断\n"
-        "3. 给出专业的医疗建议和治疗方案\n"
-        "4. 用通俗易懂的语言解释医学概念\n"
-        "5. 保持耐心、专业和同理心\n\n"
-        "请严格使用以下格式输出：\n"
-        "[DOCTOR]\n"
-        "本轮目标: <说明本轮沟通目标>\n"
-        "询问/说明: <向患者询问的问题或医学解释>\n"
-        "初步判断: <基于已知信息的分析>\n"
-        "建议: <检查项目或治疗方案>\n"
-        "注意事项: <患者需要注意的要点>\n"
+    }
+    return create_camel_model(model_id, config, default_model=MODEL_ID, seed=seed, temperature=temperature,
+                              stream=stream or None)
+
+
+def create_agents(model, persona=None):
+    """创建一组新的 agent（每个会话独立一份，记忆互不干扰）
+
+    persona: 批量任务给出的补充人设，字符串或 {角色: 人设} 字典
+    """
+    # ==== 创建医生 Agent ====
+    doctor_system_message = BaseMessage.make_assistant_message(
+        role_name="Doctor",
+        content=with_persona((
+            "你是一名专业的医生。你的职责是：\n"
+            "1. 仔细询问患者的症状、病史和生活习惯\n"
+            "2. 根据患者描述进行初步诊断\n"
+            "3. 给出专业的医疗建议和治疗方案\n"
+            "4. 用通俗易懂的语言解释医学概念\n"
+            "5. 保持耐心、专业和同理心\n\n"
+            "请严格使用以下格式输出：\n"
+            "[DOCTOR]\n"
+            "本轮目标: <说明本轮沟通目标>\n"
+            "询问/说明: <向患者询问的问题或医学解释>\n"
+            "初步判断: <基于已知信息的分析>\n"
+            "建议: <检查项目或治疗方案>\n"
+            "注意事项: <患者需要注意的要点>\n"
+            + end_field("诊断和建议都已说明、患者没有新的疑问，问诊可以结束")
+        ), "doctor", persona, PERSONA_ROLE)
+    )
+
+    doctor_agent = ChatAgent(
+        system_message=doctor_system_message,
+        model=model.for_role("doctor"),
+        message_window_size=20,
+        token_limit=8192,  # 增加 token 限制
     )
-)
-
-doctor_agent = ChatAgent(
-    system_message=doctor_system_message,
-    model=model,
-    message_window_size=20,
-    token_limit=8192,  # 增加 token 限制
-)
-
-# ==== 创建患者 Agent ====
-patient_system_message = BaseMessage.make_user_message(
-    role_name="Patient",
-    content=(
-        "你是一名因头痛来就诊的患者。你的特点是：\n"
-        "1. 头痛已经持续3天，主要在太阳穴位置\n"
-        "2. 最近工作压力大，经常熬夜\n"
-        "3. 对自己的病情有些担心\n"
-        "4. 会如实回答医生的问题\n"
-        "5. 对不理解的医学术语会提问\n\n"
-        "请严格使用以下格式输出：\n"
-        "[PATIENT]\n"
-        "症状描述: <详细描述不适症状>\n"
-        "回答医生: <针对医生问题的具体回答>\n"
-        "疑问/顾虑: <对病情或治疗的疑问>\n"
+
+    # ==== 创建患者 Agent ====
+    patient_system_message = BaseMessage.make_user_message(
+        role_name="Patient",
+        content=with_persona((
+            "你是一名因头痛来就诊的患者。你的特点是：\n"
+            "1. 头痛已经持续3天，主要在太阳穴位置\n"
+            "2. 最近工作压力大，经常熬夜\n"
+            "3. 对自己的病情有些担心\n"
+            "4. 会如实回答医生的问题\n"
+            "5. 对不理解的医学术语会提问\n\n"
+            "请严格使用以下格式输出：\n"
+            "[PATIENT]\n"
+            "症状描述: <详细描述不适症状>\n"
+            "回答医生: <针对医生问题的具体回答>\n"
+            "疑问/顾虑: <对病情或治疗的疑问>\n"
+        ), "patient", persona, PERSONA_ROLE)
+    )
+
+    patient_agent = ChatAgent(
+        system_message=patient_system_message,
+        model=model.for_role("patient"),
+        message_window_size=20,
+        token_limit=8192,  # 增加 token 限制
+    )
+
+    return {"doctor": doctor_agent, "patient": patient_agent}
+
+
+async def run_session(session=None, agents=None):
+    """完整跑一次问诊对话，返回会话记录"""
+    session = session or CamelSession(SCENARIO)
+    agents = agents or create_agents(create_model())
+    doctor_agent = agents["doctor"]
+    patient_agent = agents["patient"]
+    echo = session.echo
+
+    # ==== 开始对话 ====
+    echo("="*70)
+    echo("🏥 医患沟通模拟（独立 Agent 版本）")
+    echo("="*70)
+
+    # 患者主动开始对话
+    patient_msg = BaseMessage.make_user_message(
+        role_name="Patient",
+        content="医生您好，我最近头痛得厉害，已经持续3天了。"
     )
-)
-
-patient_agent = ChatAgent(
-    system_message=patient_system_message,
-    model=model,
-    message_window_size=20,
-    token_limit=8192,  # 增加 token 限制
-)
-
-# ==== 开始对话 ====
-print("="*70)
-print("🏥 医患沟通模拟（独立 Agent 版本）")
-print("="*70)
-
-# 患者主动开始对话
-patient_msg = BaseMessage.make_user_message(
-    role_name="Patient",
-    content="医生您好，我最近头痛得厉害，已经持续3天了。"
-)
-
-print(f"\n{'='*70}")
-print("初始消息")
-print(f"{'='*70}")
-print(f"🤒 PATIENT: {patient_msg.content}\n")
-
-# 进行多轮对话
-for i in range(6):
-    try:
-        print(f"\n{'='*70}")
-        print(f"第 {i+1} 轮对话")
-        print(f"{'='*70}")
-        
-        # 医生回应患者
-        doctor_response = doctor_agent.step(patient_msg)
-        doctor_msg = doctor_response.msgs[0]
-        print(f"\n👨‍⚕️ DOCTOR:\n{doctor_msg.content}\n")
-        
-        # 患者回应医生
-        patient_response = patient_agent.step(doctor_msg)
-        patient_msg = patient_response.msgs[0]
-        print(f"🤒 PATIENT:\n{patient_msg.content}\n")
-        
-        # 检查是否结束
-        if "再见" in doctor_msg.content or "结束" in doctor_msg.content:
-            print("\n✅ 问诊完成")
+    session.record("patient", patient_msg.content)
+
+    echo(f"\n{'='*70}")
+    echo("初始消息")
+    echo(f"{'='*70}")
+    echo(f"🤒 PATIENT: {patient_msg.content}\n")
+
+    # 进行多轮对话
+    for i in TURN_POLICY.rounds():
+        try:
+            echo(f"\n{'='*70}")
+            echo(f"第 {i+1} 轮对话")
+            echo(f"{'='*70}")
+
+            # 医生回应患者
+            doctor_msg = await session.speak(doctor_agent, patient_msg, "doctor", "\n👨‍⚕️ DOCTOR")
+
+            # 患者回应医生
+            patient_msg = await session.speak(patient_agent, doctor_msg, "patient", "🤒 PATIENT")
+
+            # 检查是否结束（医生的 对话状态 字段）
+            if TURN_POLICY.should_end(i, doctor_msg):
+                session.outcome = "ended"
+                echo("\n✅ 问诊完成")
+                break
+
+        except Exception as e:
+            session.fail(e)
             break
-            
-    except Exception as e:
-        print(f"\n❌ 错误: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        break
+    else:
+        session.outcome = "max_turns"
+
+    echo(f"\n{'='*70}")
+    echo("问诊结束")
+    echo("="*70)
+    return session.finish()
 
-print(f"\n{'='*70}")
-print("问诊结束")
-print("="*70)
 
+if __name__ == "__main__":
+    args = parse_cli_args("医患沟通模拟")
+    agents = create_agents(create_model(stream=args.stream))
+    asyncio.run(run_session(CamelSession.from_args(SCENARIO, args), agents))
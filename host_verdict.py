@@ -0,0 +1,55 @@
+# 海龟汤主持人的结构化判定：主持人按 JSON 输出，游戏循环只根据 solved 字段判断是否破解
+#
+#   {"answer": "是", "solved": false, "reply": "是。"}
+#
+# answer   对问题的判定类别（ANSWERS 之一）
+# solved   玩家是否已经完整说出真相；只有为 true 时游戏才结束
+# reply    主持人对玩家说的话（显示、朗读、写入对话记录）
+import json
+import re
+
+ANSWERS = ["是", "否", "不重要", "关键", "方向对了"]
+
+# 请求主持人输出 JSON 对象（OpenAI 兼容接口的 JSON mode）
+RESPONSE_FORMAT = {"type": "json_object"}
+
+VERDICT_INSTRUCTIONS = f"""【输出格式】
+每次回答都只输出一个 JSON 对象，不要输出任何其他文字：
+{{"answer": "<{' / '.join(ANSWERS)}>", "solved": <true 或 false>, "reply": "<你对玩家说的话>"}}
+- answer：对玩家问题的判定。"关键" 表示这个问题很关键，"方向对了" 表示推理接近真相
+- solved：只有当玩家已经完整说出真相的核心时才为 true；接近但不完整、或只是猜对了部分细节，都为 false
+- reply：简短的回答；solved 为 true 时确认并揭晓完整答案"""
+
+JSON_OBJECT = re.compile(r"\{.*\}", re.S)
+ERROR_MARKERS = ("[系统错误", "[模型返回空响应")  # call_model 调用失败时返回的占位文字
+
+
+def parse_host_verdict(text):
+    """解析主持人的回答，返回 {"answer", "solved", "reply"}
+
+    模型偶尔会在 JSON 外面包一层说明或代码块，这里取第一个 {...}；无法解析时视为未破解，
+    把原文作为 reply，游戏继续。
+    """
+    match = JSON_OBJECT.search(text or "")
+    try:
+        data = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        return {"answer": None, "solved": False, "reply": (text or "").strip()}
+
+    answer = data.get("answer")
+    solved = data.get("solved")
+    if isinstance(solved, str):
+        solved = solved.strip().lower() == "true"
+    return {
+        "answer": answer if answer in ANSWERS else None,
+        "solved": solved is True,
+        "reply": str(data.get("reply") or answer or "").strip(),
+    }
+
+
+def is_answered(text):
+    """主持人是否给出了合法的判定（调用失败的占位文字、无法解析的回答都不算）"""
+    text = (text or "").strip()
+    return not text.startswith(ERROR_MARKERS) and parse_host_verdict(text)["answer"] is not None
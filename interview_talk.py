@@ -1,185 +1,270 @@
 # 三人对话：求职面试场景
 import os
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType
+import re
+import asyncio
 from camel.agents import ChatAgent
 from camel.messages import BaseMessage
 
 from dotenv import load_dotenv
 load_dotenv()  # 自动加载 .env 文件
 
-BASE_URL = os.getenv("QDD_BASE_URL")
-API_KEY  = os.getenv("QDD_API_KEY")
+from camel_session import CamelSession, TurnPolicy, create_model as create_camel_model, end_field, parse_cli_args, wants_to_end, with_persona
+
 MODEL_ID = os.getenv("QDD_MODEL",    "gpt-4o")
+SCENARIO = "interview"
+PERSONA_ROLE = "candidate"  # 批量任务中字符串形式的 persona 作用的角色
+TURN_POLICY = TurnPolicy(min_turns=3, max_turns=5)  # 由面试官或 HR 发出结束信号
+
 
-model = ModelFactory.create(
-    model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-    model_type=MODEL_ID,
-    api_key=API_KEY,
-    url=BASE_URL,
-    model_config_dict={
+def create_model(model_id=None, seed=None, temperature=None, stream=False):
+    """model_id 为空时按路由表（model_routes.json）给每个角色选模型，没有配置的角色用 MODEL_ID；stream=True 时流式输出"""
+    config = {
         "temperature": 0.7,
         "max_tokens": 1200,
-    },
-)
-
-# ==== 创建技术面试官 Agent ====
-interviewer_system_message = BaseMessage.make_assistant_message(
-    role_name="Technical Interviewer",
-    content=(
-        "你是一名技术面试官，负责评估候选人的技术能力。你的职责是：\n"
-        "1. 提出有深度的技术问题\n"
-        "2. 评估候选人的回答质量\n"
-        "3. 适时追问以了解候选人的真实水平\n"
-        "4. 与HR配合完成面试\n"
-        "5. 保持专业但友好的态度\n\n"
-        "请严格使用以下格式输出：\n"
-        "[INTERVIEWER]\n"
-        "提问/评价: <技术问题或对候选人回答的评价>\n"
-        "观察点: <候选人的表现观察>\n"
-        "后续动作: <接下来要做什么>\n"
+    }
+    return create_camel_model(model_id, config, default_model=MODEL_ID, seed=seed, temperature=temperature,
+                              stream=stream or None)
+
+
+def create_agents(model, persona=None):
+    """创建一组新的 agent（每个会话独立一份，记忆互不干扰）
+
+    persona: 批量任务给出的补充人设，字符串或 {角色: 人设} 字典
+    """
+    # ==== 创建技术面试官 Agent ====
+    interviewer_system_message = BaseMessage.make_assistant_message(
+        role_name="Technical Interviewer",
+        content=with_persona((
+            "你是一名技术面试官，负责评估候选人的技术能力。你的职责是：\n"
+            "1. 提出有深度的技术问题\n"
+            "2. 评估候选人的回答质量\n"
+            "3. 适时追问以了解候选人的真实水平\n"
+            "4. 与HR配合完成面试\n"
+            "5. 保持专业但友好的态度\n\n"
+            "请严格使用以下格式输出：\n"
+            "[INTERVIEWER]\n"
+            "提问/评价: <技术问题或对候选人回答的评价>\n"
+            "观察点: <候选人的表现观察>\n"
+            "后续动作: <接下来要做什么>\n"
+            + end_field("技术评估已经完成、面试可以结束")
+        ), "interviewer", persona, PERSONA_ROLE)
     )
-)
-
-interviewer_agent = ChatAgent(
-    system_message=interviewer_system_message,
-    model=model,
-    message_window_size=25,
-    token_limit=8192,
-)
-
-# ==== 创建HR Agent ====
-hr_system_message = BaseMessage.make_assistant_message(
-    role_name="HR",
-    content=(
-        "你是HR，负责协调面试流程和评估候选人综合素质。你的职责是：\n"
-        "1. 介绍面试流程和公司情况\n"
-        "2. 询问候选人的职业规划和期望\n"
-        "3. 补充技术面试官未涉及的软技能问题\n"
-        "4. 关注候选人的沟通能力和文化匹配度\n"
-        "5. 在适当时候总结面试\n\n"
-        "请严格使用以下格式输出：\n"
-        "[HR]\n"
-        "沟通内容: <询问的问题或说明的信息>\n"
-        "关注点: <对候选人的观察>\n"
-        "建议: <给技术面试官或候选人的建议>\n"
+
+    interviewer_agent = ChatAgent(
+        system_message=interviewer_system_message,
+        model=model.for_role("interviewer"),
+        message_window_size=25,
+        token_limit=8192,
     )
-)
-
-hr_agent = ChatAgent(
-    system_message=hr_system_message,
-    model=model,
-    message_window_size=25,
-    token_limit=8192,
-)
-
-# ==== 创建求职者 Agent ====
-candidate_system_message = BaseMessage.make_assistant_message(
-    role_name="Candidate",
-    content=(
-        "你是一名应聘Python后端工程师职位的候选人。你的背景：\n"
-        "1. 有2年Python开发经验\n"
-        "2. 熟悉Django和FastAPI框架\n"
-        "3. 做过电商系统的后端开发\n"
-        "4. 希望在新公司有更多技术成长机会\n"
-        "5. 期望薪资在20-25K之间\n"
-        "6. 诚实、谦虚，但也展现自己的优势\n\n"
-        "请严格使用以下格式输出：\n"
-        "[CANDIDATE]\n"
-        "回答: <针对面试官或HR的回答>\n"
-        "补充说明: <额外想说明的经验或项目>\n"
-        "提问: <向面试官或HR的问题（如有）>\n"
+
+    # ==== 创建HR Agent ====
+    hr_system_message = BaseMessage.make_assistant_message(
+        role_name="HR",
+        content=with_persona((
+            "你是HR，负责协调面试流程和评估候选人综合素质。你的职责是：\n"
+            "1. 介绍面试流程和公司情况\n"
+            "2. 询问候选人的职业规划和期望\n"
+            "3. 补充技术面试官未涉及的软技能问题\n"
+            "4. 关注候选人的沟通能力和文化匹配度\n"
+            "5. 在适当时候总结面试\n\n"
+            "请严格使用以下格式输出：\n"
+            "[HR]\n"
+            "沟通内容: <询问的问题或说明的信息>\n"
+            "关注点: <对候选人的观察>\n"
+            "建议: <给技术面试官或候选人的建议>\n"
+            + end_field("已经总结面试、向候选人致谢道别")
+        ), "hr", persona, PERSONA_ROLE)
+    )
+
+    hr_agent = ChatAgent(
+        system_message=hr_system_message,
+        model=model.for_role("hr"),
+        message_window_size=25,
+        token_limit=8192,
+    )
+
+    # ==== 创建求职者 Agent ====
+    candidate_system_message = BaseMessage.make_assistant_message(
+        role_name="Candidate",
+        content=with_persona((
+            "你是一名应聘Python后端工程师职位的候选人。你的背景：\n"
+            "1. 有2年Python开发经验\n"
+            "2. 熟悉Django和FastAPI框架\n"
+            "3. 做过电商系统的后端开发\n"
+            "4. 希望在新公司有更多技术成长机会\n"
+            "5. 期望薪资在20-25K之间\n"
+            "6. 诚实、谦虚，但也展现自己的优势\n\n"
+            "请严格使用以下格式输出：\n"
+            "[CANDIDATE]\n"
+            "回答: <针对面试官或HR的回答>\n"
+            "补充说明: <额外想说明的经验或项目>\n"
+            "提问: <向面试官或HR的问题（如有）>\n"
+        ), "candidate", persona, PERSONA_ROLE)
+    )
+
+    candidate_agent = ChatAgent(
+        system_message=candidate_system_message,
+        model=model.for_role("candidate"),
+        message_window_size=25,
+        token_limit=8192,
+    )
+
+    return {"interviewer": interviewer_agent, "hr": hr_agent, "candidate": candidate_agent}
+
+
+# 黑板上显示的角色名
+SPEAKER_NAMES = {
+    "interviewer": "技术面试官",
+    "hr": "HR",
+    "candidate": "求职者",
+    "panel": "面试官和HR",
+}
+
+
+# ============ 面试小组模式 ============
+# 候选人每次回答后，技术面试官和 HR 同时评估（并发调用），两人的 观察点 / 关注点 合并成一条追问交给候选人；
+# 追问的问题来自本轮的主问人（与轮流模式相同：偶数轮技术面试官，奇数轮 HR），结束信号也以主问人为准。
+QUESTION_FIELDS = {"interviewer": "提问/评价", "hr": "沟通内容"}
+
+
+def lead_evaluator(round_num):
+    """本轮由谁提问 / 回应候选人"""
+    return "interviewer" if round_num % 2 == 0 else "hr"
+
+
+def field(content, name):
+    """取出发言中某个字段的内容（如 "观察点: ..." 这一行），没有时返回空字符串"""
+    match = re.search(rf"^\s*{re.escape(name)}\s*[:：]\s*(.*)$", content or "", re.M)
+    return match.group(1).strip() if match else ""
+
+
+def merge_feedback(lead, interviewer_msg, hr_msg):
+    """把两位评估者的发言合并成给候选人的一条追问"""
+    lead_msg = interviewer_msg if lead == "interviewer" else hr_msg
+    question = field(lead_msg.content, QUESTION_FIELDS[lead]) or lead_msg.content
+    return BaseMessage.make_assistant_message(
+        role_name="Panel",
+        content=(
+            "[PANEL]\n"
+            f"{SPEAKER_NAMES[lead]}: {question}\n"
+            f"技术面试官观察点: {field(interviewer_msg.content, '观察点') or '无'}\n"
+            f"HR关注点: {field(hr_msg.content, '关注点') or '无'}\n"
+            f"对话状态: {'结束' if wants_to_end(lead_msg.content) else '继续'}"
+        ),
     )
-)
-
-candidate_agent = ChatAgent(
-    system_message=candidate_system_message,
-    model=model,
-    message_window_size=25,
-    token_limit=8192,
-)
-
-# ==== 开始三人对话 ====
-print("="*70)
-print("💼 技术面试模拟（三人对话）")
-print("="*70)
-print("角色：技术面试官、HR、求职者")
-print("="*70)
-
-# HR开场
-hr_msg = BaseMessage.make_assistant_message(
-    role_name="HR",
-    content=(
-        "[HR]\n"
-        "沟通内容: 您好，欢迎来到我们公司面试。今天的面试分为两部分：\n"
-        "首先由技术面试官评估您的技术能力，然后我会和您聊聊职业规划。\n"
-        "请先简单介绍一下自己。\n"
-        "关注点: 候选人的表达能力和自信程度\n"
-        "建议: 放松心态，展现真实水平"
+
+
+async def run_session(session=None, agents=None, panel=False):
+    """完整跑一次三人面试，返回会话记录
+
+    panel=True 时使用面试小组模式：每轮技术面试官和 HR 同时评估候选人的回答，合并成一条追问。
+    """
+    session = session or CamelSession(SCENARIO, options={"panel": panel})
+    agents = agents or create_agents(create_model())
+    interviewer_agent = agents["interviewer"]
+    hr_agent = agents["hr"]
+    candidate_agent = agents["candidate"]
+    session.use_blackboard(SPEAKER_NAMES)  # 每个角色都能看到另外两人的发言
+    echo = session.echo
+
+    # ==== 开始三人对话 ====
+    echo("="*70)
+    echo("💼 技术面试模拟（三人对话）")
+    echo("="*70)
+    echo("角色：技术面试官、HR、求职者")
+    echo("="*70)
+
+    # HR开场
+    hr_msg = BaseMessage.make_assistant_message(
+        role_name="HR",
+        content=(
+            "[HR]\n"
+            "沟通内容: 您好，欢迎来到我们公司面试。今天的面试分为两部分：\n"
+            "首先由技术面试官评估您的技术能力，然后我会和您聊聊职业规划。\n"
+            "请先简单介绍一下自己。\n"
+            "关注点: 候选人的表达能力和自信程度\n"
+            "建议: 放松心态，展现真实水平\n"
+            "对话状态: 继续"
+        )
     )
-)
-
-print(f"\n{'='*70}")
-print("开场")
-print(f"{'='*70}")
-print(f"👔 HR:\n{hr_msg.content}\n")
-
-# 进行多轮三人对话
-conversation_history = []
-last_speaker = "HR"
-last_msg = hr_msg
-
-for round_num in range(5):
-    try:
-        print(f"\n{'='*70}")
-        print(f"第 {round_num + 1} 轮对话")
-        print(f"{'='*70}")
-        
-        # 候选人回应（总是会说话）
-        candidate_response = candidate_agent.step(last_msg)
-        candidate_msg = candidate_response.msgs[0]
-        print(f"\n👤 CANDIDATE:\n{candidate_msg.content}\n")
-        conversation_history.append(("Candidate", candidate_msg.content))
-        
-        # 根据轮次决定谁来回应候选人
-        if round_num % 2 == 0:
-            # 技术面试官回应
-            interviewer_response = interviewer_agent.step(candidate_msg)
-            interviewer_msg = interviewer_response.msgs[0]
-            print(f"👨‍💼 INTERVIEWER:\n{interviewer_msg.content}\n")
-            conversation_history.append(("Interviewer", interviewer_msg.content))
-            last_msg = interviewer_msg
-            last_speaker = "Interviewer"
-        else:
-            # HR回应
-            hr_response = hr_agent.step(candidate_msg)
-            hr_msg = hr_response.msgs[0]
-            print(f"👔 HR:\n{hr_msg.content}\n")
-            conversation_history.append(("HR", hr_msg.content))
-            last_msg = hr_msg
-            last_speaker = "HR"
-        
-        # 检查是否结束
-        if "结束" in last_msg.content or "感谢" in last_msg.content and round_num >= 3:
-            print("\n✅ 面试完成")
+    session.record("hr", hr_msg.content)
+
+    echo(f"\n{'='*70}")
+    echo("开场")
+    echo(f"{'='*70}")
+    echo(f"👔 HR:\n{hr_msg.content}\n")
+
+    # 进行多轮三人对话
+    opening = len(session.turns)
+    last_speaker = "HR"
+    last_msg = hr_msg
+
+    for round_num in TURN_POLICY.rounds():
+        try:
+            echo(f"\n{'='*70}")
+            echo(f"第 {round_num + 1} 轮对话")
+            echo(f"{'='*70}")
+
+            # 候选人回应（总是会说话）
+            candidate_msg = await session.speak(candidate_agent, last_msg, "candidate", "\n👤 CANDIDATE")
+
+            if panel:
+                # 两位评估者同时处理候选人的回答，合并后交给候选人（两条原始发言不再单独发给任何人）
+                interviewer_msg, hr_msg = await session.speak_together([
+                    (interviewer_agent, candidate_msg, "interviewer", "👨‍💼 INTERVIEWER"),
+                    (hr_agent, candidate_msg, "hr", "👔 HR"),
+                ])
+                last_msg = merge_feedback(lead_evaluator(round_num), interviewer_msg, hr_msg)
+                session.blackboard.seek(len(session.turns), "interviewer", "hr", "candidate")
+                session.record("panel", last_msg.content)
+                echo(f"📋 PANEL:\n{last_msg.content}\n")
+            # 根据轮次决定谁来回应候选人
+            elif lead_evaluator(round_num) == "interviewer":
+                # 技术面试官回应
+                interviewer_msg = await session.speak(interviewer_agent, candidate_msg, "interviewer", "👨‍💼 INTERVIEWER")
+                last_msg = interviewer_msg
+                last_speaker = "Interviewer"
+            else:
+                # HR回应
+                hr_msg = await session.speak(hr_agent, candidate_msg, "hr", "👔 HR")
+                last_msg = hr_msg
+                last_speaker = "HR"
+
+            # 检查是否结束（面试官 / HR 的 对话状态 字段；小组模式下为主问人的）
+            if TURN_POLICY.should_end(round_num, last_msg):
+                session.outcome = "ended"
+                echo("\n✅ 面试完成")
+                break
+
+        except Exception as e:
+            session.fail(e)
             break
-            
-    except Exception as e:
-        print(f"\n❌ 错误: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        break
-
-print(f"\n{'='*70}")
-print("面试结束")
-print("="*70)
-
-# ==== 打印对话摘要 ====
-print("\n" + "="*70)
-print("📊 对话摘要")
-print("="*70)
-print(f"总对话轮数: {len(conversation_history)}")
-print(f"候选人发言次数: {len([x for x in conversation_history if x[0] == 'Candidate'])}")
-print(f"面试官发言次数: {len([x for x in conversation_history if x[0] == 'Interviewer'])}")
-print(f"HR发言次数: {len([x for x in conversation_history if x[0] == 'HR'])}")
+    else:
+        session.outcome = "max_turns"
+
+    echo(f"\n{'='*70}")
+    echo("面试结束")
+    echo("="*70)
+
+    # ==== 打印对话摘要 ====
+    echo("\n" + "="*70)
+    echo("📊 对话摘要")
+    echo("="*70)
+    speakers = [turn.speaker for turn in session.turns[opening:] if turn.speaker != "panel"]
+    echo(f"总对话轮数: {len(speakers)}")
+    echo(f"候选人发言次数: {speakers.count('candidate')}")
+    echo(f"面试官发言次数: {speakers.count('interviewer')}")
+    echo(f"HR发言次数: {speakers.count('hr')}")
+    return session.finish()
+
+
+def add_cli_args(parser):
+    parser.add_argument("--panel", action="store_true", default=None,
+                        help="面试小组模式：技术面试官和 HR 同时评估每次回答（恢复存档时沿用存档的模式）")
+
 
+if __name__ == "__main__":
+    args = parse_cli_args("技术面试模拟（三人对话）", add_cli_args)
+    agents = create_agents(create_model(stream=args.stream))
+    session = CamelSession.from_args(SCENARIO, args, {"panel": args.panel}, {"panel": False})
+    asyncio.run(run_session(session, agents, **session.options))
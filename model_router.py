@@ -0,0 +1,270 @@
+# 按角色选模型、在多个 OpenAI 兼容端点之间路由和故障切换
+#
+# 路由表（默认 model_routes.json，可用 QDD_MODEL_ROUTES 指定）给每个角色配置一组候选线路，
+# 线路写成 "模型@端点"：
+#
+#   {
+#     "endpoints": {
+#       "main":   {"base_url": "https://api.deepseek.com/v1", "api_key_env": "QDD_API_KEY"},
+#       "backup": {"base_url": "https://api.example.com/v1",  "api_key_env": "BACKUP_API_KEY", "tpm": 60000}
+#     },
+#     "roles": {
+#       "default":   ["deepseek-chat@main", "deepseek-chat@backup"],
+#       "主持人":     ["qwen-turbo@backup", "deepseek-chat@main"],
+#       "moderator": ["qwen-turbo@backup", "deepseek-chat@main"]
+#     }
+#   }
+#
+# 端点 "default" 始终存在，即 QDD_BASE_URL / QDD_API_KEY；没有路由表时所有角色都用脚本的默认模型走这个端点，
+# 与原来的行为一致。角色查找顺序由调用方给出（如 ("福尔摩斯", "玩家")），都没有配置时用 "default"。
+#
+# 路由器实时记录每条线路的耗时和错误率（指数加权平均）：
+#   - 每次调用选当前最快的健康线路；还没有测过的线路先各试一次
+#   - 调用失败时立即换下一条线路重试；连续失败的线路暂停使用一段时间（每多失败一次翻倍）
+#
+# 端点配置了 tpm（每分钟 token 数限额）时，请求前按预估的 token 数（提示词 + max_tokens，
+# 见 token_accounting.py）排队，额度不够就等待，而不是发出去再被 429 拒绝；实际用量少于预估时退回差额。
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+load_dotenv()
+
+DEFAULT_ROUTES = os.getenv("QDD_MODEL_ROUTES", "model_routes.json")
+DEFAULT_ENDPOINT = "default"
+EWMA_ALPHA = 0.3          # 新样本的权重
+ERROR_PENALTY = 4.0       # 错误率对得分的放大系数：得分 = 平均耗时 × (1 + 4 × 错误率)
+COOLDOWN = 30.0           # 连续失败后暂停使用的秒数（每多失败一次翻倍）
+MAX_COOLDOWN = 600.0
+
+
+def normalize_base_url(url):
+    """确保 base_url 以 /v1 结尾（OpenAI 兼容接口需要）"""
+    if url and not url.endswith('/v1'):
+        url = url.rstrip('/') + '/v1'
+    return url
+
+
+class Route:
+    """一条线路：某个端点上的某个模型"""
+
+    def __init__(self, model, endpoint, base_url, api_key):
+        self.model = model
+        self.endpoint = endpoint
+        self.base_url = base_url
+        self.api_key = api_key
+        self.name = f"{model}@{endpoint}"
+
+    def __repr__(self):
+        return f"Route({self.name})"
+
+
+class RouteHealth:
+    """一条线路的实时健康度"""
+
+    def __init__(self):
+        self.latency = None       # 成功调用耗时的指数加权平均（秒）
+        self.error_rate = 0.0     # 失败率的指数加权平均
+        self.failures = 0         # 连续失败次数
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency=None, ok=True):
+        self.calls += 1
+        self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA * (0.0 if ok else 1.0)
+        if ok:
+            self.failures = 0
+            self.latency = latency if self.latency is None else (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * latency
+        else:
+            self.errors += 1
+            self.failures += 1
+            self.cooldown_until = time.monotonic() + min(COOLDOWN * 2 ** (self.failures - 1), MAX_COOLDOWN)
+
+    @property
+    def available(self):
+        return self.failures == 0 or time.monotonic() >= self.cooldown_until
+
+    @property
+    def score(self):
+        """越小越好；还没测过的线路为 0，优先试一次"""
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + ERROR_PENALTY * self.error_rate)
+
+
+class TokenBucket:
+    """一个端点的每分钟 token 限额（令牌桶，线程安全）"""
+
+    def __init__(self, tpm):
+        self.capacity = float(tpm)
+        self.tokens = float(tpm)
+        self.rate = tpm / 60.0
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens):
+        """扣减 tokens（超过限额时按限额算），额度不够时等待"""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+    def release(self, tokens):
+        """退回预估多扣的额度"""
+        if tokens > 0:
+            with self.lock:
+                self._refill()
+                self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class ModelRouter:
+    """按角色给出候选线路，并根据实时耗时 / 错误率排序和故障切换（线程安全）"""
+
+    def __init__(self, endpoints=None, roles=None):
+        self.endpoints = {DEFAULT_ENDPOINT: {
+            "base_url": normalize_base_url(os.getenv("QDD_BASE_URL")),
+            "api_key": os.getenv("QDD_API_KEY"),
+        }}
+        for name, spec in (endpoints or {}).items():
+            self.endpoints[name] = {
+                "base_url": normalize_base_url(spec["base_url"]),
+                "api_key": spec.get("api_key") or os.getenv(spec.get("api_key_env", "QDD_API_KEY")),
+            }
+        self.limits = {name: TokenBucket(spec["tpm"]) for name, spec in (endpoints or {}).items() if spec.get("tpm")}
+        self.roles = roles or {}
+        self.health = {}   # 线路名 -> RouteHealth
+        self.clients = {}  # 端点 -> OpenAI 客户端（同一端点的线路共享连接池）
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path=DEFAULT_ROUTES):
+        """读取路由表；文件不存在时只有默认端点"""
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config.get("endpoints"), config.get("roles"))
+
+    # ============ 线路 ============
+    def parse_route(self, spec, default_model):
+        model, _, endpoint = spec.partition("@")
+        endpoint = endpoint or DEFAULT_ENDPOINT
+        if endpoint not in self.endpoints:
+            raise ValueError(f"路由表中没有端点 {endpoint!r}（线路 {spec!r}）")
+        settings = self.endpoints[endpoint]
+        return Route(model or default_model, endpoint, settings["base_url"], settings["api_key"])
+
+    def routes(self, roles, default_model, model=None):
+        """角色的候选线路（按路由表中的顺序）
+
+        roles: 按优先级排列的角色名；model 不为空时强制使用该模型（仍在该角色的各端点之间切换）。
+        """
+        specs = next((self.roles[r] for r in list(roles) + ["default"] if r in self.roles), None)
+        if not specs:
+            specs = [f"{default_model}@{DEFAULT_ENDPOINT}"]
+        routes = [self.parse_route(spec, default_model) for spec in specs]
+        if model:
+            seen, forced = set(), []
+            for route in routes:
+                if route.endpoint not in seen:
+                    seen.add(route.endpoint)
+                    forced.append(Route(model, route.endpoint, route.base_url, route.api_key))
+            routes = forced
+        return routes
+
+    def health_of(self, route):
+        with self.lock:
+            return self.health.setdefault(route.name, RouteHealth())
+
+    def rank(self, routes):
+        """按调用顺序排列候选线路的下标：可用的在前，得分低（快且稳定）的在前，同分时保持路由表顺序"""
+        healths = [self.health_of(route) for route in routes]
+        return sorted(range(len(routes)), key=lambda i: (not healths[i].available, healths[i].score, i))
+
+    def record(self, route, latency=None, ok=True):
+        health = self.health_of(route)
+        with self.lock:
+            health.record(latency, ok)
+
+    # ============ 调用 ============
+    def client(self, route):
+        with self.lock:
+            if route.endpoint not in self.clients:
+                self.clients[route.endpoint] = OpenAI(api_key=route.api_key, base_url=route.base_url)
+            return self.clients[route.endpoint]
+
+    def complete(self, roles, default_model, model=None, estimated_tokens=None, **kwargs):
+        """按排好的顺序调用 chat.completions，失败时换下一条线路；返回 (response, route)，全部失败时抛出最后一个错误
+
+        estimated_tokens: 请求前预估的 token 数（提示词 + max_tokens），端点配置了 tpm 时用于限流
+        """
+        routes = self.routes(roles, default_model, model)
+        last_error = None
+        for i in self.rank(routes):
+            route = routes[i]
+            limit = self.limits.get(route.endpoint) if estimated_tokens else None
+            if limit:
+                limit.acquire(estimated_tokens)
+            start = time.perf_counter()
+            try:
+                response = self.client(route).chat.completions.create(model=route.model, **kwargs)
+            except Exception as e:
+                self.record(route, ok=False)
+                if limit:
+                    limit.release(estimated_tokens)
+                last_error = e
+                continue
+            self.record(route, time.perf_counter() - start)
+            usage = getattr(response, "usage", None)
+            if limit and usage and usage.total_tokens:
+                limit.release(estimated_tokens - usage.total_tokens)
+            return response, route
+        raise last_error
+
+    def print_summary(self):
+        """打印各线路的调用次数、错误、平均耗时和限流等待（只用到一条线路且没有错误、没有等待时不打印）"""
+        with self.lock:
+            rows = sorted(self.health.items())
+        throttled = {name: limit.waited for name, limit in self.limits.items() if limit.waited}
+        if len(rows) <= 1 and not any(h.errors for _, h in rows) and not throttled:
+            return
+        print("\n" + "="*70)
+        print("🛣️ 模型线路")
+        print("="*70)
+        for name, health in rows:
+            latency = f"{health.latency:.2f}s" if health.latency is not None else "-"
+            state = "" if health.available else "（暂停中）"
+            print(f"{name:<40}调用 {health.calls:>4}  失败 {health.errors:>3}  平均耗时 {latency}{state}")
+        for name, waited in sorted(throttled.items()):
+            print(f"⏳ 端点 {name} 因每分钟 token 限额共等待 {waited:.1f}s")
+        print("="*70)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """进程内共享的路由器（第一次使用时读取路由表）"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter.from_config()
+        return _router
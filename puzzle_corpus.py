@@ -0,0 +1,266 @@
+# 海龟汤题库：从磁盘加载成千上万道题，启动耗时与题库大小无关
+#
+# 题库是 JSONL 文件，每行一道题：
+#   {"title": "海龟汤", "story": "...", "answer": "...", "tags": ["经典", "死亡"], "difficulty": 2}
+#
+# 第一次打开时在旁边建一个 SQLite 索引（<题库>.index.sqlite）：每道题在文件中的偏移和长度、标题、难度、标签，
+# 以及这道题主持人提示词的 token 数（提示词本身取题时由模板重新生成，不占索引空间）。之后打开题库只是 mmap 题库文件 + 连接索引，不读取任何题目；
+# 题库文件的大小 / 修改时间、或者主持人提示词模板变了时自动重建索引。
+#
+# 选题都是常数次索引查找，只解析选中的那一行：
+#   - 按标题：标题 -> 偏移
+#   - 随机：题目按 1..N 连续编号，随机取一个编号
+#   - 按标签 / 难度随机：每个分组（"tag:经典"、"difficulty:2"）里的题目也连续编号，随机取一个分组内序号
+# 没有指定题库时使用内置的四道题（BUILTIN_PUZZLES，索引建在内存里）。
+import json
+import mmap
+import os
+import random
+import sqlite3
+import threading
+
+from token_accounting import content_key, count_tokens
+
+DEFAULT_CORPUS = os.getenv("QDD_PUZZLE_CORPUS")  # 为空时使用内置题目
+INDEX_VERSION = 1
+MAX_FILTER_TRIES = 32  # 同时按标签和难度筛选时，在较小的分组里随机抽几次
+
+BUILTIN_PUZZLES = [
+    {
+        "title": "海龟汤",
+        "story": "一个男人在餐厅点了一碗海龟汤，喝了一口后就自杀了。为什么？",
+        "answer": """这个男人曾经和朋友一起遇到海难，漂流到荒岛上。朋友为了救他，割下自己的肉做成汤给他喝，谎称是海龟汤。后来获救了，男人在餐厅喝到真正的海龟汤，发现味道完全不同，意识到当年朋友牺牲了自己，愧疚之下自杀了。"""
+    },
+    {
+        "title": "推理之夜",
+        "story": "一个女人在深夜回家，发现家里所有的灯都灭了。她打开灯后立刻大哭起来。为什么？",
+        "answer": """这个女人是灯塔看守人。她回家前忘记检查灯塔的灯，晚上灯塔灯灭了导致一艘船撞上礁石沉没。当她意识到这一点时，崩溃大哭。"""
+    },
+    {
+        "title": "电梯悬案",
+        "story": "一个矮个子男人每天坐电梯上楼，晴天时他坐到15楼然后走楼梯到20楼，雨天时他直接坐到20楼。为什么？",
+        "answer": """这个男人是侏儒，够不到20楼的按钮，只能按到15楼。雨天时他带着雨伞，可以用雨伞按到20楼的按钮。"""
+    },
+    {
+        "title": "午夜来电",
+        "story": "一个男人半夜接到电话，听到一声「喂」后挂断，然后他就自杀了。为什么？",
+        "answer": """这个男人是盲人，他的妻子多年前出车祸昏迷成植物人。他每天都给妻子打电话，护士会把电话放在妻子耳边。这天半夜妻子突然醒了，自己接电话说了「喂」。但男人以为是恶作剧或者护士懒得帮忙，愤怒地挂断了电话。妻子以为丈夫不要她了，伤心地拔掉氧气管自杀了。第二天男人得知真相后，愧疚自杀。"""
+    }
+]
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE puzzles (
+    id INTEGER PRIMARY KEY,      -- 1..N 连续编号
+    title TEXT UNIQUE NOT NULL,
+    difficulty INTEGER,
+    offset INTEGER NOT NULL,     -- 在题库文件中的字节偏移和长度
+    length INTEGER NOT NULL,
+    host_tokens INTEGER
+);
+CREATE TABLE groups (name TEXT NOT NULL, seq INTEGER NOT NULL, puzzle_id INTEGER NOT NULL, PRIMARY KEY (name, seq)) WITHOUT ROWID;
+CREATE TABLE group_sizes (name TEXT PRIMARY KEY, size INTEGER NOT NULL);
+CREATE INDEX groups_by_puzzle ON groups (puzzle_id, name);
+"""
+
+
+def index_path(path):
+    return f"{path}.index.sqlite"
+
+
+def prompt_version(host_prompt):
+    """主持人提示词模板的指纹：模板变了，预先生成的提示词就要重建"""
+    if host_prompt is None:
+        return ""
+    probe = {"title": "{title}", "story": "{story}", "answer": "{answer}", "tags": [], "difficulty": None}
+    return content_key(host_prompt(probe)).hex()
+
+
+def group_names(puzzle):
+    names = [f"tag:{tag}" for tag in puzzle.get("tags") or []]
+    if puzzle.get("difficulty") is not None:
+        names.append(f"difficulty:{int(puzzle['difficulty'])}")
+    return names
+
+
+class PuzzleCorpus:
+    """一个题库（只读，线程安全）
+
+    host_prompt: 由题目生成主持人提示词的函数（各脚本的 create_host_prompt），建索引时预先计算每道题提示词的 token 数
+    取出的题目是 dict：题库里的字段，加上 host_prompt / host_tokens（给了 host_prompt 时）。
+    """
+
+    def __init__(self, path=None, host_prompt=None, model=None):
+        self.path = path
+        self.host_prompt = host_prompt
+        self.model = model
+        self.version = prompt_version(host_prompt)
+        self.lock = threading.Lock()
+        if path is None:
+            self.data = "\n".join(json.dumps(p, ensure_ascii=False) for p in BUILTIN_PUZZLES).encode("utf-8")
+            self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self._build(self.conn, self.data)
+        else:
+            self.data = self._map(path)
+            self.conn = self._open_index(path)
+        self.size = self.conn.execute("SELECT count(*) FROM puzzles").fetchone()[0]
+
+    # ============ 索引 ============
+    @staticmethod
+    def _map(path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)  # 关闭文件后映射仍然有效
+
+    def _stamp(self, path):
+        stat = os.stat(path)
+        return {"index_version": str(INDEX_VERSION), "size": str(stat.st_size), "mtime": str(stat.st_mtime_ns),
+                "prompt_version": self.version, "model": self.model or ""}
+
+    def _open_index(self, path):
+        stamp = self._stamp(path)
+        target = index_path(path)
+        if os.path.exists(target):
+            conn = sqlite3.connect(target, check_same_thread=False)
+            try:
+                if dict(conn.execute("SELECT key, value FROM meta")) == stamp:
+                    return conn
+            except sqlite3.DatabaseError:
+                pass
+            conn.close()
+        # 建到临时文件再替换，其他进程不会读到建了一半的索引
+        tmp = f"{target}.{os.getpid()}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        conn = sqlite3.connect(tmp)
+        self._build(conn, self.data)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", stamp.items())
+        conn.commit()
+        conn.close()
+        os.replace(tmp, target)
+        return sqlite3.connect(target, check_same_thread=False)
+
+    def _build(self, conn, data):
+        """扫描一遍题库，写入偏移、分组和预先生成的主持人提示词"""
+        conn.executescript(SCHEMA)
+        sizes = {}
+        offset, puzzle_id, skipped = 0, 0, 0
+        total = len(data)
+        while offset < total:
+            end = data.find(b"\n", offset)
+            end = total if end < 0 else end
+            line = data[offset:end].strip()
+            if line:
+                try:
+                    puzzle = json.loads(line)
+                    title = puzzle["title"]
+                except (ValueError, KeyError, TypeError):
+                    skipped += 1
+                else:
+                    if conn.execute("SELECT 1 FROM puzzles WHERE title = ?", (title,)).fetchone():
+                        skipped += 1  # 重复的标题只保留第一道
+                    else:
+                        puzzle_id += 1
+                        prompt = self.host_prompt(puzzle) if self.host_prompt else None
+                        conn.execute(
+                            "INSERT INTO puzzles VALUES (?, ?, ?, ?, ?, ?)",
+                            (puzzle_id, title, puzzle.get("difficulty"), offset, end - offset,
+                             count_tokens(prompt, self.model) if prompt else None),
+                        )
+                        for name in group_names(puzzle):
+                            conn.execute("INSERT INTO groups VALUES (?, ?, ?)", (name, sizes.get(name, 0), puzzle_id))
+                            sizes[name] = sizes.get(name, 0) + 1
+            offset = end + 1
+        conn.executemany("INSERT INTO group_sizes VALUES (?, ?)", sizes.items())
+        conn.commit()
+        if skipped:
+            print(f"⚠️ 题库中有 {skipped} 行无法解析或标题重复，已跳过")
+
+    # ============ 选题 ============
+    def __len__(self):
+        return self.size
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def _load(self, row):
+        puzzle_id, offset, length, tokens = row
+        puzzle = json.loads(self.data[offset:offset + length].decode("utf-8"))
+        if self.host_prompt:
+            puzzle["host_prompt"] = self.host_prompt(puzzle)
+            puzzle["host_tokens"] = tokens
+        return puzzle
+
+    def _by_id(self, puzzle_id):
+        return self._load(self._query(
+            "SELECT id, offset, length, host_tokens FROM puzzles WHERE id = ?", (puzzle_id,)))
+
+    def get(self, title):
+        """按标题取一道题"""
+        row = self._query("SELECT id, offset, length, host_tokens FROM puzzles WHERE title = ?", (title,))
+        if row is None:
+            raise ValueError(f"未找到题目: {title}")
+        return self._load(row)
+
+    def titles(self, limit=None):
+        """按题库中的顺序列出标题（limit 为空时全部列出）"""
+        with self.lock:
+            rows = self.conn.execute("SELECT title FROM puzzles ORDER BY id LIMIT ?", (-1 if limit is None else limit,))
+            return [title for title, in rows]
+
+    def groups(self, prefix=""):
+        """各分组的题目数，如 groups("tag:") -> {"tag:经典": 120, ...}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT name, size FROM group_sizes WHERE name >= ? AND name < ?",
+                                     (prefix, prefix + "\U0010ffff"))
+            return dict(rows)
+
+    def _pick(self, name, rng):
+        row = self._query("SELECT size FROM group_sizes WHERE name = ?", (name,))
+        if row is None:
+            return None
+        return self._query("SELECT puzzle_id FROM groups WHERE name = ? AND seq = ?", (name, rng.randrange(row[0])))[0]
+
+    def random(self, tag=None, difficulty=None, rng=random):
+        """随机取一道题，可以按标签和（或）难度筛选；没有符合条件的题目时抛出 ValueError"""
+        names = ([f"tag:{tag}"] if tag else []) + ([f"difficulty:{int(difficulty)}"] if difficulty is not None else [])
+        if not names:
+            if not self.size:
+                raise ValueError("题库是空的")
+            return self._by_id(rng.randint(1, self.size))
+        sizes = {name: (self._query("SELECT size FROM group_sizes WHERE name = ?", (name,)) or (0,))[0] for name in names}
+        smallest = min(names, key=sizes.get)
+        if len(names) == 1 or not sizes[smallest]:
+            puzzle_id = self._pick(smallest, rng)
+        else:
+            # 两个条件：在较小的分组里抽样检查另一个条件，抽不中再用一次查询兜底
+            other = max(names, key=sizes.get)
+            puzzle_id = None
+            for _ in range(MAX_FILTER_TRIES):
+                candidate = self._pick(smallest, rng)
+                if self._query("SELECT 1 FROM groups WHERE name = ? AND puzzle_id = ?", (other, candidate)):
+                    puzzle_id = candidate
+                    break
+            if puzzle_id is None:
+                row = self._query(
+                    "SELECT a.puzzle_id FROM groups a JOIN groups b ON a.puzzle_id = b.puzzle_id "
+                    "WHERE a.name = ? AND b.name = ? ORDER BY random() LIMIT 1", (smallest, other))
+                puzzle_id = row[0] if row else None
+        if puzzle_id is None:
+            raise ValueError(f"没有符合条件的题目（{'，'.join(names)}）")
+        return self._by_id(puzzle_id)
+
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+
+def open_corpus(path=DEFAULT_CORPUS, host_prompt=None, model=None):
+    """打开题库（同一进程内按路径共享）；path 为空时使用内置题目"""
+    key = (os.path.abspath(path) if path else None, host_prompt, model)
+    with _corpora_lock:
+        if key not in _corpora:
+            _corpora[key] = PuzzleCorpus(path, host_prompt, model)
+        return _corpora[key]
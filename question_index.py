@@ -0,0 +1,106 @@
+# 海龟汤的提问识别与去重
+#
+# 玩家的发言里只有 "【向主持人提问】" 后面那一句是真正的问题：extract_question 只取这一句，
+# 取不到格式正确的问题就不调用主持人。
+# QuestionIndex 记录本局已经问过的问题和主持人的回答：规范化后完全相同、或字符 n-gram 相似度
+# 足够高的问题视为重复，直接沿用之前的回答，不再调用模型。
+import re
+import unicodedata
+
+MARKER = re.compile(r"【?向主持人提问】?\s*[:：]?\s*")
+QUESTION_END = re.compile(r"[？?]")
+MIN_QUESTION_CHARS = 3
+MAX_QUESTION_CHARS = 80
+
+# 规范化时去掉的提问套话（不影响问题的含义）
+FILLERS = ["请问", "主持人", "我想问", "我想知道", "我问一下"]
+# 正反问改写成陈述："他是不是吃过人肉" → "他是吃过人肉"
+PATTERNS = [("是不是", "是"), ("是否", "是"), ("有没有", "有"), ("会不会", "会"), ("能不能", "能"), ("对不对", "")]
+TRAILING_PARTICLES = "吗呢吧啊呀么"
+# 否定词不同的两个问题即使字面很像也不算重复（"是海龟汤" / "不是海龟汤"）
+NEGATIONS = set("不没无非未别")
+
+NGRAM = 2
+SIMILARITY_THRESHOLD = 0.8
+
+
+def extract_question(text):
+    """从玩家发言中取出向主持人提的问题；没有格式正确的问题时返回 None"""
+    match = MARKER.search(text or "")
+    if not match:
+        return None
+    rest = text[match.end():]
+    end = QUESTION_END.search(rest)
+    question = rest[:end.end()] if end else rest.split("\n", 1)[0]
+    question = question.strip().strip("*_\"'“”")
+    core = normalize(question)
+    if not MIN_QUESTION_CHARS <= len(core) <= MAX_QUESTION_CHARS:
+        return None
+    return question
+
+
+def normalize(question):
+    """规范化问题：全半角统一、去掉标点空白和提问套话、正反问改写成陈述"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = "".join(ch for ch in text if not unicodedata.category(ch).startswith(("P", "Z", "S")))
+    for filler in FILLERS:
+        if text.startswith(filler):
+            text = text[len(filler):]
+    for pattern, replacement in PATTERNS:
+        text = text.replace(pattern, replacement)
+    return text.rstrip(TRAILING_PARTICLES)
+
+
+def ngrams(text):
+    if len(text) < NGRAM:
+        return {text}
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class QuestionIndex:
+    """一局游戏中已经问过的问题 → 主持人的回答"""
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.entries = []   # [(规范化问题, n-gram 集合, 原问题, 回答)]
+        self.exact = {}     # 规范化问题 -> entries 下标
+        self.postings = {}  # n-gram -> entries 下标集合（只和至少共享一个 n-gram 的问题比较）
+        self.reused = 0
+
+    def lookup(self, question):
+        """返回与 question 重复的 (原问题, 回答)；没有时返回 None"""
+        key = normalize(question)
+        if key in self.exact:
+            self.reused += 1
+            _, _, asked, answer = self.entries[self.exact[key]]
+            return asked, answer
+
+        grams = ngrams(key)
+        negations = NEGATIONS & set(key)
+        candidates = set()
+        for gram in grams:
+            candidates |= self.postings.get(gram, set())
+        best, best_score = None, self.threshold
+        for i in candidates:
+            other_key, other_grams, _, _ = self.entries[i]
+            if NEGATIONS & set(other_key) != negations:
+                continue
+            score = len(grams & other_grams) / len(grams | other_grams)
+            if score >= best_score:
+                best, best_score = i, score
+        if best is None:
+            return None
+        self.reused += 1
+        _, _, asked, answer = self.entries[best]
+        return asked, answer
+
+    def add(self, question, answer):
+        key = normalize(question)
+        if key in self.exact:
+            return
+        grams = ngrams(key)
+        index = len(self.entries)
+        self.entries.append((key, grams, question, answer))
+        self.exact[key] = index
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(index)
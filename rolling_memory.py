@@ -0,0 +1,123 @@
+# 滚动摘要记忆：长会话的提示词大小保持不变，又不丢掉早先确认的关键事实
+#
+# message_window_size / token_limit 超出后直接丢弃最早的消息；海龟汤的原始历史则无限增长。
+# RollingMemory 把一份对话历史切成三段发给模型：
+#
+#   固定保留的开头（系统提示词） + 之前对话的摘要 + 预算内最近的消息（原文）
+#
+# 总 token 数不超过 budget（其中 summary_share 留给摘要）。滑出窗口的消息由 summarize 增量合并进摘要，
+# 合并在后台线程里进行：每次取提示词时，除了本次需要的窗口，还会把"再过几轮就要滑出窗口"的消息
+# （按 HEADROOM 预留）提前交给后台，所以通常轮到下一次调用时摘要已经准备好，不占用关键路径；
+# 后台没跟上时才会等待，仍然失败时同步补做一次。
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from token_accounting import TokenLedger
+
+SUMMARY_SHARE = 0.25  # 预算中留给摘要的比例
+HEADROOM = 0.25       # 提前摘要：窗口超过预算的 (1 - HEADROOM) 时就把最早的消息交给后台
+SUMMARY_HEADER = "【之前对话的摘要】\n"
+SUMMARY_PROMPT = (
+    "你负责为一段多人对话维护摘要。下面是目前的摘要和新增的对话，请输出更新后的完整摘要：\n"
+    "1. 已经确认的事实（尤其是主持人对每个问题的判定）必须逐条保留，不能改写结论\n"
+    "2. 保留各方的主要观点、已经排除的方向和尚未解决的问题\n"
+    "3. 删掉寒暄和重复的内容，只输出摘要本身\n"
+)
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="summary")
+
+
+def summary_request(summary, messages):
+    """生成摘要时发给模型的消息（messages 为新滑出窗口的 {"role", "content"} 消息）"""
+    dialogue = "\n".join(f"[{m['role']}] {m['content']}" for m in messages)
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"目前的摘要：\n{summary or '（无）'}\n\n新增的对话：\n{dialogue}"},
+    ]
+
+
+class RollingMemory:
+    """一份只追加的对话历史的滚动摘要（线程安全）
+
+    summarize(之前的摘要, 新滑出窗口的消息, 这些消息的结束位置) -> 新摘要；出错时抛出异常。
+    pinned: 历史开头固定保留的消息条数（系统提示词）
+    """
+
+    def __init__(self, summarize, budget, pinned=1, summary_share=SUMMARY_SHARE):
+        self.summarize = summarize
+        self.budget = budget
+        self.summary_budget = int(budget * summary_share)
+        self.pinned = pinned
+        self.summary = ""
+        self.covered = pinned    # 摘要已经覆盖 messages[pinned:covered]
+        self.pending = None      # 后台摘要任务
+        self.pending_end = None  # 后台任务完成后摘要覆盖到的位置
+        self.summaries = 0
+        self.ledger = TokenLedger()  # 历史的 token 计数（每条消息只计一次）
+        self.lock = threading.Lock()
+
+    def window_start(self, messages, limit):
+        """在 limit 内（扣除固定开头和摘要预留）能原样保留的最早一条消息的下标；最新一条总是保留"""
+        self.ledger.sync(messages)  # 末尾可能是临时追加的提示（起草时），变了会重新计数
+        pinned = min(self.pinned, len(messages))
+        available = limit - self.summary_budget - self.ledger.total(0, pinned)
+        start = self.ledger.fit(max(available, 0), pinned)
+        return max(min(start, len(messages) - 1), self.pinned)
+
+    def plan(self, messages):
+        """返回 (摘要, 原样保留的第一条消息的下标)，并在后台提前摘要即将滑出窗口的消息
+
+        每次摘要哪些消息只取决于历史本身、与后台任务的快慢无关，所以从存档恢复时摘要调用也能按原样回放。
+        """
+        with self.lock:
+            start = self.window_start(messages, self.budget)
+            ahead = max(self.window_start(messages, int(self.budget * (1 - HEADROOM))), start)
+            if self.pending is not None and (start > self.covered or ahead > self.pending_end):
+                # 本次需要的部分还没进摘要，或者又有消息要交给后台：先等上一个任务（通常早已完成）
+                self._wait()
+            if start > self.covered:
+                # 后台没有覆盖到（第一次或者后台失败）：同步补上
+                try:
+                    self._apply(self.summarize(self.summary, messages[self.covered:start], start), start)
+                except Exception as e:  # 摘要失败时这部分消息只能丢弃，但不影响本次调用
+                    print(f"   ⚠️ 摘要失败: {type(e).__name__}: {e}")
+                    self.covered = start
+            if ahead > self.covered and self.pending is None:
+                self.pending = _executor.submit(self._background, messages[self.covered:ahead], ahead)
+                self.pending_end = ahead
+            return self.summary, start
+
+    def messages(self, messages):
+        """发给模型的消息列表（{"role", "content"} 形式的历史）"""
+        summary, start = self.plan(messages)
+        head = list(messages[:self.pinned])
+        if summary:
+            head.append({"role": "user", "content": SUMMARY_HEADER + summary})
+        return head + list(messages[start:])
+
+    def wait(self):
+        """等待进行中的后台摘要（结束会话前调用）"""
+        with self.lock:
+            self._wait()
+
+    def _wait(self):
+        if self.pending is None:
+            return
+        pending, self.pending = self.pending, None
+        self.lock.release()  # 后台任务完成时要写 summary，不能持锁等待
+        try:
+            pending.result()
+        except Exception as e:
+            print(f"   ⚠️ 后台摘要失败: {type(e).__name__}: {e}")
+        finally:
+            self.lock.acquire()
+
+    def _background(self, chunk, end):
+        summary = self.summarize(self.summary, chunk, end)  # 任务完成前 summary 不会变（同步补做会先等它）
+        with self.lock:
+            self._apply(summary, end)
+
+    def _apply(self, summary, end):
+        self.summary = summary.strip()
+        self.covered = end
+        self.summaries += 1
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# 批量运行分析：从转录库（或 transcript_export.py 导出的列式文件）读取所有会话，用 pandas / NumPy 向量化汇总
+#
+# 输出的汇总表：
+#   overview   各场景的会话数、发言数、token、成本
+#   growth     每轮输入 token 的增长（均值 / 中位数 / P90），以及每场景每轮平均增长多少 token
+#   puzzles    海龟汤每道题的破解率、平均轮数、每次成功破解的成本（含失败对局的花费）
+#   latency    各场景各角色的耗时分位数（P50 / P90 / P99）
+#   knobs      message_window_size / token_limit / max_messages 等配置对 token、成本、成功率的影响
+#
+# 价格按每 1K token 计，与 TokenCounter.print_summary 的默认估算一致，可以按模型单独指定。
+#
+# 用法示例：
+#   python run_analytics.py
+#   python run_analytics.py --source exports/ --table growth --table knobs
+#   python run_analytics.py --price 0.001,0.002 --model-price gpt-4o=0.0025,0.01 --csv-dir reports/
+import argparse
+import json
+import os
+import sqlite3
+
+from transcript_store import DEFAULT_DB
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:  # 分析是可选功能，对话脚本本身不依赖 pandas
+    np = pd = None
+
+DEFAULT_PRICE = (0.001, 0.002)  # 输入 / 输出，美元每 1K token
+TURN_COLUMNS = ["session_id", "scenario", "turn_index", "role", "model",
+                "prompt_tokens", "completion_tokens", "latency", "finish_reason"]
+SESSION_COLUMNS = ["session_id", "scenario", "model", "status", "outcome", "config"]
+KNOBS = ["message_window_size", "token_limit", "max_messages"]
+
+
+# ============ 读取数据 ============
+def load_frames(source):
+    """读取 (turns, sessions) 两张表；source 为转录库文件或导出目录。不读取发言内容，节省内存"""
+    if os.path.isdir(source):
+        return load_exported(source)
+    conn = sqlite3.connect(source)
+    try:
+        turns = pd.read_sql_query(f"SELECT {', '.join(TURN_COLUMNS)} FROM turns", conn)
+        sessions = pd.read_sql_query(f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions", conn)
+    finally:
+        conn.close()
+    return turns, sessions
+
+
+def load_exported(directory):
+    def read(name, columns):
+        path = os.path.join(directory, f"{name}.parquet")
+        if os.path.exists(path):
+            return pd.read_parquet(path, columns=columns)
+        import pyarrow as pa
+        with pa.memory_map(os.path.join(directory, f"{name}.arrow")) as source:
+            return pa.ipc.open_file(source).read_all().select(columns).to_pandas()
+
+    return read("turns", TURN_COLUMNS), read("sessions", SESSION_COLUMNS)
+
+
+def config_knobs(config):
+    """从会话配置 JSON 中取出上下文相关的配置项
+
+    camel 场景的配置是 {角色: {...}}，各角色取值不同时用 "/" 连接；海龟汤的配置是平铺的。
+    """
+    if not config:
+        return {}
+    config = json.loads(config)
+    knobs = {}
+    if all(isinstance(v, dict) for v in config.values()):
+        for knob in KNOBS:
+            values = sorted({str(agent[knob]) for agent in config.values() if agent.get(knob) is not None})
+            if values:
+                knobs[knob] = "/".join(values)
+    else:
+        for knob in KNOBS + ["puzzle"]:
+            if config.get(knob) is not None:
+                knobs[knob] = str(config[knob])
+    return knobs
+
+
+def prepare(turns, sessions, price, model_prices):
+    """补充每轮成本、轮次编号，以及会话级的配置项和合计"""
+    turns = turns.sort_values(["session_id", "turn_index"], kind="stable").reset_index(drop=True)
+
+    # 成本：按模型查价格，没有单独指定的用默认价格
+    models = turns["model"].fillna("")
+    input_price = models.map(lambda m: model_prices.get(m, price)[0]).to_numpy(dtype=float)
+    output_price = models.map(lambda m: model_prices.get(m, price)[1]).to_numpy(dtype=float)
+    prompt = turns["prompt_tokens"].to_numpy(dtype=float)
+    completion = turns["completion_tokens"].to_numpy(dtype=float)
+    turns["cost"] = np.nan_to_num(prompt) / 1000 * input_price + np.nan_to_num(completion) / 1000 * output_price
+
+    # 轮次：会话内第几次模型调用（开场白、人类输入等没有 token 的发言不计）
+    called = turns["prompt_tokens"].notna()
+    turns["round"] = pd.Series(pd.NA, index=turns.index, dtype="Int64")
+    turns.loc[called, "round"] = turns[called].groupby("session_id").cumcount() + 1
+
+    knobs = pd.DataFrame([config_knobs(c) for c in sessions["config"]], index=sessions.index)
+    sessions = pd.concat([sessions.drop(columns=["config"]), knobs], axis=1)
+    for column in KNOBS + ["puzzle"]:
+        if column not in sessions:
+            sessions[column] = None
+
+    totals = turns.groupby("session_id").agg(
+        turns=("role", "size"),
+        rounds=("round", "max"),
+        prompt_tokens=("prompt_tokens", "sum"),
+        completion_tokens=("completion_tokens", "sum"),
+        cost=("cost", "sum"),
+        latency=("latency", "sum"),
+    )
+    sessions = sessions.join(totals, on="session_id")
+    for column in ["turns", "rounds", "prompt_tokens", "completion_tokens"]:
+        sessions[column] = sessions[column].round().astype("Int64")
+    return turns, sessions
+
+
+# ============ 汇总表 ============
+def overview_table(turns, sessions):
+    table = sessions.groupby("scenario").agg(
+        sessions=("session_id", "size"),
+        completed=("status", lambda s: int((s == "completed").sum())),
+        turns=("turns", "sum"),
+        prompt_tokens=("prompt_tokens", "sum"),
+        completion_tokens=("completion_tokens", "sum"),
+        cost=("cost", "sum"),
+        cost_per_session=("cost", "mean"),
+    )
+    return table
+
+
+def growth_table(turns, sessions):
+    """每轮输入 token 的分布；slope 为该场景每多一轮平均多出的输入 token（最小二乘）"""
+    called = turns[turns["round"].notna()]
+    table = called.groupby(["scenario", "round"])["prompt_tokens"].agg(
+        sessions="size",
+        mean="mean",
+        median="median",
+        p90=lambda s: np.percentile(s, 90),
+    )
+    x = called["round"].to_numpy(dtype=float)
+    y = called["prompt_tokens"].to_numpy(dtype=float)
+    frame = pd.DataFrame({"scenario": called["scenario"].to_numpy(), "x": x, "y": y, "xy": x * y, "xx": x * x})
+    sums = frame.groupby("scenario").agg(n=("x", "size"), x=("x", "sum"), y=("y", "sum"), xy=("xy", "sum"), xx=("xx", "sum"))
+    denominator = sums["n"] * sums["xx"] - sums["x"] ** 2
+    slope = (sums["n"] * sums["xy"] - sums["x"] * sums["y"]) / denominator.replace(0, np.nan)
+    table = table.join(slope.rename("slope_per_round"), on="scenario")
+    return table
+
+
+def puzzle_table(turns, sessions):
+    """海龟汤：每道题的破解率和每次成功破解的成本（失败对局的花费也算进去）"""
+    games = sessions[sessions["scenario"].str.startswith("turtle_soup")].copy()
+    if games.empty:
+        return pd.DataFrame()
+    games["solved"] = games["outcome"] == "solved"
+    # 破解用的轮数按玩家发言计（主持人回答不单独算一轮）
+    player_rounds = turns[turns["round"].notna() & (turns["role"] != "主持人")].groupby("session_id").size()
+    games["player_rounds"] = games["session_id"].map(player_rounds)
+    table = games.groupby(["scenario", "puzzle"]).agg(
+        games=("session_id", "size"),
+        solved=("solved", "sum"),
+        total_cost=("cost", "sum"),
+    )
+    table["solve_rate"] = table["solved"] / table["games"]
+    table["cost_per_solved"] = table["total_cost"] / table["solved"].replace(0, np.nan)
+    table["rounds_to_solve"] = games[games["solved"]].groupby(["scenario", "puzzle"])["player_rounds"].mean()
+    return table
+
+
+def latency_table(turns, sessions):
+    timed = turns[turns["latency"].notna()]
+    grouped = timed.groupby(["scenario", "role"])["latency"]
+    table = grouped.quantile([0.5, 0.9, 0.99]).unstack()
+    table.columns = ["p50", "p90", "p99"]
+    table.insert(0, "calls", grouped.size())
+    table["mean"] = grouped.mean()
+    return table
+
+
+def knob_table(turns, sessions):
+    """按上下文配置分组，比较每轮输入 token、末轮输入 token、成本和成功率"""
+    called = turns[turns["round"].notna()]
+    last_prompt = called.groupby("session_id")["prompt_tokens"].last().rename("last_prompt_tokens")
+    frame = sessions.join(last_prompt, on="session_id")
+    frame["success"] = np.where(
+        frame["scenario"].str.startswith("turtle_soup"),
+        frame["outcome"] == "solved",
+        frame["status"] == "completed",
+    )
+    frame["prompt_per_round"] = frame["prompt_tokens"] / frame["rounds"]
+    keys = ["scenario"] + KNOBS
+    frame[KNOBS] = frame[KNOBS].fillna("-")
+    return frame.groupby(keys).agg(
+        sessions=("session_id", "size"),
+        prompt_per_round=("prompt_per_round", "mean"),
+        last_prompt_tokens=("last_prompt_tokens", "mean"),
+        cost_per_session=("cost", "mean"),
+        success_rate=("success", "mean"),
+        latency_per_session=("latency", "mean"),
+    )
+
+
+TABLES = {
+    "overview": ("📊 场景概览", overview_table),
+    "growth": ("📈 每轮输入 token 增长", growth_table),
+    "puzzles": ("🐢 海龟汤破解成本", puzzle_table),
+    "latency": ("⏱️ 各角色耗时分位数（秒）", latency_table),
+    "knobs": ("🎛️ 上下文配置的影响", knob_table),
+}
+
+
+def parse_price(text):
+    input_price, output_price = (float(v) for v in text.split(","))
+    return input_price, output_price
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量运行的 token / 成本 / 耗时分析")
+    parser.add_argument("--source", default=DEFAULT_DB, help=f"转录库文件或导出目录（默认 {DEFAULT_DB}）")
+    parser.add_argument("--table", action="append", choices=sorted(TABLES), help="只输出指定的表，可重复（默认全部）")
+    parser.add_argument("--price", type=parse_price, default=DEFAULT_PRICE, help="默认价格 \"输入,输出\"（美元每 1K token）")
+    parser.add_argument("--model-price", action="append", default=[], help="按模型指定价格，如 \"gpt-4o=0.0025,0.01\"，可重复")
+    parser.add_argument("--csv-dir", default=None, help="同时把每张表写成 CSV")
+    args = parser.parse_args()
+
+    if pd is None:
+        raise SystemExit("分析需要 pandas 和 numpy，请先安装：uv sync --extra analytics（或 pip install pandas numpy）")
+    model_prices = {}
+    for spec in args.model_price:
+        model, _, price = spec.partition("=")
+        model_prices[model] = parse_price(price)
+
+    turns, sessions = load_frames(args.source)
+    if turns.empty:
+        raise SystemExit(f"{args.source} 中没有发言记录")
+    turns, sessions = prepare(turns, sessions, args.price, model_prices)
+
+    if args.csv_dir:
+        os.makedirs(args.csv_dir, exist_ok=True)
+    with pd.option_context("display.width", 200, "display.max_rows", 200, "display.float_format", "{:,.4f}".format):
+        for name in args.table or TABLES:
+            title, build = TABLES[name]
+            table = build(turns, sessions)
+            print("\n" + "="*70)
+            print(title)
+            print("="*70)
+            print(table.to_string() if not table.empty else "（无数据）")
+            if args.csv_dir and not table.empty:
+                table.to_csv(os.path.join(args.csv_dir, f"{name}.csv"))
+    print("="*70)
+    print(f"共 {len(sessions)} 个会话、{len(turns)} 条发言")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# 从存档分叉：在任意一轮把已保存的会话分成 K 个分支，用不同的 seed / temperature / 模型并发继续
+#
+# 分叉点之前的记录只在父存档里存一份，每个分支的存档只引用父存档并追加自己的新记录；
+# 分支运行时前缀直接回放（不调用模型），因此探索 K 种走向只需要 N + K×剩余轮数 次调用。
+#
+# 用法示例：
+#   python session_fork.py checkpoints/turtle_soup.jsonl --list                 # 查看存档中的每条记录
+#   python session_fork.py checkpoints/turtle_soup.jsonl --before "7:柯南" -k 4  # 柯南第 7 轮重新提问，4 个 seed
+#   python session_fork.py checkpoints/debate.jsonl --at 6 \
+#       --branch "temperature=0.3" --branch "temperature=1.2" --branch "model=gpt-4o-mini,seed=7"
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from checkpoint import fork_checkpoint, read_checkpoint
+from puzzle_corpus import DEFAULT_CORPUS
+from session_runner import SCENARIOS, TranscriptWriter, load_scenario
+
+TURTLE_SOUP = "turtle_soup"
+BRANCH_FIELDS = {"seed": int, "temperature": float, "model": str}
+TURTLE_SOUP_OPTIONS = {"seed": "seed", "temperature": "temperature", "model": "model_id"}  # 分支字段 -> GameSession 参数
+
+
+def parse_branch(spec):
+    """解析分支配置，如 "seed=1,temperature=0.9,model=gpt-4o-mini" """
+    branch = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in BRANCH_FIELDS or not value:
+            raise ValueError(f"无法解析分支配置 {item!r}（可用字段: {', '.join(BRANCH_FIELDS)}）")
+        branch[name] = BRANCH_FIELDS[name](value.strip())
+    return branch
+
+
+def branch_options(options, branch):
+    """海龟汤分支实际使用的 GameSession 参数：父会话的参数，分支指定的 seed / temperature / model 覆盖之"""
+    options = dict(options or {})
+    options.update((TURTLE_SOUP_OPTIONS[name], value) for name, value in branch.items())
+    return options
+
+
+def preview(value, width=60):
+    """记录内容的单行预览"""
+    text = value.get("content", "") if isinstance(value, dict) else str(value)
+    text = " ".join(text.split())
+    return text if len(text) <= width else text[:width] + "..."
+
+
+def list_records(path):
+    meta, records = read_checkpoint(path)
+    print(f"📂 {path}")
+    print(f"   {meta}")
+    for i, (key, value) in enumerate(records):
+        print(f"   [{i:3d}] {key:<16} {preview(value)}")
+    print(f"\n共 {len(records)} 条记录；--at N 保留前 N 条，--before KEY 保留 KEY 之前的记录")
+
+
+def resolve_fork_at(records, at=None, before=None):
+    """确定分叉位置（保留的记录数）；都不指定时在存档末尾分叉"""
+    if before is not None:
+        keys = [key for key, _ in records]
+        if before not in keys:
+            raise ValueError(f"存档中没有记录 {before!r}")
+        return keys.index(before)
+    if at is not None:
+        return at
+    return len(records)
+
+
+# ============ 运行分支 ============
+async def run_camel_branches(scenario, branches, options=None, memory_budget=None, stream=False):
+    """camel 场景：所有分支在同一个事件循环上并发运行
+
+    options（run_session 的参数，如辩论赛制、面试小组）、memory_budget、stream 沿用父会话存档中记录的值，
+    这样分支回放前缀时的存档 key 与父会话一致。
+    """
+    from camel_session import CamelSession
+
+    module = load_scenario(scenario)
+
+    async def run_one(session_id, branch, checkpoint):
+        model = module.create_model(
+            branch.get("model"),
+            seed=branch.get("seed"),
+            temperature=branch.get("temperature"),
+            stream=stream,
+        )
+        session = CamelSession(scenario, session_id=session_id, verbose=False, checkpoint=checkpoint,
+                               memory_budget=memory_budget, options=options)
+        await module.run_session(session, module.create_agents(model), **session.options)
+        return session.to_record()
+
+    return await asyncio.gather(*(run_one(session_id, branch, cp) for session_id, branch, cp in branches))
+
+
+def run_turtle_soup_branches(puzzle_title, branches, options=None, corpus=DEFAULT_CORPUS):
+    """海龟汤：同步调用，每个分支一个线程
+
+    options 为父会话的 GameSession 参数（发言模式、记忆预算、模型等，见 GameSession.options），corpus 为父会话的题库；
+    分支只覆盖自己指定的 seed / temperature / model（branch_options）。
+    """
+    import turtle_soup_multi_agent as turtle_soup
+
+    corpus = turtle_soup.puzzle_corpus(corpus)
+    puzzle = turtle_soup.find_puzzle(puzzle_title, corpus)
+
+    def run_one(session_id, branch, checkpoint):
+        game = turtle_soup.GameSession(
+            verbose=False,
+            session_id=session_id,
+            checkpoint=checkpoint,
+            corpus=corpus,
+            **branch_options(options, branch),
+        )
+        turtle_soup.play_multi_agent_game(puzzle, game)
+        return game.to_record(puzzle)
+
+    with ThreadPoolExecutor(max_workers=len(branches)) as pool:
+        futures = [pool.submit(run_one, session_id, branch, cp) for session_id, branch, cp in branches]
+        return [f.result() for f in futures]
+
+
+def fork(parent_path, branches, at=None, before=None, out_dir=None):
+    """从 parent_path 分叉出 len(branches) 个分支并发运行，返回各分支的会话记录"""
+    meta, records = read_checkpoint(parent_path)
+    scenario = meta.get("scenario")
+    if scenario != TURTLE_SOUP and scenario not in SCENARIOS:
+        raise ValueError(f"不支持分叉场景 {scenario!r}（需要人类输入的场景无法自动继续）")
+
+    fork_at = resolve_fork_at(records, at, before)
+    if out_dir is None:
+        parent_dir = os.path.dirname(parent_path) or "."
+        out_dir = parent_dir if os.path.basename(parent_dir) == "forks" else os.path.join(parent_dir, "forks")
+    stem = os.path.splitext(os.path.basename(parent_path))[0]
+
+    options = None
+    if scenario == TURTLE_SOUP:
+        # 早期存档没有记录会话参数：只沿用发言模式
+        options = meta.get("options") or {"parallel_players": meta.get("mode") == "parallel"}
+
+    fork_id = uuid.uuid4().hex[:6]
+    opened = []
+    for i, branch in enumerate(branches):
+        child_path = os.path.join(out_dir, f"{stem}.at{fork_at}.b{i}.jsonl")
+        child_options = branch_options(options, branch) if options is not None else None
+        opened.append((f"{fork_id}-b{i}", branch, fork_checkpoint(parent_path, child_path, fork_at, branch, child_options)))
+
+    print(f"🌿 从 {parent_path} 的第 {fork_at} 条记录处分叉出 {len(branches)} 个分支（前缀 {fork_at} 条直接回放）")
+    start = time.perf_counter()
+    if scenario == TURTLE_SOUP:
+        results = run_turtle_soup_branches(meta["puzzle"], opened, options=options,
+                                           corpus=meta.get("corpus", DEFAULT_CORPUS))  # 早期存档没有记录题库
+    else:
+        # 早期存档没有记录这些参数：按场景的默认赛制 / 模式运行
+        results = asyncio.run(run_camel_branches(scenario, opened, options=meta.get("options"),
+                                                 memory_budget=meta.get("memory_budget"), stream=meta.get("stream", False)))
+    elapsed = time.perf_counter() - start
+
+    for record, (_, branch, checkpoint) in zip(results, opened):
+        record.update(
+            parent=os.path.abspath(parent_path),
+            fork_at=fork_at,
+            branch=branch,
+            checkpoint=checkpoint.path,
+            new_records=len(checkpoint.records) - fork_at,
+        )
+    summarize(results, elapsed)
+    return results
+
+
+def summarize(results, elapsed):
+    print("\n" + "="*70)
+    print(f"🌿 分支结果（{elapsed:.1f}s）")
+    print("="*70)
+    for record in results:
+        turns = record.get("turns") or record.get("conversation_log") or []
+        status = record.get("outcome") or record["status"]
+        last = turns[-1] if turns else ""
+        print(f"  [{record['session_id']}] {record['branch'] or '默认配置'}")
+        print(f"      状态: {status}  新增记录: {record['new_records']}  存档: {record['checkpoint']}")
+        if record.get("error"):
+            print(f"      ❌ {record['error']}")
+        print(f"      结尾: {preview(last)}")
+    print("="*70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从存档分叉出多个分支并发继续")
+    parser.add_argument("checkpoint", help="父存档路径")
+    parser.add_argument("--list", action="store_true", help="列出存档中的记录后退出")
+    parser.add_argument("--at", type=int, default=None, help="保留前 N 条记录后分叉（默认在存档末尾）")
+    parser.add_argument("--before", default=None, help="在指定记录之前分叉，如 \"7:柯南\"")
+    parser.add_argument("-k", "--branches", type=int, default=3, help="分支数（未指定 --branch 时使用 seed=1..K）")
+    parser.add_argument("--branch", action="append", default=[], help="分支配置，如 \"seed=1,temperature=0.9,model=xxx\"，可重复")
+    parser.add_argument("-o", "--out-dir", default=None, help="分支存档目录（默认与父存档同目录下的 forks/）")
+    parser.add_argument("--output", default=None, help="把各分支的会话记录追加写入该 JSONL")
+    args = parser.parse_args()
+
+    if args.list:
+        list_records(args.checkpoint)
+        return
+
+    branches = [parse_branch(spec) for spec in args.branch] or [{"seed": i + 1} for i in range(args.branches)]
+    results = fork(args.checkpoint, branches, at=args.at, before=args.before, out_dir=args.out_dir)
+
+    if args.output:
+        writer = TranscriptWriter(args.output)
+        for record in results:
+            writer.write(record)
+        writer.close()
+        print(f"📝 已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# 批量并发运行 camel 场景：在一个事件循环上同时跑 N 个独立会话，完成一个写一个
+#
+# 用法示例：
+#   python session_runner.py debate -n 200 -c 16 -o debates.jsonl
+#   python session_runner.py hospital -n 50 -c 8 -o hospital.jsonl --model gpt-4o-mini
+import argparse
+import asyncio
+import importlib
+import json
+import time
+import uuid
+
+from transcript_store import DEFAULT_DB, TranscriptStore
+
+# 场景名 -> 场景脚本模块（每个脚本提供 create_model / create_agents / run_session）
+SCENARIOS = {
+    "hospital": "hospital_talk",
+    "interview": "interview_talk",
+    "debate": "debate_show",
+    "food": "food_show",
+}
+
+
+def load_scenario(scenario):
+    """按场景名导入场景脚本模块"""
+    if scenario not in SCENARIOS:
+        raise ValueError(f"未知场景: {scenario}（可选: {', '.join(SCENARIOS)}）")
+    return importlib.import_module(SCENARIOS[scenario])
+
+
+class TranscriptWriter:
+    """把完成的会话逐行追加写入 JSONL（每行一个会话），写完立即 flush"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+async def run_sessions(scenario, num_sessions, concurrency=8, output="transcripts.jsonl", model_id=None, store_path=DEFAULT_DB):
+    """并发运行 num_sessions 个会话，同时最多 concurrency 个在进行中
+
+    每个会话都会新建自己的一组 agent（记忆隔离），模型后端在所有会话间共享以复用连接池。
+    store_path 不为空时每轮发言同时写入转录库。
+    返回 (完成数, 失败数)。
+    """
+    from camel_session import CamelSession
+
+    module = load_scenario(scenario)
+    model = module.create_model(model_id) if model_id else module.create_model()
+    semaphore = asyncio.Semaphore(concurrency)
+    writer = TranscriptWriter(output)
+    store = TranscriptStore(store_path) if store_path else None
+    stats = {"done": 0, "failed": 0}
+    batch_id = uuid.uuid4().hex[:6]  # 区分不同批次的会话 id
+    batch_start = time.perf_counter()
+
+    async def run_one(index):
+        async with semaphore:
+            session = CamelSession(scenario, session_id=f"{scenario}-{batch_id}-{index:06d}", verbose=False, store=store)
+            start = time.perf_counter()
+            try:
+                await module.run_session(session, module.create_agents(model))
+            except Exception as e:
+                session.fail(e)
+                session.finish()
+
+            writer.write(session.to_record())
+            if session.error:
+                stats["failed"] += 1
+                mark = "❌"
+            else:
+                stats["done"] += 1
+                mark = "✅"
+            finished = stats["done"] + stats["failed"]
+            print(f"{mark} [{finished}/{num_sessions}] {session.session_id} "
+                  f"({len(session.turns)} 条发言, {time.perf_counter() - start:.1f}s)"
+                  + (f" {session.error}" if session.error else ""), flush=True)
+
+    try:
+        await asyncio.gather(*(run_one(i) for i in range(num_sessions)))
+    finally:
+        writer.close()
+        if store:
+            store.close()
+
+    elapsed = time.perf_counter() - batch_start
+    print("\n" + "="*70)
+    print(f"📦 批量运行完成: 场景={scenario}, 成功={stats['done']}, 失败={stats['failed']}")
+    print(f"总耗时: {elapsed:.1f}s, 吞吐: {num_sessions / max(elapsed, 1e-9) * 3600:.0f} 会话/小时")
+    print(f"输出文件: {output}")
+    print("="*70)
+    return stats["done"], stats["failed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发批量运行 camel 对话场景")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS), help="要运行的场景")
+    parser.add_argument("-n", "--sessions", type=int, default=10, help="会话数量")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="同时进行的最大会话数")
+    parser.add_argument("-o", "--output", default="transcripts.jsonl", help="输出 JSONL 文件（追加写入）")
+    parser.add_argument("--model", default=None, help="覆盖场景默认模型")
+    parser.add_argument("--store", default=DEFAULT_DB, help=f"转录库路径（默认 {DEFAULT_DB}）")
+    parser.add_argument("--no-store", action="store_true", help="不写转录库")
+    args = parser.parse_args()
+
+    asyncio.run(run_sessions(
+        args.scenario,
+        args.sessions,
+        concurrency=args.concurrency,
+        output=args.output,
+        model_id=args.model,
+        store_path=None if args.no_store else args.store,
+    ))
+
+
+if __name__ == "__main__":
+    main()
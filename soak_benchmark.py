@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# 内存浸泡测试：在一个进程里保留成千上万局对话记录，比较两种表示方式每局占用的内存
+#
+#   legacy:  原来的表示 —— conversation_log 的 f"【名字】内容" 字符串、每个 agent 的 {"role", "content"} 字典列表，
+#            玩家每轮的提示词（拼进最近 15 条对话）也整段保存在历史里
+#   compact: compact_transcript.py —— 共用一个文本缓冲、__slots__ 记录、名字驻留、提示词按需生成
+#
+# 不调用模型：发言内容是随机生成的中文文本（长度与真实对局相近），流程与海龟汤一局相同
+# （三名玩家轮流发言，约一半是提问，主持人回复 JSON 判定）。每种表示在单独的子进程里运行，分别报告
+# tracemalloc 统计的每局字节数和进程 RSS 的增长。
+#
+# 用法示例：
+#   python soak_benchmark.py                        # 两种表示各跑 2000 局、每局 30 轮
+#   python soak_benchmark.py --sessions 5000 --rounds 60
+#   python soak_benchmark.py --mode compact         # 只跑一种（在当前进程里）
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from compact_transcript import History, Transcript
+
+CONTEXT_MAX_MESSAGES = 15
+PLAYERS = ["福尔摩斯", "柯南", "波洛"]
+SYSTEM_PROMPTS = {name: f"你是{name}，一名参加海龟汤推理游戏的侦探。" * 20 for name in PLAYERS}  # 各局共用（模块常量）
+HOST_PROMPT = "你是海龟汤游戏的主持人，只回答是、不是或无关。" * 30
+CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经"
+
+
+def player_prompt(context):
+    return f"当前情况：\n{context}\n\n现在轮到你了。你可以：\n1. 和其他玩家讨论你的想法和推理\n2. 向主持人提出一个是非问题"
+
+
+def random_text(rng, low, high):
+    return "".join(rng.choice(CHARS) for _ in range(rng.randint(low, high)))
+
+
+def play(rng, rounds):
+    """生成一局的发言序列：[(玩家, 发言, 问题或 None, 主持人原始判定, 主持人回复)]"""
+    events = []
+    for round_num in range(rounds):
+        question = random_text(rng, 10, 30) if rng.random() < 0.5 else None
+        response = random_text(rng, 80, 240) + (f"【向主持人提问】{question}？" if question else "")
+        verdict = json.dumps({"reply": random_text(rng, 2, 12), "solved": False}, ensure_ascii=False)
+        events.append((PLAYERS[round_num % 3], response, question, verdict, random_text(rng, 2, 12)))
+    return events
+
+
+# ============ 两种表示 ============
+def legacy_session(events):
+    log = ["【主持人】题目：" + "一个男人在餐厅点了一碗海龟汤"]
+    histories = {name: [{"role": "system", "content": SYSTEM_PROMPTS[name]}] for name in PLAYERS}
+    host_history = [{"role": "system", "content": HOST_PROMPT}]
+    for name, response, question, verdict, reply in events:
+        histories[name].append({"role": "user", "content": player_prompt("\n".join(log[-CONTEXT_MAX_MESSAGES:]))})
+        histories[name].append({"role": "assistant", "content": response})
+        log.append(f"【{name}】{response}")
+        if question:
+            host_history.append({"role": "user", "content": f"玩家{name}的问题：{question}\n\n请按约定的 JSON 格式给出判定。"})
+            host_history.append({"role": "assistant", "content": verdict})
+            log.append(f"【主持人】{reply}")
+    return log, histories, host_history
+
+
+def compact_session(events):
+    transcript = Transcript()
+
+    def render(position):
+        return player_prompt("\n".join(transcript.lines(max(position - CONTEXT_MAX_MESSAGES, 0), position)))
+
+    transcript.append("主持人", "题目：" + "一个男人在餐厅点了一碗海龟汤")
+    histories = {name: History(transcript, system=SYSTEM_PROMPTS[name], render=render) for name in PLAYERS}
+    host_history = History(transcript, system=HOST_PROMPT)
+    for name, response, question, verdict, reply in events:
+        histories[name].append_rendered("user", len(transcript))
+        histories[name].append_turn("assistant", transcript.append(name, response))
+        if question:
+            host_history.append("user", f"玩家{name}的问题：{question}\n\n请按约定的 JSON 格式给出判定。")
+            host_history.append("assistant", verdict)
+            transcript.append("主持人", reply)
+    return transcript, histories, host_history
+
+
+MODES = {"legacy": legacy_session, "compact": compact_session}
+
+
+def rss_kb():
+    """当前进程的常驻内存（KB）；没有 /proc 时退回峰值 RSS"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run(mode, sessions, rounds, seed):
+    """在当前进程里保留 sessions 局的记录，返回统计信息"""
+    rng = random.Random(seed)
+    build = MODES[mode]
+    kept = []
+    rss_before = rss_kb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(sessions):
+        events = play(rng, rounds)
+        kept.append(build(events))
+        del events
+    elapsed = time.perf_counter() - start
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "rounds": rounds,
+        "bytes_per_session": traced / sessions,
+        "rss_kb_per_session": (rss_kb() - rss_before) / sessions,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话记录表示方式的内存浸泡测试")
+    parser.add_argument("--sessions", type=int, default=2000, help="保留多少局（默认 2000）")
+    parser.add_argument("--rounds", type=int, default=30, help="每局多少轮（默认 30）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（两种表示用同样的内容）")
+    parser.add_argument("--mode", choices=sorted(MODES), default=None, help="只在当前进程里跑一种表示（默认两种各开一个子进程）")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.sessions, args.rounds, args.seed)))
+        return
+
+    results = []
+    for mode in ("legacy", "compact"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, "--sessions", str(args.sessions),
+             "--rounds", str(args.rounds), "--seed", str(args.seed)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"🧪 {args.sessions} 局 × {args.rounds} 轮")
+    print(f"{'表示':<10}{'每局 (tracemalloc)':>20}{'每局 RSS':>14}{'耗时':>10}")
+    for result in results:
+        print(f"{result['mode']:<10}{result['bytes_per_session'] / 1024:>17.1f} KB"
+              f"{result['rss_kb_per_session']:>11.1f} KB{result['seconds']:>9.1f}s")
+    legacy, compact = results
+    print(f"📉 compact 每局内存为 legacy 的 {compact['bytes_per_session'] / legacy['bytes_per_session']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
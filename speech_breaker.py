@@ -0,0 +1,153 @@
+# 语音合成的熔断器：TTS 服务挂掉或变慢时立即退回纯文字，服务恢复后自动重新朗读
+#
+# 每个音色一个熔断器（不同音色可能分别限流或出错），三种状态：
+#
+#   closed     正常合成；连续 FAILURE_THRESHOLD 次失败，或连续 SLOW_THRESHOLD 次耗时超过 SLOW_CALL 秒 -> open
+#   open       不再请求（不建临时文件、不等超时），发言只显示文字；OPEN_SECONDS 秒后 -> half_open
+#   half_open  只放行一次探测请求（其他调用照常跳过）：成功 -> closed；失败或仍然很慢 -> 重新 open，
+#              等待时间翻倍（最多 MAX_OPEN_SECONDS）
+#
+# 连接失败 / 请求超时说明整个服务不可用，与音色无关：这类错误同时计入所有音色共用的服务熔断器，
+# 服务熔断后所有音色一起退回纯文字，不必每个音色各自等几次超时。
+import os
+import threading
+import time
+
+import openai
+
+REQUEST_TIMEOUT = float(os.getenv("QDD_TTS_TIMEOUT", "15"))  # 单次合成请求的超时秒数
+FAILURE_THRESHOLD = 2    # 连续失败几次后熔断
+SLOW_CALL = 8.0          # 合成耗时超过这么多秒算一次慢调用
+SLOW_THRESHOLD = 3       # 连续几次慢调用后熔断
+OPEN_SECONDS = 30.0      # 熔断后多久放行一次探测请求（每次探测失败翻倍）
+MAX_OPEN_SECONDS = 300.0
+SERVICE = "*"            # 服务熔断器的名字
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+SERVICE_ERRORS = (openai.APIConnectionError, openai.InternalServerError)  # APITimeoutError 是 APIConnectionError 的子类
+
+
+class CircuitBreaker:
+    """一个熔断器（线程安全）；clock 为返回秒数的单调时钟（测试时可以换成假时钟）"""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, slow_call=SLOW_CALL, slow_threshold=SLOW_THRESHOLD,
+                 open_seconds=OPEN_SECONDS, max_open_seconds=MAX_OPEN_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.slow_threshold = slow_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0        # 连续失败次数
+        self.slow = 0            # 连续慢调用次数
+        self.trips = 0           # 连续熔断次数（决定下一次等待多久）
+        self.opened_at = 0.0
+        self.probing = False     # half_open 时是否已经放出探测请求
+        self.skipped = 0         # 熔断期间跳过的调用
+        self.total_trips = 0
+        self.lock = threading.Lock()
+
+    @property
+    def open_for(self):
+        return min(self.open_seconds * 2 ** max(self.trips - 1, 0), self.max_open_seconds)
+
+    def allow(self):
+        """本次是否发出请求；open 期间返回 False，到时间后放行一次探测"""
+        with self.lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.open_for:
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self.probing):
+                self.probing = self.state == HALF_OPEN
+                return True
+            self.skipped += 1
+            return False
+
+    def record(self, latency=None, ok=True):
+        """记录一次请求的结果，返回状态变化 (旧状态, 新状态)，没有变化时返回 None"""
+        with self.lock:
+            before = self.state
+            slow = ok and latency is not None and latency > self.slow_call
+            if not ok:
+                self.failures += 1
+            elif slow:
+                self.failures = 0
+                self.slow += 1
+            else:
+                self.failures = self.slow = 0
+            if self.state == HALF_OPEN and self.probing:
+                self.probing = False
+                if ok and not slow:
+                    self.state, self.trips = CLOSED, 0
+                else:
+                    self._trip()
+            elif self.state == CLOSED and (self.failures >= self.failure_threshold or self.slow >= self.slow_threshold):
+                self._trip()
+            return (before, self.state) if self.state != before else None
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.trips += 1
+        self.total_trips += 1
+        self.failures = self.slow = 0
+
+
+class SpeechBreakers:
+    """按音色管理熔断器，外加一个所有音色共用的服务熔断器；options 传给每个 CircuitBreaker"""
+
+    def __init__(self, **options):
+        self.options = options
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.service = self.breaker(SERVICE)
+
+    def breaker(self, voice):
+        with self.lock:
+            if voice not in self.breakers:
+                self.breakers[voice] = CircuitBreaker(voice, **self.options)
+            return self.breakers[voice]
+
+    def allow(self, voice):
+        """这个音色现在能不能合成；服务熔断时所有音色都不能（服务的探测请求由第一个到来的音色发出）"""
+        if not self.service.allow():
+            return False
+        if self.breaker(voice).allow():
+            return True
+        if self.service.probing:  # 这个音色不发请求，把服务的探测机会留给下一次调用
+            with self.service.lock:
+                self.service.probing = False
+        return False
+
+    def record(self, voice, latency=None, error=None):
+        """记录一次合成的结果（error 为异常，成功时为空）"""
+        ok = error is None
+        changes = [(voice, self.breaker(voice).record(latency, ok))]
+        if ok or isinstance(error, SERVICE_ERRORS):
+            changes.append((SERVICE, self.service.record(latency, ok)))
+        elif self.service.probing:
+            # 音色自己的错误（如参数不被接受）不代表服务不可用
+            changes.append((SERVICE, self.service.record(latency, True)))
+        for name, change in changes:
+            if change:
+                self.announce(name, *change)
+
+    def announce(self, name, before, after):
+        label = "TTS 服务" if name == SERVICE else f"TTS 音色 {name} "
+        if after == OPEN:
+            breaker = self.breakers[name]
+            print(f"   🔇 {label}暂时不可用，接下来 {breaker.open_for:.0f}s 内只显示文字")
+        elif after == CLOSED:
+            print(f"   🔊 {label}已恢复")
+
+    def print_summary(self):
+        """打印熔断情况（没有熔断过时不打印）"""
+        tripped = [b for b in self.breakers.values() if b.total_trips]
+        if not tripped:
+            return
+        print("\n🔇 TTS 熔断:")
+        for b in tripped:
+            label = "服务" if b.name == SERVICE else b.name
+            print(f"   {label}: 熔断 {b.total_trips} 次，跳过 {b.skipped} 条语音，当前 {b.state}")
@@ -0,0 +1,43 @@
+# 答案缓存按字节位置增量读入其他进程追加的行：半行留到下次，非 ASCII 内容和 \r\n 换行不影响位置
+import json
+import os
+
+from answer_cache import AnswerCache
+
+VERDICT = '{"answer": "是", "solved": false, "reply": "是。"}'
+NO = '{"answer": "否", "solved": false, "reply": "否。"}'
+
+
+def line(question, response):
+    return json.dumps({"question": question, "response": response}, ensure_ascii=False).encode("utf-8")
+
+
+def test_reads_lines_appended_by_other_processes(tmp_path):
+    cache = AnswerCache("海龟汤", directory=tmp_path)
+    cache.add("他是不是吃过人肉？", VERDICT)
+    with open(cache.path, "ab") as f:  # 另一个进程：一行完整的记录 + 正在写的半行
+        f.write(line("他是在船上遇难的吗？", NO) + b"\r\n")
+        half = line("海龟汤是餐厅做的吗？", VERDICT)
+        f.write(half[:20])
+
+    assert cache.lookup("他是在船上遇难的吗？")[1] == NO
+    assert cache.lookup("海龟汤是餐厅做的吗？") is None  # 半行还没有读入
+    assert cache.offset == os.path.getsize(cache.path) - 20
+
+    with open(cache.path, "ab") as f:
+        f.write(half[20:] + b"\n")
+    assert cache.lookup("海龟汤是餐厅做的吗？")[1] == VERDICT
+    assert len(cache.entries) == 3
+
+
+def test_new_instance_loads_everything(tmp_path):
+    first = AnswerCache("海龟汤", directory=tmp_path)
+    first.add("他是不是吃过人肉？", VERDICT)
+    first.add("他是在船上遇难的吗？", NO)
+    with open(first.path, "ab") as f:
+        f.write(b"not json\n")
+
+    second = AnswerCache("海龟汤", directory=tmp_path)
+    assert len(second.entries) == 2
+    assert second.offset == os.path.getsize(first.path)
+    assert second.lookup("他是不是吃过人肉")[1] == VERDICT
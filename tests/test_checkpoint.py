@@ -0,0 +1,148 @@
+# 会话存档：崩溃留下的半行、分支存档的父存档前缀、按 key 回放
+import json
+import os
+
+import pytest
+
+from checkpoint import SessionCheckpoint, fork_checkpoint, read_checkpoint, read_checkpoint_meta, truncate_partial_line
+
+
+def write_checkpoint(path, meta, records, tail=""):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "meta", **meta}, ensure_ascii=False) + "\n")
+        for key, value in records:
+            f.write(json.dumps({"type": "turn", "key": key, "value": value}, ensure_ascii=False) + "\n")
+        f.write(tail)
+
+
+def turns(n, speaker="pro"):
+    return [(f"{i}:{speaker}", {"content": f"第 {i} 轮发言"}) for i in range(n)]
+
+
+def test_save_and_resume(tmp_path):
+    path = tmp_path / "debate.jsonl"
+    checkpoint = SessionCheckpoint(path, meta={"scenario": "debate"})
+    checkpoint.save("0:pro", {"content": "立论"})
+    checkpoint.save("1:con", {"content": "反驳"})
+    checkpoint.close()
+
+    resumed = SessionCheckpoint(path, meta={"scenario": "debate"}, resume=True)
+    assert resumed.resumed_turns == 2
+    assert resumed.replaying
+    assert resumed.replay("0:pro") == {"content": "立论"}
+    assert resumed.replay("1:con") == {"content": "反驳"}
+    assert not resumed.replaying
+    resumed.close()
+
+
+def test_replay_key_mismatch(tmp_path):
+    path = tmp_path / "debate.jsonl"
+    write_checkpoint(path, {"scenario": "debate"}, [("0:pro", {"content": "立论"}), ("1:con", {"content": "反驳"})])
+    checkpoint = SessionCheckpoint(path, resume=True)
+    assert checkpoint.replay("2:con") is None  # 存档里没有的 key 照常调用模型
+    assert checkpoint.replaying  # 没有被取回的记录不算回放完
+    checkpoint.save("2:con", {"content": "新的发言"})
+    checkpoint.close()
+    _, records = read_checkpoint(path)
+    assert [key for key, _ in records] == ["0:pro", "1:con", "2:con"]
+
+
+def test_resume_rejects_different_meta(tmp_path):
+    path = tmp_path / "debate.jsonl"
+    write_checkpoint(path, {"scenario": "debate", "options": {"format": "standard"}}, turns(2))
+    with pytest.raises(ValueError, match="options"):
+        SessionCheckpoint(path, meta={"scenario": "debate", "options": {"format": "classic"}}, resume=True)
+
+
+def test_truncate_partial_line(tmp_path):
+    path = tmp_path / "cp.jsonl"
+    write_checkpoint(path, {"scenario": "food"}, turns(2), tail='{"type": "turn", "key": "2:pro", "val')
+    size = path.stat().st_size
+    assert truncate_partial_line(path) == len('{"type": "turn", "key": "2:pro", "val')
+    assert path.stat().st_size < size
+    assert path.read_bytes().endswith(b"\n")
+    assert truncate_partial_line(path) == 0  # 已经完整时不做任何事
+
+
+def test_resume_after_torn_tail(tmp_path):
+    path = tmp_path / "cp.jsonl"
+    write_checkpoint(path, {"scenario": "food"}, turns(3), tail='{"type": "turn", "key": "3:pro", "value": {"con')
+    checkpoint = SessionCheckpoint(path, meta={"scenario": "food"}, resume=True)
+    assert checkpoint.resumed_turns == 3
+    checkpoint.save("3:pro", {"content": "重新生成"})  # 续写的记录不会和半行粘在一起
+    checkpoint.close()
+    meta, records = read_checkpoint(path)
+    assert meta == {"scenario": "food"}
+    assert records[-1] == ("3:pro", {"content": "重新生成"})
+    assert len(records) == 4
+
+
+def test_resume_after_torn_meta(tmp_path):
+    path = tmp_path / "cp.jsonl"
+    path.write_text('{"type": "meta", "scen', encoding="utf-8")
+    checkpoint = SessionCheckpoint(path, meta={"scenario": "food"}, resume=True)
+    assert checkpoint.resumed_turns == 0
+    checkpoint.close()
+    assert read_checkpoint_meta(path) == {"scenario": "food"}
+
+
+def test_bad_line_in_the_middle_is_skipped(tmp_path, capsys):
+    path = tmp_path / "cp.jsonl"
+    write_checkpoint(path, {"scenario": "food"}, turns(1))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("not json\n")
+        f.write(json.dumps({"type": "turn", "key": "1:pro", "value": {"content": "之后的记录"}}) + "\n")
+    _, records = read_checkpoint(path)
+    assert [key for key, _ in records] == ["0:pro", "1:pro"]
+    assert "第 3 行无法解析" in capsys.readouterr().out
+
+
+def test_fork_keeps_prefix_only(tmp_path):
+    parent = tmp_path / "parent.jsonl"
+    write_checkpoint(parent, {"scenario": "debate", "options": {"format": "standard"}}, turns(5))
+    child = fork_checkpoint(parent, tmp_path / "forks" / "child.jsonl", 3, {"seed": 1})
+    assert child.resumed_turns == 3
+    assert child.replay("2:pro") == {"content": "第 2 轮发言"}
+    assert child.replay("3:pro") is None  # 分叉点之后的记录不沿用
+    child.save("3:pro", {"content": "分支的发言"})
+    child.close()
+
+    lines = (tmp_path / "forks" / "child.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2  # 只有 meta 和分支自己的新记录，前缀留在父存档里
+    meta, records = read_checkpoint(tmp_path / "forks" / "child.jsonl")
+    assert meta["parent"] == os.path.abspath(parent)
+    assert meta["fork_at"] == 3
+    assert meta["branch"] == {"seed": 1}
+    assert meta["options"] == {"format": "standard"}
+    assert [key for key, _ in records] == ["0:pro", "1:pro", "2:pro", "3:pro"]
+    assert records[-1][1] == {"content": "分支的发言"}
+
+
+def test_fork_of_fork_follows_parent_chain(tmp_path):
+    root = tmp_path / "root.jsonl"
+    write_checkpoint(root, {"scenario": "turtle_soup"}, turns(4))
+    child = fork_checkpoint(root, tmp_path / "child.jsonl", 2, options={"seed": 1})
+    child.save("2:con", {"content": "子分支"})
+    child.save("3:con", {"content": "子分支 2"})
+    child.close()
+    grandchild = fork_checkpoint(tmp_path / "child.jsonl", tmp_path / "grandchild.jsonl", 3, options={"seed": 2})
+    grandchild.close()
+
+    meta, records = read_checkpoint(tmp_path / "grandchild.jsonl")
+    assert meta["options"] == {"seed": 2}
+    assert [key for key, _ in records] == ["0:pro", "1:pro", "2:con"]
+
+
+def test_fork_out_of_range(tmp_path):
+    parent = tmp_path / "parent.jsonl"
+    write_checkpoint(parent, {"scenario": "debate"}, turns(2))
+    with pytest.raises(ValueError):
+        fork_checkpoint(parent, tmp_path / "child.jsonl", 3)
+
+
+def test_parent_shorter_than_fork_at(tmp_path):
+    parent = tmp_path / "parent.jsonl"
+    write_checkpoint(parent, {"scenario": "debate"}, turns(1))
+    write_checkpoint(tmp_path / "child.jsonl", {"scenario": "debate", "parent": str(parent), "fork_at": 4}, [])
+    with pytest.raises(ValueError, match="无法在第 4 条处分叉"):
+        read_checkpoint(tmp_path / "child.jsonl")
@@ -0,0 +1,54 @@
+# 辩论赛制的分批：同一批的环节互不依赖、发言角色不重复，依赖成环时报错
+import pytest
+
+pytest.importorskip("camel")
+from debate_show import DEBATE_FORMATS, schedule_stages  # noqa: E402
+
+
+def names(waves):
+    return [[stage[0] for stage in wave] for wave in waves]
+
+
+@pytest.mark.parametrize("format", sorted(DEBATE_FORMATS))
+def test_waves_respect_dependencies(format):
+    stages = DEBATE_FORMATS[format]
+    waves = schedule_stages(stages)
+    assert [stage for wave in waves for stage in wave] == stages  # 分批不改变环节顺序
+    finished = set()
+    for wave in waves:
+        assert len({speaker for _, speaker, _ in wave}) == len(wave)  # 一个角色一批只发言一次
+        for _, _, inputs in wave:
+            assert set(inputs) <= finished  # 依赖的环节都在更早的批次
+        finished.update(name for name, _, _ in wave)
+
+
+def test_classic_is_sequential():
+    assert all(len(wave) == 1 for wave in schedule_stages(DEBATE_FORMATS["classic"]))
+
+
+def test_standard_runs_independent_stages_together():
+    assert names(schedule_stages(DEBATE_FORMATS["standard"])) == [
+        ["正方立论", "反方立论"],
+        ["主持人提问"],
+        ["正方回应"],
+        ["反方反驳"],
+        ["主持人引导"],
+        ["正方深入论述", "反方深入论述"],
+        ["主持人总结"],
+    ]
+
+
+def test_same_speaker_starts_new_wave():
+    waves = schedule_stages([("a", "pro", ()), ("b", "pro", ()), ("c", "con", ())])
+    assert names(waves) == [["a"], ["b", "c"]]
+
+
+@pytest.mark.parametrize("stages", [
+    [("a", "pro", ("b",)), ("b", "con", ("a",))],  # 环
+    [("a", "pro", ("a",))],  # 依赖自己
+    [("a", "pro", ()), ("b", "con", ("c",))],  # 依赖不存在的环节
+    [("a", "pro", ()), ("a", "con", ())],  # 重名
+])
+def test_rejects_invalid_dependencies(stages):
+    with pytest.raises(ValueError):
+        schedule_stages(stages)
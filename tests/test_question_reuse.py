@@ -0,0 +1,51 @@
+# 主持人调用失败时的回答不能记入本局的问题索引，否则相似的问题会一直沿用错误信息
+import os
+
+import pytest
+
+from host_verdict import is_answered
+from question_index import QuestionIndex
+
+VERDICT = '{"answer": "是", "solved": false, "reply": "是。"}'
+
+
+@pytest.mark.parametrize("response", [
+    "[系统错误: APIConnectionError: Connection error.]",
+    "[模型返回空响应，请查看上方建议]",
+    "我觉得是吧",  # 不是 JSON 判定
+    '{"answer": "也许", "solved": false, "reply": "也许"}',  # 不合法的判定类别
+    "",
+    None,
+])
+def test_error_responses_are_not_answers(response):
+    assert not is_answered(response)
+
+
+def test_verdict_is_answer():
+    assert is_answered(VERDICT)
+    assert is_answered(f"```json\n{VERDICT}\n```")
+
+
+def test_take_turn_asks_again_after_error(monkeypatch):
+    pytest.importorskip("pygame")
+    os.environ.setdefault("QDD_API_KEY", "test")
+    import turtle_soup_multi_agent as turtle_soup
+    from compact_transcript import History
+
+    responses = iter(["[系统错误: APITimeoutError: Request timed out.]", VERDICT])
+    calls = []
+
+    def fake_call_model(messages, *args, **kwargs):
+        calls.append(kwargs.get("key"))
+        return next(responses)
+
+    monkeypatch.setattr(turtle_soup, "call_model", fake_call_model)
+    game = turtle_soup.GameSession(verbose=False, answer_cache_dir=None, warmup=False)
+    host_history = History(game.transcript, system="主持人")
+    player = {"name": "柯南", "emoji": "💡", "history": History(game.transcript, system="玩家")}
+
+    turtle_soup.take_turn(game, player, "【向主持人提问】他是不是吃过人肉？", host_history, "1:主持人")
+    assert len(game.questions.entries) == 0
+    turtle_soup.take_turn(game, player, "【向主持人提问】他是不是吃过人肉？", host_history, "2:主持人")
+    assert calls == ["1:主持人", "2:主持人"]  # 第二次重新问了主持人，没有沿用错误信息
+    assert game.questions.lookup("他是不是吃过人肉") is not None
@@ -0,0 +1,154 @@
+# 语音合成熔断器的状态转换：closed -> open -> half_open 探测 -> closed / 重新 open（用假时钟驱动）
+import httpx
+import openai
+import pytest
+
+from speech_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, SpeechBreakers
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://tts.test/audio/speech"))
+
+
+def test_failures_trip_then_probe_recovers(clock):
+    breaker = CircuitBreaker("v", failure_threshold=2, open_seconds=30, clock=clock)
+    assert breaker.allow()
+    assert breaker.record(ok=False) is None
+    assert breaker.record(ok=False) == (CLOSED, OPEN)
+    assert not breaker.allow()
+    clock.advance(29.9)
+    assert not breaker.allow()
+    assert breaker.skipped == 2
+
+    clock.advance(0.1)
+    assert breaker.allow()  # 到时间后放行一次探测
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # 探测期间其他调用照常跳过
+    assert breaker.record(latency=0.5) == (HALF_OPEN, CLOSED)
+    assert breaker.allow()
+    assert breaker.trips == 0
+
+
+def test_failed_probe_doubles_wait(clock):
+    breaker = CircuitBreaker("v", failure_threshold=1, open_seconds=30, max_open_seconds=100, clock=clock)
+    breaker.allow()
+    breaker.record(ok=False)
+    assert breaker.open_for == 30
+
+    for expected in (60, 100, 100):  # 每次探测失败等待翻倍，最多 max_open_seconds
+        clock.advance(breaker.open_for)
+        assert breaker.allow()
+        assert breaker.record(ok=False) == (HALF_OPEN, OPEN)
+        assert breaker.open_for == expected
+        assert not breaker.allow()
+    assert breaker.total_trips == 4
+
+
+def test_slow_calls_trip_and_slow_probe_reopens(clock):
+    breaker = CircuitBreaker("v", slow_call=8.0, slow_threshold=3, open_seconds=30, clock=clock)
+    breaker.record(latency=9.0)
+    breaker.record(latency=9.0)
+    breaker.record(latency=1.0)  # 一次正常调用清零连续慢调用计数
+    breaker.record(latency=9.0)
+    breaker.record(latency=9.0)
+    assert breaker.state == CLOSED
+    assert breaker.record(latency=9.0) == (CLOSED, OPEN)
+
+    clock.advance(30)
+    assert breaker.allow()
+    assert breaker.record(latency=9.0) == (HALF_OPEN, OPEN)  # 探测成功但仍然很慢
+    assert breaker.open_for == 60
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("v", failure_threshold=2, clock=clock)
+    breaker.record(ok=False)
+    breaker.record(latency=0.1)
+    breaker.record(ok=False)
+    assert breaker.state == CLOSED
+
+
+def test_voice_error_only_trips_that_voice(clock, capsys):
+    breakers = SpeechBreakers(failure_threshold=2, open_seconds=30, clock=clock)
+    for _ in range(2):
+        assert breakers.allow("alloy")
+        breakers.record("alloy", error=ValueError("unsupported voice"))
+    assert not breakers.allow("alloy")
+    assert breakers.allow("nova")
+    assert breakers.service.state == CLOSED
+    assert "TTS 音色 alloy 暂时不可用" in capsys.readouterr().out
+
+
+def test_service_error_trips_all_voices(clock, capsys):
+    breakers = SpeechBreakers(failure_threshold=2, open_seconds=30, clock=clock)
+    breakers.allow("alloy")
+    breakers.record("alloy", error=connection_error())
+    breakers.allow("nova")
+    breakers.record("nova", error=connection_error())
+    assert breakers.service.state == OPEN
+    assert not breakers.allow("alloy")
+    assert not breakers.allow("echo")  # 没出过错的音色也一起退回纯文字
+    assert "TTS 服务暂时不可用" in capsys.readouterr().out
+
+    clock.advance(30)
+    assert breakers.allow("echo")  # 第一个到来的音色发出服务的探测请求
+    assert not breakers.allow("alloy")
+    breakers.record("echo", latency=0.3)
+    assert breakers.service.state == CLOSED
+    assert "TTS 服务已恢复" in capsys.readouterr().out
+    assert breakers.allow("nova")
+
+
+def test_open_voice_hands_service_probe_to_next_call(clock):
+    breakers = SpeechBreakers(failure_threshold=1, open_seconds=30, clock=clock)
+    breakers.allow("nova")
+    breakers.record("nova", error=connection_error())  # 服务熔断到 t+30
+    clock.advance(20)
+    breakers.breaker("alloy").record(ok=False)  # alloy 自己也熔断到 t+50
+    clock.advance(10)
+    assert not breakers.allow("alloy")  # alloy 不发请求，也不占用服务的探测机会
+    assert breakers.service.state == HALF_OPEN and not breakers.service.probing
+    assert breakers.allow("echo")
+    breakers.record("echo", latency=0.2)
+    assert breakers.service.state == CLOSED
+    assert breakers.breaker("alloy").state == OPEN
+
+
+def test_voice_error_during_service_probe_counts_as_reachable(clock):
+    breakers = SpeechBreakers(failure_threshold=1, open_seconds=30, clock=clock)
+    breakers.allow("nova")
+    breakers.record("nova", error=connection_error())
+    clock.advance(30)
+    assert breakers.allow("echo")
+    breakers.record("echo", error=ValueError("bad voice"))  # 服务能回应，只是音色本身出错
+    assert breakers.service.state == CLOSED
+    assert breakers.breaker("echo").state == OPEN
+
+
+def test_print_summary(clock, capsys):
+    breakers = SpeechBreakers(failure_threshold=1, clock=clock)
+    breakers.print_summary()
+    assert capsys.readouterr().out == ""
+    breakers.allow("alloy")
+    breakers.record("alloy", error=connection_error())
+    breakers.allow("alloy")
+    breakers.print_summary()
+    out = capsys.readouterr().out
+    assert "alloy: 熔断 1 次" in out
+    assert "服务: 熔断 1 次，跳过 1 条语音" in out
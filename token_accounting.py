@@ -0,0 +1,131 @@
+# 本地 token 计数：发请求之前估算提示词有多少 token
+#
+# 优先用 tiktoken 精确计数（按模型选编码，未知模型用 cl100k_base）；没有安装 tiktoken、
+# 或编码文件无法下载时退回按字符估算（中日韩字符约 1 token / 字，其他约 4 字符 / token）。
+# 不同厂商的分词器略有差异，这里的结果用于预算和展示，不用于计费。
+#
+# 同一段文本只分词一次：计数结果按 模型 + 内容哈希 缓存（LRU），每局都一样的长系统提示词、
+# 每轮都要重新发送的历史消息都直接命中缓存。一份只追加的对话历史用 TokenLedger 维护前缀和，
+# 每轮只计新增的消息，"最近多少条消息放得进预算"用二分查找。
+# 这些计数同时用于请求前的预估：限流（model_router.py 的每分钟 token 限额）和 max_tokens 的选择。
+import hashlib
+import os
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+DEFAULT_ENCODING = "cl100k_base"
+MESSAGE_OVERHEAD = 4  # 每条消息的角色、分隔符等额外 token（OpenAI 的计算方式）
+REPLY_OVERHEAD = 2    # 回复开头的固定 token
+CACHE_SIZE = 8192     # 缓存多少段文本的计数
+CONTEXT_WINDOW = int(os.getenv("QDD_CONTEXT_WINDOW", "65536"))  # 模型的上下文窗口（提示词 + 输出）
+MIN_COMPLETION_TOKENS = 256  # 提示词很长时也至少留给输出的 token 数
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+_counts = OrderedDict()  # (模型, 内容哈希) -> token 数
+_counts_lock = threading.Lock()
+
+
+def get_encoder(model=None):
+    """取得模型对应的 tiktoken 编码；不可用时返回 None"""
+    with _encoders_lock:
+        if model not in _encoders:
+            try:
+                import tiktoken
+                try:
+                    _encoders[model] = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_ENCODING)
+                except KeyError:
+                    _encoders[model] = tiktoken.get_encoding(DEFAULT_ENCODING)
+            except Exception:  # 没有安装 tiktoken，或离线时无法下载编码文件
+                _encoders[model] = None
+        return _encoders[model]
+
+
+def estimate_tokens(text):
+    """按字符估算 token 数"""
+    wide = sum(1 for ch in text if unicodedata.east_asian_width(ch) in ("W", "F"))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def content_key(text):
+    """文本的内容哈希（缓存的键，不保留原文）"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def cached_count(key, count):
+    """按 key 缓存 count() 的结果（LRU，线程安全）"""
+    with _counts_lock:
+        if key in _counts:
+            _counts.move_to_end(key)
+            return _counts[key]
+    value = count()
+    with _counts_lock:
+        _counts[key] = value
+        if len(_counts) > CACHE_SIZE:
+            _counts.popitem(last=False)
+    return value
+
+
+def _count(text, model):
+    encoder = get_encoder(model)
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def count_tokens(text, model=None):
+    return cached_count((model, content_key(text)), lambda: _count(text, model))
+
+
+def count_message_tokens(messages, model=None):
+    """一组 chat 消息作为输入时的 token 数"""
+    return sum(count_tokens(m["content"] or "", model) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+
+def fit_max_tokens(prompt_tokens, max_tokens, context_window=CONTEXT_WINDOW):
+    """按提示词的 token 数选 max_tokens：不超过上下文窗口剩下的空间（至少 MIN_COMPLETION_TOKENS）"""
+    return max(min(max_tokens, context_window - prompt_tokens), min(max_tokens, MIN_COMPLETION_TOKENS))
+
+
+class TokenLedger:
+    """一份只追加的消息列表（{"role", "content"}）的 token 计数
+
+    每条消息只计数一次，并维护前缀和：任意一段消息的 token 数是 O(1)，预算内最多能放最近几条是 O(log n)。
+    列表末尾的消息可以被替换（如起草时临时追加、之后被丢弃的提示），sync() 时从变化的位置重新计数。
+    只保存每条消息的内容哈希（不保留原文），对齐时通常只需要对最后一条消息算一次哈希。
+    """
+
+    def __init__(self, model=None):
+        self.model = model
+        self.keys = []     # 每条消息内容的哈希
+        self.prefix = [0]  # prefix[i] = 前 i 条消息的 token 数（含每条消息的固定开销）
+
+    def __len__(self):
+        return len(self.keys)
+
+    def sync(self, messages):
+        """与当前的消息列表对齐，只计数新增（或末尾被替换）的消息"""
+        keep = min(len(self.keys), len(messages))
+        while keep and self.keys[keep - 1] != content_key(messages[keep - 1]["content"] or ""):
+            keep -= 1
+        del self.keys[keep:]
+        del self.prefix[keep + 1:]
+        for message in messages[keep:]:
+            self.keys.append(content_key(message["content"] or ""))
+            self.prefix.append(self.prefix[-1] + count_tokens(message["content"] or "", self.model) + MESSAGE_OVERHEAD)
+        return self
+
+    def prompt_tokens(self, messages):
+        """messages 作为输入时的 token 数（与 count_message_tokens 相同），只计上次之后新增的消息"""
+        return self.sync(messages).total() + REPLY_OVERHEAD
+
+    def total(self, start=0, end=None):
+        """messages[start:end] 的 token 数"""
+        return self.prefix[len(self.keys) if end is None else end] - self.prefix[start]
+
+    def fit(self, limit, start=0, end=None):
+        """messages[i:end] 不超过 limit 个 token 的最小 i（不小于 start）"""
+        end = len(self.keys) if end is None else end
+        return bisect_left(self.prefix, self.prefix[end] - limit, start, end)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# 转录导出：把会话和每轮发言导出为列式文件（Parquet 或 Arrow IPC），供 pandas / DuckDB 等直接做向量化分析
+#
+# 输出目录下生成两个文件：
+#   sessions.parquet  每个会话一行（场景、模型、状态、结果、配置 JSON、发言数、token 合计、总耗时）
+#   turns.parquet     每轮发言一行（角色、内容、输入/输出 token、耗时、finish_reason）
+#
+# 数据来源：
+#   默认读取转录库（transcript_store.py，六个脚本的运行都会写入）；
+#   也可以直接给出 session_runner / session_fork 输出的 JSONL、或 batch_jobs 的 results 目录。
+#
+# 按行组流式写出：每攒够 --row-group-size 行写一个行组，内存占用与总行数无关。
+#
+# 用法示例：
+#   python transcript_export.py -o exports/
+#   python transcript_export.py --scenario turtle_soup --format arrow -o exports/
+#   python transcript_export.py debates.jsonl jobs/results -o exports/
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+from transcript_store import DEFAULT_DB
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 导出是可选功能，对话脚本本身不依赖 pyarrow
+    pa = pq = None
+
+
+def timestamp_ms(value):
+    return None if value is None else int(value * 1000)
+
+
+def turns_schema():
+    return pa.schema([
+        ("session_id", pa.string()),
+        ("scenario", pa.string()),
+        ("turn_index", pa.int32()),
+        ("role", pa.string()),
+        ("model", pa.string()),
+        ("content", pa.large_string()),
+        ("prompt_tokens", pa.int32()),
+        ("completion_tokens", pa.int32()),
+        ("latency", pa.float64()),
+        ("finish_reason", pa.string()),
+        ("created_at", pa.timestamp("ms", tz="UTC")),
+    ])
+
+
+def sessions_schema():
+    return pa.schema([
+        ("session_id", pa.string()),
+        ("scenario", pa.string()),
+        ("model", pa.string()),
+        ("status", pa.string()),
+        ("outcome", pa.string()),
+        ("error", pa.string()),
+        ("config", pa.string()),
+        ("started_at", pa.timestamp("ms", tz="UTC")),
+        ("finished_at", pa.timestamp("ms", tz="UTC")),
+        ("num_turns", pa.int32()),
+        ("prompt_tokens", pa.int64()),
+        ("completion_tokens", pa.int64()),
+        ("latency", pa.float64()),
+    ])
+
+
+class ColumnarWriter:
+    """按行组流式写出 Parquet / Arrow IPC 文件"""
+
+    def __init__(self, path, schema, fmt="parquet", row_group_size=50000):
+        self.path = path
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.count = 0
+        if fmt == "parquet":
+            self.writer = pq.ParquetWriter(path, schema, compression="zstd")
+        else:
+            self.writer = pa.ipc.new_file(path, schema)
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.writer.write_batch(pa.RecordBatch.from_pylist(self.rows, schema=self.schema))
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        return self.count
+
+
+# ============ 从转录库读取 ============
+def iter_store_turns(conn, scenario=None, batch_size=10000):
+    sql = """
+        SELECT session_id, scenario, turn_index, role, model, content,
+               prompt_tokens, completion_tokens, latency, finish_reason, created_at
+        FROM turns {where} ORDER BY id
+    """.format(where="WHERE scenario = ?" if scenario else "")
+    cursor = conn.execute(sql, [scenario] if scenario else [])
+    columns = [c[0] for c in cursor.description]
+    while True:
+        chunk = cursor.fetchmany(batch_size)
+        if not chunk:
+            return
+        for values in chunk:
+            row = dict(zip(columns, values))
+            row["created_at"] = timestamp_ms(row["created_at"])
+            yield row
+
+
+def iter_store_sessions(conn, scenario=None, batch_size=10000):
+    sql = """
+        SELECT s.session_id, s.scenario, s.model, s.status, s.outcome, s.error, s.config,
+               s.started_at, s.finished_at,
+               COALESCE(t.num_turns, 0) AS num_turns,
+               COALESCE(t.prompt_tokens, 0) AS prompt_tokens,
+               COALESCE(t.completion_tokens, 0) AS completion_tokens,
+               t.latency
+        FROM sessions s
+        LEFT JOIN (
+            SELECT session_id, COUNT(*) AS num_turns, SUM(prompt_tokens) AS prompt_tokens,
+                   SUM(completion_tokens) AS completion_tokens, SUM(latency) AS latency
+            FROM turns GROUP BY session_id
+        ) t ON t.session_id = s.session_id
+        {where} ORDER BY s.started_at
+    """.format(where="WHERE s.scenario = ?" if scenario else "")
+    cursor = conn.execute(sql, [scenario] if scenario else [])
+    columns = [c[0] for c in cursor.description]
+    while True:
+        chunk = cursor.fetchmany(batch_size)
+        if not chunk:
+            return
+        for values in chunk:
+            row = dict(zip(columns, values))
+            row["started_at"] = timestamp_ms(row["started_at"])
+            row["finished_at"] = timestamp_ms(row["finished_at"])
+            yield row
+
+
+# ============ 从 JSONL / 结果目录读取 ============
+LOG_LINE = re.compile(r"^【(.+?)】(.*)$", re.S)
+
+
+def iter_records(paths):
+    """逐条读取会话记录：JSONL 文件（每行一个会话）或目录（每个 .json 一个会话）"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".json"):
+                    with open(os.path.join(path, name), encoding="utf-8") as f:
+                        yield json.load(f)
+        else:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def record_rows(record):
+    """把一条会话记录（CamelSession / GameSession.to_record）拆成 (会话行, [发言行])"""
+    session_id = record.get("session_id")
+    scenario = record.get("scenario")
+    model = record.get("model")
+    turns = []
+    if "turns" in record:
+        for turn in record["turns"]:
+            turns.append({
+                "session_id": session_id,
+                "scenario": scenario,
+                "turn_index": turn.get("index"),
+                "role": turn.get("speaker"),
+                "model": turn.get("model") or model,
+                "content": turn.get("content") or "",
+                "prompt_tokens": turn.get("prompt_tokens"),
+                "completion_tokens": turn.get("completion_tokens"),
+                "latency": turn.get("latency"),
+                "finish_reason": turn.get("finish_reason"),
+                "created_at": None,
+            })
+    else:
+        # 海龟汤的对局记录只有 "【角色】内容" 形式的对话记录，token 只有整局合计
+        for index, line in enumerate(record.get("conversation_log") or []):
+            match = LOG_LINE.match(line)
+            role, content = match.groups() if match else (None, line)
+            turns.append({
+                "session_id": session_id,
+                "scenario": scenario,
+                "turn_index": index,
+                "role": role,
+                "model": model,
+                "content": content,
+                "prompt_tokens": None,
+                "completion_tokens": None,
+                "latency": None,
+                "finish_reason": None,
+                "created_at": None,
+            })
+
+    usage = record.get("usage") or {}
+    config = {k: record[k] for k in ("puzzle", "seed", "temperature", "persona", "branch", "fork_at") if record.get(k) is not None}
+    session = {
+        "session_id": session_id,
+        "scenario": scenario,
+        "model": model,
+        "status": record.get("status"),
+        "outcome": record.get("outcome"),
+        "error": record.get("error"),
+        "config": json.dumps(config, ensure_ascii=False) if config else None,
+        "started_at": timestamp_ms(record.get("started_at")),
+        "finished_at": timestamp_ms(record.get("finished_at")),
+        "num_turns": len(turns),
+        "prompt_tokens": usage.get("prompt_tokens", sum(t["prompt_tokens"] or 0 for t in turns)),
+        "completion_tokens": usage.get("completion_tokens", sum(t["completion_tokens"] or 0 for t in turns)),
+        "latency": record.get("elapsed") or sum(t["latency"] or 0 for t in turns) or None,
+    }
+    return session, turns
+
+
+# ============ 导出 ============
+def export(out_dir, inputs=None, db=DEFAULT_DB, scenario=None, fmt="parquet", row_group_size=50000):
+    """导出会话和发言，返回 (会话数, 发言数)"""
+    if pa is None:
+        raise RuntimeError("导出需要 pyarrow，请先安装：uv sync --extra analytics（或 pip install pyarrow）")
+
+    os.makedirs(out_dir, exist_ok=True)
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    sessions = ColumnarWriter(os.path.join(out_dir, f"sessions.{ext}"), sessions_schema(), fmt, row_group_size)
+    turns = ColumnarWriter(os.path.join(out_dir, f"turns.{ext}"), turns_schema(), fmt, row_group_size)
+
+    try:
+        if inputs:
+            for record in iter_records(inputs):
+                if scenario and record.get("scenario") != scenario:
+                    continue
+                session_row, turn_rows = record_rows(record)
+                sessions.add(session_row)
+                for row in turn_rows:
+                    turns.add(row)
+        else:
+            if not os.path.exists(db):
+                raise FileNotFoundError(f"转录库不存在: {db}")
+            conn = sqlite3.connect(db)
+            try:
+                for row in iter_store_sessions(conn, scenario):
+                    sessions.add(row)
+                for row in iter_store_turns(conn, scenario):
+                    turns.add(row)
+            finally:
+                conn.close()
+    finally:
+        num_sessions = sessions.close()
+        num_turns = turns.close()
+    return num_sessions, num_turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出会话和发言为 Parquet / Arrow 列式文件")
+    parser.add_argument("inputs", nargs="*", help="会话记录 JSONL 或 batch_jobs 的 results 目录（不给则读取转录库）")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"转录库路径（默认 {DEFAULT_DB}）")
+    parser.add_argument("-o", "--out-dir", default="exports", help="输出目录")
+    parser.add_argument("--scenario", default=None, help="只导出指定场景")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet", help="输出格式")
+    parser.add_argument("--row-group-size", type=int, default=50000, help="每个行组的行数")
+    args = parser.parse_args()
+
+    num_sessions, num_turns = export(
+        args.out_dir,
+        inputs=args.inputs,
+        db=args.db,
+        scenario=args.scenario,
+        fmt=args.format,
+        row_group_size=args.row_group_size,
+    )
+    print(f"✅ 已导出 {num_sessions} 个会话、{num_turns} 条发言 → {args.out_dir}/")
+
+
+if __name__ == "__main__":
+    main()
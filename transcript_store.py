@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# 转录库：把所有场景的每一轮发言追加写入 SQLite（WAL 模式），带索引和全文检索
+#
+# 表结构：
+#   sessions  每个会话一行（场景、模型、配置、开始/结束时间、状态、结果）
+#   turns     每轮发言一行（只追加；重跑一个会话时整体删掉上次的发言），记录角色、模型、内容、token、耗时、finish_reason
+#   turns_fts turns.content 的 FTS5 全文索引（trigram 分词，中文可直接按子串检索）
+#
+# 写入由后台线程批量完成：对话循环里只是把记录放进队列，不等待磁盘。
+#
+# 用法示例：
+#   python transcript_store.py search "海龟汤" --scenario turtle_soup --role 主持人
+#   python transcript_store.py stats
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB = os.getenv("QDD_TRANSCRIPT_DB", "transcripts.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id  TEXT PRIMARY KEY,
+    scenario    TEXT NOT NULL,
+    model       TEXT,
+    config      TEXT,
+    started_at  REAL,
+    finished_at REAL,
+    status      TEXT,
+    outcome     TEXT,
+    error       TEXT
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id                INTEGER PRIMARY KEY,
+    session_id        TEXT NOT NULL,
+    scenario          TEXT NOT NULL,
+    turn_index        INTEGER,
+    role              TEXT NOT NULL,
+    model             TEXT,
+    content           TEXT NOT NULL,
+    prompt_tokens     INTEGER,
+    completion_tokens INTEGER,
+    latency           REAL,
+    finish_reason     TEXT,
+    created_at        REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_scenario ON sessions (scenario, started_at);
+CREATE INDEX IF NOT EXISTS idx_turns_session ON turns (session_id, turn_index);
+CREATE INDEX IF NOT EXISTS idx_turns_scenario_role ON turns (scenario, role);
+CREATE INDEX IF NOT EXISTS idx_turns_model ON turns (model);
+CREATE INDEX IF NOT EXISTS idx_turns_created ON turns (created_at);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+    content, content='turns', content_rowid='id', tokenize='{tokenizer}'
+);
+CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_fts_delete AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts (turns_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+UPSERT_SESSION = """
+INSERT INTO sessions (session_id, scenario, model, config, started_at, finished_at, status, outcome, error)
+VALUES (:session_id, :scenario, :model, :config, :started_at, :finished_at, :status, :outcome, :error)
+ON CONFLICT (session_id) DO UPDATE SET
+    model       = COALESCE(excluded.model, model),
+    config      = COALESCE(excluded.config, config),
+    started_at  = COALESCE(excluded.started_at, started_at),
+    finished_at = COALESCE(excluded.finished_at, finished_at),
+    status      = COALESCE(excluded.status, status),
+    outcome     = COALESCE(excluded.outcome, outcome),
+    error       = COALESCE(excluded.error, error)
+"""
+
+DISCARD_SESSION = (
+    "DELETE FROM turns WHERE session_id = :session_id",
+    "DELETE FROM sessions WHERE session_id = :session_id",
+)
+
+INSERT_TURN = """
+INSERT INTO turns (session_id, scenario, turn_index, role, model, content,
+                   prompt_tokens, completion_tokens, latency, finish_reason, created_at)
+VALUES (:session_id, :scenario, :turn_index, :role, :model, :content,
+        :prompt_tokens, :completion_tokens, :latency, :finish_reason, :created_at)
+"""
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下 NORMAL 足够安全，且写入快得多
+    return conn
+
+
+def init_schema(conn):
+    conn.executescript(SCHEMA)
+    try:
+        conn.executescript(FTS_SCHEMA.format(tokenizer="trigram"))
+    except sqlite3.OperationalError:
+        # SQLite < 3.34 没有 trigram 分词器，退回 unicode61（中文只能按整段匹配）
+        conn.executescript(FTS_SCHEMA.format(tokenizer="unicode61"))
+    conn.commit()
+
+
+class TranscriptStore:
+    """追加写入的转录库，可以被多个会话 / 线程共享
+
+    add_turn / start_session / finish_session 只是入队，由后台线程每攒够 batch_size 条
+    或每隔 flush_interval 秒在一个事务里批量写入。多个进程可以同时写同一个库（WAL + busy timeout）。
+    """
+
+    def __init__(self, path=DEFAULT_DB, batch_size=200, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = connect(path)
+        init_schema(self.conn)
+
+        self.queue = queue.Queue()
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop, name="transcript-writer", daemon=True)
+        self.writer.start()
+
+    # ============ 写入（非阻塞） ============
+    def start_session(self, session_id, scenario, model=None, config=None, started_at=None):
+        self.queue.put(("session", {
+            "session_id": session_id,
+            "scenario": scenario,
+            "model": model,
+            "config": json.dumps(config, ensure_ascii=False, default=str) if config is not None else None,
+            "started_at": started_at or time.time(),
+            "finished_at": None,
+            "status": "running",
+            "outcome": None,
+            "error": None,
+        }))
+
+    def finish_session(self, session_id, scenario, status, outcome=None, error=None, model=None, config=None):
+        self.queue.put(("session", {
+            "session_id": session_id,
+            "scenario": scenario,
+            "model": model,
+            "config": json.dumps(config, ensure_ascii=False, default=str) if config is not None else None,
+            "started_at": None,
+            "finished_at": time.time(),
+            "status": status,
+            "outcome": outcome,
+            "error": error,
+        }))
+
+    def discard_session(self, session_id):
+        """删掉一个会话已经写入的全部记录（用同一个 session_id 重跑时先调用，避免发言被重复计数）"""
+        self.queue.put(("discard", {"session_id": session_id}))
+
+    def add_turn(self, session_id, scenario, role, content, turn_index=None, model=None,
+                 prompt_tokens=None, completion_tokens=None, latency=None, finish_reason=None):
+        self.queue.put(("turn", {
+            "session_id": session_id,
+            "scenario": scenario,
+            "turn_index": turn_index,
+            "role": role,
+            "model": model,
+            "content": content,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": latency,
+            "finish_reason": finish_reason,
+            "created_at": time.time(),
+        }))
+
+    def flush(self):
+        """等待队列中已有的记录全部写入"""
+        self.queue.join()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join()
+        self.conn.close()
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            records = [entry for entry in batch if entry is not None]
+            try:
+                self._write_batch(records)
+            except sqlite3.Error as e:
+                print(f"⚠️ 转录库写入失败（丢弃 {len(records)} 条）: {e}")
+            for _ in batch:
+                self.queue.task_done()
+            if batch[-1] is None:
+                return
+
+    def _write_batch(self, records):
+        with self.conn:  # 一个事务
+            for kind, params in records:
+                if kind == "discard":
+                    for sql in DISCARD_SESSION:
+                        self.conn.execute(sql, params)
+                else:
+                    self.conn.execute(UPSERT_SESSION if kind == "session" else INSERT_TURN, params)
+
+
+# ============ 查询 ============
+def search(conn, query, scenario=None, role=None, limit=20):
+    """全文检索发言内容，返回 [(session_id, scenario, turn_index, role, content), ...]
+
+    trigram 索引只能匹配 3 个字符以上的查询，更短的查询退回 LIKE 扫描。
+    """
+    where, params = [], []
+    if len(query) >= 3:
+        source = "turns_fts JOIN turns ON turns.id = turns_fts.rowid"
+        where.append("turns_fts MATCH ?")
+        params.append('"' + query.replace('"', '""') + '"')
+    else:
+        source = "turns"
+        where.append("turns.content LIKE ?")
+        params.append(f"%{query}%")
+    if scenario:
+        where.append("turns.scenario = ?")
+        params.append(scenario)
+    if role:
+        where.append("turns.role = ?")
+        params.append(role)
+    sql = (
+        f"SELECT turns.session_id, turns.scenario, turns.turn_index, turns.role, turns.content FROM {source} "
+        f"WHERE {' AND '.join(where)} ORDER BY turns.id DESC LIMIT ?"
+    )
+    return conn.execute(sql, params + [limit]).fetchall()
+
+
+def stats(conn):
+    """按场景汇总会话数、发言数、token 和平均耗时"""
+    return conn.execute("""
+        SELECT scenario,
+               COUNT(DISTINCT session_id),
+               COUNT(*),
+               SUM(COALESCE(prompt_tokens, 0)),
+               SUM(COALESCE(completion_tokens, 0)),
+               AVG(latency)
+        FROM turns GROUP BY scenario ORDER BY scenario
+    """).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询转录库")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"转录库路径（默认 {DEFAULT_DB}）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_search = sub.add_parser("search", help="全文检索发言内容")
+    p_search.add_argument("query")
+    p_search.add_argument("--scenario", default=None)
+    p_search.add_argument("--role", default=None)
+    p_search.add_argument("--limit", type=int, default=20)
+
+    sub.add_parser("stats", help="按场景汇总")
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+    init_schema(conn)
+
+    if args.command == "search":
+        rows = search(conn, args.query, args.scenario, args.role, args.limit)
+        for session_id, scenario, turn_index, role, content in rows:
+            text = " ".join(content.split())
+            print(f"[{scenario}/{session_id}#{turn_index}] {role}: {text[:120]}")
+        print(f"\n共 {len(rows)} 条结果")
+    else:
+        print(f"{'场景':<14}{'会话':>8}{'发言':>10}{'输入token':>14}{'输出token':>14}{'平均耗时':>10}")
+        for scenario, sessions, turns, prompt, completion, latency in stats(conn):
+            latency = f"{latency:.2f}s" if latency is not None else "-"
+            print(f"{scenario:<14}{sessions:>8}{turns:>10}{prompt:>14,}{completion:>14,}{latency:>10}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
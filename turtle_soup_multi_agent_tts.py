@@ -1,15 +1,31 @@
 #!/usr/bin/env python3
 # 多 Agent 海龟汤游戏 - 主持人 + 3 个 AI 玩家互相讨论推理（带 OpenAI TTS 语音）
 import os
+import time
+import uuid
 from openai import OpenAI
 from dotenv import load_dotenv
-import random
 import pygame
 import tempfile
 from pathlib import Path
 import threading
 import sys
 import select
+import argparse
+from types import SimpleNamespace
+
+from answer_cache import DEFAULT_CACHE_DIR, open_answer_cache
+from checkpoint import SessionCheckpoint, default_checkpoint_path, read_checkpoint_meta
+from compact_transcript import History, Transcript
+from host_verdict import RESPONSE_FORMAT, VERDICT_INSTRUCTIONS, is_answered, parse_host_verdict
+from model_router import get_router
+from puzzle_corpus import DEFAULT_CORPUS, open_corpus
+from question_index import QuestionIndex, extract_question
+from rolling_memory import RollingMemory, summary_request
+from speech_breaker import REQUEST_TIMEOUT, SpeechBreakers
+from token_accounting import TokenLedger, count_message_tokens, fit_max_tokens
+from transcript_store import DEFAULT_DB, TranscriptStore
+from warmup import Warmup, likely_puzzles
 
 load_dotenv()
 
@@ -51,6 +67,7 @@ TTS_VOICES = {
 
 # 是否启用 TTS（可以通过这个开关控制）
 ENABLE_TTS = True
+tts_breakers = SpeechBreakers()  # 按音色熔断：服务挂掉或变慢时自动退回纯文字，恢复后重新朗读（speech_breaker.py）
 
 # 初始化 pygame mixer（用于播放音频）
 if ENABLE_TTS:
@@ -61,29 +78,14 @@ if ENABLE_TTS:
         print(f"⚠️ TTS 初始化失败: {e}，将只显示文字")
         ENABLE_TTS = False
 
+# ============ 游戏参数 ============
+MAX_ROUNDS = 15            # 最多15轮对话
+CONTEXT_MAX_MESSAGES = 15  # 玩家发言时能看到的最近对话条数
+HOST_TEMPERATURE = 0.3     # 主持人用低温度，保证判定稳定
+
 # ============ 海龟汤题库 ============
-TURTLE_SOUP_PUZZLES = [
-    {
-        "title": "海龟汤",
-        "story": "一个男人在餐厅点了一碗海龟汤，喝了一口后就自杀了。为什么？",
-        "answer": """这个男人曾经和朋友一起遇到海难，漂流到荒岛上。朋友为了救他，割下自己的肉做成汤给他喝，谎称是海龟汤。后来获救了，男人在餐厅喝到真正的海龟汤，发现味道完全不同，意识到当年朋友牺牲了自己，愧疚之下自杀了。"""
-    },
-    {
-        "title": "推理之夜",
-        "story": "一个女人在深夜回家，发现家里所有的灯都灭了。她打开灯后立刻大哭起来。为什么？",
-        "answer": """这个女人是灯塔看守人。她回家前忘记检查灯塔的灯，晚上灯塔灯灭了导致一艘船撞上礁石沉没。当她意识到这一点时，崩溃大哭。"""
-    },
-    {
-        "title": "电梯悬案",
-        "story": "一个矮个子男人每天坐电梯上楼，晴天时他坐到15楼然后走楼梯到20楼，雨天时他直接坐到20楼。为什么？",
-        "answer": """这个男人是侏儒，够不到20楼的按钮，只能按到15楼。雨天时他带着雨伞，可以用雨伞按到20楼的按钮。"""
-    },
-    {
-        "title": "午夜来电",
-        "story": "一个男人半夜接到电话，听到一声「喂」后挂断，然后他就自杀了。为什么？",
-        "answer": """这个男人是盲人，他的妻子多年前出车祸昏迷成植物人。他每天都给妻子打电话，护士会把电话放在妻子耳边。这天半夜妻子突然醒了，自己接电话说了「喂」。但男人以为是恶作剧或者护士懒得帮忙，愤怒地挂断了电话。妻子以为丈夫不要她了，伤心地拔掉氧气管自杀了。第二天男人得知真相后，愧疚自杀。"""
-    }
-]
+# 题目由 puzzle_corpus.py 加载：默认是内置的四道题，--corpus / QDD_PUZZLE_CORPUS 指定 JSONL 题库
+MENU_LIMIT = 20  # 题库不超过这么多道题时列出完整菜单，否则按标题 / 标签 / 难度选题
 
 # ============ Agent 角色设定 ============
 def create_host_prompt(puzzle):
@@ -104,6 +106,8 @@ def create_host_prompt(puzzle):
 4. 当玩家完全猜对时，确认并揭晓完整答案
 5. 保持简短回答，让玩家继续推理
 
+{VERDICT_INSTRUCTIONS}
+
 记住：你只回答玩家的直接提问，不参与他们的讨论。"""
 
 PLAYER1_PROMPT = """你是【逻辑侦探 - 福尔摩斯】，擅长逻辑推理和细节分析。
@@ -180,14 +184,16 @@ class TokenCounter:
         self.total_completion_tokens = 0
         self.total_tokens = 0
         self.api_calls = 0
+        self.lock = threading.Lock()  # 后台预生成的调用和主线程同时计数
         
     def add(self, usage):
         """添加一次 API 调用的 token 使用"""
         if usage:
-            self.total_prompt_tokens += usage.prompt_tokens
-            self.total_completion_tokens += usage.completion_tokens
-            self.total_tokens += usage.total_tokens
-            self.api_calls += 1
+            with self.lock:
+                self.total_prompt_tokens += usage.prompt_tokens
+                self.total_completion_tokens += usage.completion_tokens
+                self.total_tokens += usage.total_tokens
+                self.api_calls += 1
     
     def print_summary(self):
         """打印统计摘要"""
@@ -219,6 +225,204 @@ class TokenCounter:
 token_counter = TokenCounter()
 
 
+# ============ 单局游戏会话 ============
+class GameSession:
+    """一局游戏的运行状态：token 统计、存档和转录
+
+    checkpoint_path 不为空时每次模型调用和人类输入都写入存档；resume=True 时从存档继续，
+    已完成的调用和输入直接回放（回放期间不播放语音、不等待按键）。
+    store 不为空时每条发言都追加到转录库；回放的发言不重复写入。
+    answer_cache_dir 不为空时使用按题目持久化的主持人答案缓存（answer_cache.py）。
+    speculate=True 时在人类玩家输入期间提前生成下一名 AI 玩家的发言（SpeculativeTurn）；
+    input_timeout 为选择操作的等待秒数，超时视为跳过（为空时一直等待）。
+    warmup=True 时选题期间在后台预热连接和前缀缓存。
+    memory_budget 不为空时每个角色发给模型的历史不超过这么多 token：较早的对话在后台合并成摘要（rolling_memory.py）。
+    corpus 为题库（puzzle_corpus.py，为空时用默认题库）；tag / difficulty 为随机选题时的筛选条件。
+    """
+
+    def __init__(self, checkpoint_path=None, resume=False, store=None, answer_cache_dir=DEFAULT_CACHE_DIR,
+                 speculate=True, input_timeout=None, warmup=True, memory_budget=None,
+                 corpus=None, tag=None, difficulty=None):
+        self.token_counter = TokenCounter()
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.checkpoint = None
+        self.session_id = uuid.uuid4().hex[:12]
+        self.store = store
+        self.questions = QuestionIndex()  # 本局问过的问题和主持人的回答
+        self.answer_cache_dir = answer_cache_dir
+        self.answer_cache = None
+        self.cached_answers = 0
+        self.speculate = speculate
+        self.input_timeout = input_timeout
+        self.warmup = warmup
+        self.memory_budget = memory_budget
+        self.memories = {}  # 角色 -> RollingMemory
+        self.ledgers = {}   # 调用角色 -> TokenLedger（这个角色历史的累计 token 数，每次调用只计新增的消息）
+        self.ledgers_lock = threading.Lock()
+        self.corpus = corpus or puzzle_corpus()
+        self.tag = tag
+        self.difficulty = difficulty
+        self._local = threading.local()
+        self.last_call = None  # 最近一次模型调用 / 人类输入的信息，供 log() 写入转录库
+        self.transcript = Transcript()  # 全局对话记录（供玩家参考），也是本局所有 agent 历史共用的文本缓冲
+        self.outcome = None    # solved / max_rounds / interrupted / error
+        self.error = None
+
+    @property
+    def last_call(self):
+        """本线程最近一次模型调用的信息（后台预生成的调用不会覆盖主线程的）"""
+        return getattr(self._local, "last_call", None)
+
+    @last_call.setter
+    def last_call(self, value):
+        self._local.last_call = value
+
+    @property
+    def replaying(self):
+        """是否正在回放存档"""
+        return self.checkpoint is not None and self.checkpoint.replaying
+
+    def resumed_puzzle(self):
+        """从存档中读出上次的题目"""
+        if not (self.resume and self.checkpoint_path):
+            return None
+        meta = read_checkpoint_meta(self.checkpoint_path)
+        if meta and meta.get("puzzle"):
+            if "corpus" in meta:  # 按存档记录的题库找题，与这次指定的题库无关
+                self.corpus = puzzle_corpus(meta["corpus"])
+            return self.corpus.get(meta["puzzle"])
+        return None
+
+    @property
+    def corpus_path(self):
+        """题库的绝对路径（内置题目为 None），记入存档供恢复时找回同一道题"""
+        return os.path.abspath(self.corpus.path) if self.corpus.path else None
+
+    def start(self, puzzle):
+        """题目确定后打开存档、在转录库中登记本局"""
+        if self.answer_cache_dir:
+            self.answer_cache = open_answer_cache(puzzle["title"], self.answer_cache_dir)
+        if self.store:
+            self.store.start_session(self.session_id, "turtle_soup_tts", model=MODEL_ID, config={
+                "puzzle": puzzle["title"],
+                "player_temperature": 0.8,
+                "host_temperature": HOST_TEMPERATURE,
+                "max_rounds": MAX_ROUNDS,
+                "max_messages": CONTEXT_MAX_MESSAGES,
+                "memory_budget": self.memory_budget,
+            })
+        if self.checkpoint_path and self.checkpoint is None:
+            self.checkpoint = SessionCheckpoint(
+                self.checkpoint_path,
+                meta={"scenario": "turtle_soup_tts", "puzzle": puzzle["title"], "corpus": self.corpus_path},
+                resume=self.resume,
+            )
+            if self.resume:
+                print(f"♻️ 从存档恢复: {self.checkpoint_path}（已完成 {self.checkpoint.resumed_turns} 条记录）")
+
+    def ask(self, key, prompt, timeout=None):
+        """读取人类玩家的输入并写入存档；存档中已有时直接回放
+
+        timeout 秒内没有输入时视为空输入（超时结果同样写入存档，恢复时按原样回放）
+        """
+        if self.checkpoint:
+            recorded = self.checkpoint.replay(key)
+            if recorded is not None:
+                print(f"{prompt}{recorded}（存档）")
+                self.last_call = {"replayed": True}
+                return recorded
+        try:
+            value = timed_input(prompt, timeout).strip()
+        except EOFError:
+            value = ""
+        if self.checkpoint:
+            self.checkpoint.save(key, value)
+        self.last_call = None
+        return value
+
+    def cached_answer(self, question, key):
+        """在答案缓存中查找其他对局问过的相似问题，命中时返回主持人当时的回答（同时写入存档）"""
+        if not self.answer_cache or (self.checkpoint and key in self.checkpoint.records):
+            return None  # 存档里已有的调用照常回放，保证恢复后的对局与原来一致
+        hit = self.answer_cache.lookup(question)
+        if hit is None:
+            return None
+        asked, response, score = hit
+        self.cached_answers += 1
+        self.last_call = {"model": "answer_cache"}
+        if self.checkpoint:
+            self.checkpoint.save(key, {"content": response, "usage": None})
+        print(f"\n⚖️ 主持人（答案缓存，同「{asked}」，相似度 {score:.2f}）")
+        return response
+
+    def prompt_tokens(self, role, messages):
+        """messages 作为 role 这次调用的输入时的 token 数（同一角色的历史只追加，只计上次之后新增的消息）"""
+        with self.ledgers_lock:
+            ledger = self.ledgers.setdefault(tuple(role), TokenLedger(MODEL_ID))
+            return ledger.prompt_tokens(messages)
+
+    def context(self, name, history):
+        """角色 name 这次发给模型的消息：没有 token 预算时就是完整历史，否则为 系统提示词 + 摘要 + 最近的对话"""
+        if not self.memory_budget:
+            return history
+        if name not in self.memories:
+            self.memories[name] = RollingMemory(lambda summary, chunk, end: self._summarize(name, summary, chunk, end),
+                                                self.memory_budget)
+        return self.memories[name].messages(history)
+
+    def _summarize(self, name, summary, messages, end):
+        """把滑出窗口的消息合并进摘要（在后台线程中调用；结果写入存档，恢复时直接回放）"""
+        memory = self.memories[name]
+        content = call_model(summary_request(summary, messages), temperature=0.2, max_tokens=memory.summary_budget,
+                             game=self, key=f"摘要:{name}:{end}", quiet=True, role=("摘要", name))
+        if content.startswith(("[系统错误", "[模型返回空响应")):
+            raise RuntimeError(content)
+        return content
+
+    def remember_answer(self, question, response):
+        """把主持人的判定放进答案缓存（只保留验证过的判定）"""
+        if self.answer_cache:
+            self.answer_cache.add(question, response)
+
+    def player_prompt_at(self, position):
+        """对话记录有 position 条发言时发给 AI 玩家的提示词（玩家的 History 按需生成，不保存）"""
+        return player_prompt(create_context_message(self.transcript, max_messages=CONTEXT_MAX_MESSAGES, end=position))
+
+    def log(self, speaker, content):
+        """记录一条发言到对话记录（供玩家参考）和转录库，返回这条发言（Turn）"""
+        turn = self.transcript.append(speaker, content)
+        call, self.last_call = self.last_call or {}, None
+        if self.store and not call.get("replayed"):
+            self.store.add_turn(
+                self.session_id,
+                "turtle_soup_tts",
+                speaker,
+                content,
+                turn_index=turn.index,
+                model=call.get("model"),
+                prompt_tokens=call.get("prompt_tokens"),
+                completion_tokens=call.get("completion_tokens"),
+                latency=call.get("latency"),
+                finish_reason=call.get("finish_reason"),
+            )
+        return turn
+
+    def close(self):
+        for memory in self.memories.values():
+            memory.wait()  # 后台摘要还要写存档
+        if self.checkpoint:
+            self.checkpoint.close()
+        if self.store:
+            self.store.finish_session(
+                self.session_id,
+                "turtle_soup_tts",
+                "error" if self.error else "completed",
+                outcome=self.outcome,
+                error=self.error,
+            )
+
+
 # ============ TTS 函数 ============
 def speak_text(text, speaker_name, interruptible=True):
     """
@@ -243,26 +447,36 @@ def speak_text(text, speaker_name, interruptible=True):
     if len(clean_text) > 4000:
         clean_text = clean_text[:4000] + "..."
     
-    # 获取该角色的音色
+    # 获取该角色的音色；熔断期间直接跳过（只显示文字）
     voice = TTS_VOICES.get(speaker_name, "alloy")
+    if not tts_breakers.allow(voice):
+        return False
     
+    tmp_path = None
+    start = time.perf_counter()
     try:
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_file:
-            tmp_path = tmp_file.name
-        
-        # 调用 OpenAI TTS API
-        response = client.audio.speech.create(
+        # 调用 OpenAI TTS API（不自动重试：失败交给熔断器处理，不在这里多等几次超时）
+        response = client.with_options(max_retries=0, timeout=REQUEST_TIMEOUT).audio.speech.create(
             model=TTS_MODEL,
             voice=voice,
             input=clean_text,
             response_format="mp3",
-            speed=1.0  # 语速：0.25 到 4.0，默认 1.0
+            speed=1.0,  # 语速：0.25 到 4.0，默认 1.0
         )
         
         # 保存音频到临时文件
+        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_file:
+            tmp_path = tmp_file.name
         response.stream_to_file(tmp_path)
-        
+        tts_breakers.record(voice, time.perf_counter() - start)
+    except Exception as e:
+        tts_breakers.record(voice, error=e)
+        print(f"   ⚠️ TTS 错误: {e}")
+        if tmp_path:
+            os.unlink(tmp_path)
+        return False
+    
+    try:
         # 播放音频
         pygame.mixer.music.load(tmp_path)
         pygame.mixer.music.play()
@@ -312,31 +526,70 @@ def speak_text(text, speaker_name, interruptible=True):
 
 
 # ============ 辅助函数 ============
-def call_model(messages, temperature=0.8, max_tokens=16000):
+def call_model(messages, temperature=0.8, max_tokens=16000, game=None, key=None, response_format=None, quiet=False, role=()):
     """调用模型生成响应并统计 token
     
     注意：max_tokens 上限为 16384（API 限制）
     - 推荐值：8000（足够 R1 推理模型使用）
     - 最大值：16000（接近上限，成本较高）
+    
+    game: 当前对局（GameSession），提供 token 统计和存档；为空时使用全局计数器
+    key: 本次调用在存档中的标识（如 "3:柯南"），存档里已有时直接返回记录的结果
+    response_format: 结构化输出要求（如主持人的 JSON 判定），为空时输出普通文本
+    quiet: 不打印本次调用的 token（后台预生成时使用，避免打断人类玩家的输入）
+    role: 发言角色（如 ("柯南", "玩家")），按路由表（model_router.py）选模型和端点，失败时自动切换线路
     """
+    counter = game.token_counter if game else token_counter
+    checkpoint = game.checkpoint if game and key else None
+    if checkpoint:
+        recorded = checkpoint.replay(key)
+        if recorded is not None:
+            if recorded.get("usage"):
+                counter.add(SimpleNamespace(**recorded["usage"]))
+            game.last_call = {"replayed": True}
+            return recorded["content"]
+    
     try:
-        response = client.chat.completions.create(
-            model=MODEL_ID,
+        extra_args = {}
+        if response_format:
+            extra_args["response_format"] = response_format
+        
+        # 请求前预估提示词的 token 数（按角色累计，只计新增的消息）：据此收紧 max_tokens、在端点限额内排队
+        prompt_tokens = game.prompt_tokens(role, messages) if game else count_message_tokens(messages, MODEL_ID)
+        max_tokens = fit_max_tokens(prompt_tokens, max_tokens)
+        
+        start = time.perf_counter()
+        response, route = get_router().complete(
+            role,
+            MODEL_ID,
+            estimated_tokens=prompt_tokens + max_tokens,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
+            **extra_args,
         )
+        latency = time.perf_counter() - start
         
         # 统计 token 使用
         if hasattr(response, 'usage') and response.usage:
-            token_counter.add(response.usage)
+            counter.add(response.usage)
             # 实时显示本次调用的 token 使用
             usage = response.usage
-            print(f"   [Token: 输入={usage.prompt_tokens}, 输出={usage.completion_tokens}, 总计={usage.total_tokens}]")
+            if not quiet:
+                print(f"   [Token: 输入={usage.prompt_tokens}, 输出={usage.completion_tokens}, 总计={usage.total_tokens}]")
         
         # 获取响应内容
         content = response.choices[0].message.content
         finish_reason = response.choices[0].finish_reason
+        if game:
+            usage = getattr(response, 'usage', None)
+            game.last_call = {
+                "model": route.model,
+                "prompt_tokens": usage.prompt_tokens if usage else None,
+                "completion_tokens": usage.completion_tokens if usage else None,
+                "latency": round(latency, 3),
+                "finish_reason": finish_reason,
+            }
         
         # 检查是否为空或被截断
         if not content or content.strip() == "":
@@ -351,6 +604,17 @@ def call_model(messages, temperature=0.8, max_tokens=16000):
             
             return "[模型返回空响应，请查看上方建议]"
         
+        if checkpoint:
+            usage = getattr(response, 'usage', None)
+            checkpoint.save(key, {
+                "content": content,
+                "usage": {
+                    "prompt_tokens": usage.prompt_tokens,
+                    "completion_tokens": usage.completion_tokens,
+                    "total_tokens": usage.total_tokens,
+                } if usage else None,
+            })
+        
         return content
         
     except Exception as e:
@@ -360,13 +624,164 @@ def call_model(messages, temperature=0.8, max_tokens=16000):
         return f"[系统错误: {e}]"
 
 
-def create_context_message(recent_messages, max_messages=10):
-    """创建上下文消息（最近N条对话）"""
-    return "\n".join(recent_messages[-max_messages:])
+def timed_input(prompt, timeout=None):
+    """读取一行输入；timeout 秒内没有输入时返回空字符串（为空时一直等待）"""
+    if not timeout:
+        return input(prompt)
+    print(prompt, end="", flush=True)
+    if sys.platform != 'win32':
+        # macOS/Linux 使用 select
+        if select.select([sys.stdin], [], [], timeout)[0]:
+            line = sys.stdin.readline()
+            if not line:
+                raise EOFError
+            return line.rstrip("\n")
+    else:
+        # Windows 使用 msvcrt（开始输入后不再计时）
+        import msvcrt
+        deadline = time.monotonic() + timeout
+        chars = []
+        while chars or time.monotonic() < deadline:
+            if msvcrt.kbhit():
+                ch = msvcrt.getwche()
+                if ch in "\r\n":
+                    print()
+                    return "".join(chars)
+                chars.append(ch)
+            else:
+                time.sleep(0.05)
+    print(f"（{timeout:g} 秒内没有输入，跳过）")
+    return ""
+
+
+def player_prompt(context):
+    """轮到某名 AI 玩家时发给他的消息"""
+    return f"""当前情况：
+{context}
+
+现在轮到你了。你可以：
+1. 和其他玩家讨论你的想法和推理
+2. 向主持人提出一个是非问题（格式：【向主持人提问】你的问题？）
+
+请思考后做出你的选择。注意：如果你想提问，必须用【向主持人提问】开头！"""
+
+
+class SpeculativeTurn:
+    """人类玩家输入期间，在后台提前生成下一名 AI 玩家的发言
+
+    生成时用的是"人类跳过"时的局面（对话记录的长度 position）；下一轮开始时如果局面没变（人类跳过、或没有实际发言），
+    直接提交生成结果，省下一次模型调用的等待；人类发言改变了局面时作废，重新生成。
+    预生成不写存档，提交时才按正常的 key 写入，所以恢复时与没有预生成的对局完全一致。
+    """
+
+    def __init__(self, game, player, position):
+        self.game = game
+        self.player = player
+        self.position = position
+        self.content = None
+        self.call = None
+        prompt = {"role": "user", "content": game.player_prompt_at(position)}
+        messages = game.context(player["name"], player["history"].messages() + [prompt])
+        self.thread = threading.Thread(target=self._run, args=(messages,), daemon=True)
+        self.thread.start()
+
+    def _run(self, messages):
+        self.content = call_model(messages, temperature=0.8, max_tokens=8000, game=self.game, quiet=True,
+                                  role=(self.player["name"], "玩家"))
+        self.call = self.game.last_call
+
+    def take(self, player, position, key):
+        """局面没变时返回预生成的发言（必要时等待生成完成）并写入存档；否则返回 None"""
+        if player is not self.player or position != self.position:
+            return None
+        self.thread.join()
+        call = self.call
+        if call and call.get("prompt_tokens") is not None:
+            print(f"   [Token: 输入={call['prompt_tokens']}, 输出={call['completion_tokens']}, "
+                  f"总计={call['prompt_tokens'] + call['completion_tokens']}]（提前生成）")
+        if call and self.game.checkpoint:
+            self.game.checkpoint.save(key, {
+                "content": self.content,
+                "usage": {
+                    "prompt_tokens": call["prompt_tokens"],
+                    "completion_tokens": call["completion_tokens"],
+                    "total_tokens": call["prompt_tokens"] + call["completion_tokens"],
+                } if call.get("prompt_tokens") is not None else None,
+            })
+        self.game.last_call = call
+        return self.content
+
+
+def create_context_message(transcript, max_messages=10, end=None):
+    """创建上下文消息（对话记录前 end 条中的最近 N 条，end 为空时到最新一条）"""
+    end = len(transcript) if end is None else end
+    return "\n".join(transcript.lines(max(end - max_messages, 0), end))
 
 
 # ============ 游戏主流程 ============
-def play_multi_agent_game():
+def puzzle_corpus(path=DEFAULT_CORPUS):
+    """打开题库（path 为空时使用内置题目），每道题主持人提示词的 token 数已经预先算好"""
+    return open_corpus(path, host_prompt=create_host_prompt)
+
+
+def find_puzzle(title, corpus=None):
+    """按标题查找题目"""
+    return (corpus or puzzle_corpus()).get(title)
+
+
+def start_warmup(game, resumed=None):
+    """玩家选题期间在后台预热：建立连接、计算主持人提示词 token、预热前缀缓存（见 warmup.py）
+
+    大题库只考虑菜单里的题目；随机抽到的题选定后再由 warmup.ensure 补上。
+    """
+    titles = game.corpus.titles(MENU_LIMIT)
+    if resumed and resumed["title"] not in titles:
+        titles.insert(0, resumed["title"])
+    host_prompts = {title: game.corpus.get(title)["host_prompt"] for title in titles}
+    likely = likely_puzzles(titles, game.answer_cache_dir, first=resumed["title"] if resumed else None)
+    return Warmup(
+        get_router(),
+        MODEL_ID,
+        host_prompts,
+        player_prompts={"福尔摩斯": PLAYER1_PROMPT, "柯南": PLAYER2_PROMPT, "波洛": PLAYER3_PROMPT},
+        counter=game.token_counter,
+    ).start(likely)
+
+
+def choose_puzzle(corpus, tag=None, difficulty=None):
+    """交互式选择题目：小题库列出菜单；大题库输入标题、#标签 或 难度，直接回车随机（按 tag / difficulty 筛选）"""
+    if len(corpus) <= MENU_LIMIT:
+        titles = corpus.titles()
+        print("\n请选择题目：")
+        for idx, title in enumerate(titles, 1):
+            print(f"  {idx}. {title}")
+        print("  r. 随机选择")
+    else:
+        titles = []
+        tags = sorted(corpus.groups("tag:").items(), key=lambda item: -item[1])[:10]
+        print(f"\n题库共 {len(corpus)} 道题。常见标签：" + "、".join(f"#{name[4:]}（{size}）" for name, size in tags))
+        print("  输入题目标题、#标签 或 难度数字；直接回车随机选择")
+    
+    while True:
+        choice = input("\n请输入选择 或 按 Enter 随机选择: ").strip()
+        try:
+            if not choice or choice.lower() == 'r':
+                return corpus.random(tag=tag, difficulty=difficulty)
+            elif titles and choice.isdigit() and 1 <= int(choice) <= len(titles):
+                return corpus.get(titles[int(choice) - 1])
+            elif choice.startswith("#"):
+                return corpus.random(tag=choice[1:], difficulty=difficulty)
+            elif choice.isdigit():
+                return corpus.random(tag=tag, difficulty=int(choice))
+            else:
+                return corpus.get(choice)
+        except ValueError as e:
+            print(f"❌ {e}，请重新输入")
+
+
+def play_multi_agent_game(game=None):
+    game = game or GameSession()
+    
     print("="*70)
     print("🐢 多 Agent 海龟汤推理游戏（带语音）")
     print("="*70)
@@ -382,22 +797,14 @@ def play_multi_agent_game():
         print("  - 每个 AI 角色都有独特的音色 🎭")
     print("="*70)
     
-    # 选择题目
-    print("\n请选择题目：")
-    for idx, puzzle in enumerate(TURTLE_SOUP_PUZZLES, 1):
-        print(f"  {idx}. {puzzle['title']}")
-    print("  r. 随机选择")
-    
-    while True:
-        choice = input("\n请输入题号 或 按 Enter 随机选择: ").strip().lower()
-        if not choice or choice == 'r':
-            puzzle = random.choice(TURTLE_SOUP_PUZZLES)
-            break
-        elif choice.isdigit() and 1 <= int(choice) <= len(TURTLE_SOUP_PUZZLES):
-            puzzle = TURTLE_SOUP_PUZZLES[int(choice) - 1]
-            break
-        else:
-            print("❌ 无效选择，请重新输入")
+    # 选择题目（继续上次的存档时沿用存档中的题目）；选题期间在后台预热
+    resumed = game.resumed_puzzle()
+    warmup = start_warmup(game, resumed) if game.warmup else None
+    puzzle = resumed or choose_puzzle(game.corpus, game.tag, game.difficulty)
+    if warmup:
+        warmup.ensure(puzzle["title"], puzzle.get("host_prompt"))
+        print(warmup.report(puzzle["title"]))
+    game.start(puzzle)
     
     # 开始游戏
     print("\n" + "="*70)
@@ -407,23 +814,19 @@ def play_multi_agent_game():
     print("让我们看看 AI 侦探们如何破解这个谜题...")
     print("="*70)
     
-    # 重置 token 计数器
-    global token_counter
-    token_counter = TokenCounter()
+    token_counter = game.token_counter
     print("\n📊 Token 统计已启动，将在游戏结束时显示...\n")
     
     # 初始化 Agent 对话历史
-    host_prompt = create_host_prompt(puzzle)
-    host_history = [{"role": "system", "content": host_prompt}]
+    host_prompt = puzzle.get("host_prompt") or create_host_prompt(puzzle)
+    host_history = History(game.transcript, system=host_prompt)
     
-    player1_history = [{"role": "system", "content": PLAYER1_PROMPT}]
-    player2_history = [{"role": "system", "content": PLAYER2_PROMPT}]
-    player3_history = [{"role": "system", "content": PLAYER3_PROMPT}]
+    player1_history = History(game.transcript, system=PLAYER1_PROMPT, render=game.player_prompt_at)
+    player2_history = History(game.transcript, system=PLAYER2_PROMPT, render=game.player_prompt_at)
+    player3_history = History(game.transcript, system=PLAYER3_PROMPT, render=game.player_prompt_at)
     
     # 全局对话记录（供所有玩家参考）
-    conversation_log = [
-        f"【主持人】题目：{puzzle['story']}"
-    ]
+    game.log("主持人", f"题目：{puzzle['story']}")
     
     # 玩家信息
     players = [
@@ -432,8 +835,9 @@ def play_multi_agent_game():
         {"name": "波洛", "emoji": "🎩", "history": player3_history},
     ]
     
-    max_rounds = 15  # 最多15轮对话
+    max_rounds = MAX_ROUNDS
     current_player = 0
+    speculative = None  # 人类输入期间提前生成的下一名 AI 玩家的发言
     
     try:
         for round_num in range(1, max_rounds + 1):
@@ -446,75 +850,80 @@ def play_multi_agent_game():
             player_emoji = player['emoji']
             player_history = player['history']
             
-            # 准备上下文（最近的对话）
-            context = create_context_message(conversation_log, max_messages=15)
+            # 玩家发言（提示词里是最近的对话，按当前对话记录的长度按需生成；人类输入期间已经提前想好、且局面没变时直接用）
+            position = len(game.transcript)
+            player_history.append_rendered("user", position)
             
-            # 玩家发言
-            player_history.append({
-                "role": "user",
-                "content": f"""当前情况：
-{context}
-
-现在轮到你了。你可以：
-1. 和其他玩家讨论你的想法和推理
-2. 向主持人提出一个是非问题（格式：【向主持人提问】你的问题？）
-
-请思考后做出你的选择。注意：如果你想提问，必须用【向主持人提问】开头！"""
-            })
-            
-            print(f"\n{player_emoji} {player_name}思考中...", flush=True)
-            player_response = call_model(player_history, temperature=0.8, max_tokens=8000)
-            
-            player_history.append({
-                "role": "assistant",
-                "content": player_response
-            })
+            player_response = speculative.take(player, position, key=f"{round_num}:{player_name}") if speculative else None
+            if speculative and player_response is None:
+                print(f"\n（局面有变化，{player_name}重新思考）")
+            speculative = None
+            if player_response is None:
+                print(f"\n{player_emoji} {player_name}思考中...", flush=True)
+                player_response = call_model(game.context(player_name, player_history.messages()), temperature=0.8, max_tokens=8000, game=game, key=f"{round_num}:{player_name}", role=(player_name, "玩家"))
             
             print(f"{player_emoji} {player_name}: {player_response}")
             
-            # 记录对话
-            conversation_log.append(f"【{player_name}】{player_response}")
+            # 记录对话（玩家自己的历史引用同一条记录，不再复制一份）
+            turn = game.log(player_name, player_response)
+            player_history.append_turn("assistant", turn)
             
             # 🔊 播放语音（支持中断）
-            speak_text(player_response, player_name, interruptible=True)
+            if not game.replaying:
+                speak_text(player_response, player_name, interruptible=True)
             
-            # 检查是否是向主持人提问
-            if "【向主持人提问】" in player_response or "向主持人提问" in player_response:
-                # 提取问题
-                question_part = player_response.split("】")[-1].strip() if "】" in player_response else player_response
-                
+            # 检查是否是向主持人提问（只取【向主持人提问】后面那一句格式正确的问题）
+            question_part = extract_question(player_response)
+            previous = game.questions.lookup(question_part) if question_part else None
+            if previous:
+                # 重复的问题：沿用之前的回答，不再调用主持人
+                asked, previous_response = previous
+                reply = parse_host_verdict(previous_response)["reply"]
+                print(f"\n⚖️ 主持人（重复问题，同「{asked}」）: {reply}")
+                game.log("主持人", f"这个问题之前问过了（{asked}）：{reply}")
+            elif question_part:
                 # 主持人回答
-                host_history.append({
-                    "role": "user",
-                    "content": f"玩家{player_name}的问题：{question_part}\n\n请根据你知道的答案，只回答：是/否/不重要/问得好，更具体些。保持简短。"
-                })
+                host_history.append("user", f"玩家{player_name}的问题：{question_part}\n\n请根据你知道的答案，按约定的 JSON 格式给出判定，reply 保持简短。")
                 
-                print(f"\n⚖️ 主持人思考中...", flush=True)
-                host_response = call_model(host_history, temperature=0.3, max_tokens=8000)
+                # 同一道题其他对局问过相似的问题时直接用缓存的判定，否则调用主持人
+                host_response = game.cached_answer(question_part, key=f"{round_num}:主持人")
+                if host_response is None:
+                    print(f"\n⚖️ 主持人思考中...", flush=True)
+                    host_response = call_model(game.context("主持人", host_history.messages()), temperature=HOST_TEMPERATURE, max_tokens=8000, game=game, key=f"{round_num}:主持人", response_format=RESPONSE_FORMAT, role=("主持人",))
+                    game.remember_answer(question_part, host_response)
+                verdict = parse_host_verdict(host_response)
+                if is_answered(host_response):  # 调用失败 / 无法解析的回答不记入，相似的问题下次重新问主持人
+                    game.questions.add(question_part, host_response)
                 
-                host_history.append({
-                    "role": "assistant",
-                    "content": host_response
-                })
+                host_history.append("assistant", host_response)
                 
-                print(f"⚖️ 主持人: {host_response}")
+                print(f"⚖️ 主持人: {verdict['reply']}")
                 
-                conversation_log.append(f"【主持人】{host_response}")
+                game.log("主持人", verdict["reply"])
                 
                 # 🔊 播放主持人语音（支持中断）
-                speak_text(host_response, "主持人", interruptible=True)
+                if not game.replaying:
+                    speak_text(verdict["reply"], "主持人", interruptible=True)
                 
-                # 检查是否猜对
-                if any(keyword in host_response for keyword in ["完全正确", "猜对了", "答案就是", "恭喜", "你们破解了"]):
+                # 检查是否猜对（以主持人的结构化判定为准）
+                if verdict["solved"]:
                     print("\n" + "="*70)
                     print("🎉 AI 侦探们成功破解了谜题！")
                     print("="*70)
                     print(f"\n📝 完整答案：\n{puzzle['answer']}")
                     print("="*70)
                     print(f"\n✅ 成功破解！共用 {round_num} 轮对话")
+                    game.outcome = "solved"
                     break
             
             # ========== 人类玩家参与环节 ==========
+            # 人类思考期间，先在后台按"跳过"的局面生成下一名 AI 玩家的发言
+            next_player = players[(current_player + 1) % 3]
+            next_key = f"{round_num + 1}:{next_player['name']}"
+            if (game.speculate and round_num < max_rounds
+                    and not (game.checkpoint and next_key in game.checkpoint.records)):
+                speculative = SpeculativeTurn(game, next_player, len(game.transcript))
+            
             print(f"\n{'─'*70}")
             print(f"👤 现在轮到你了！")
             print(f"{'─'*70}")
@@ -524,71 +933,72 @@ def play_multi_agent_game():
             print("  3. 跳过本轮")
             print(f"{'─'*70}")
             
-            try:
-                choice = input("请选择 (1/2/3 或直接按 Enter 跳过): ").strip()
-            except EOFError:
-                choice = "3"
+            choice = game.ask(f"{round_num}:人类:选择", "请选择 (1/2/3 或直接按 Enter 跳过): ", timeout=game.input_timeout)
             
             human_input = ""
             is_question = False
             
             if choice == "1":
                 # 发表想法
-                try:
-                    content = input("💬 你的想法: ").strip()
-                except EOFError:
-                    content = ""
+                content = game.ask(f"{round_num}:人类:想法", "💬 你的想法: ")
                 
                 if content:
                     human_input = content
                     print(f"\n👤 人类玩家: {human_input}")
-                    conversation_log.append(f"【人类玩家】{human_input}")
+                    game.log("人类玩家", human_input)
                     
             elif choice == "2":
                 # 向主持人提问
-                try:
-                    question = input("❓ 你的问题: ").strip()
-                except EOFError:
-                    question = ""
+                question = game.ask(f"{round_num}:人类:问题", "❓ 你的问题: ")
                 
                 if question:
                     human_input = f"【向主持人提问】{question}"
                     is_question = True
                     print(f"\n👤 人类玩家: {human_input}")
-                    conversation_log.append(f"【人类玩家】{human_input}")
+                    game.log("人类玩家", human_input)
                     
                     # 提取问题内容
                     question_part = question
-                    
+                    previous = game.questions.lookup(question_part)
+                
+                if question and previous:
+                    # 重复的问题：沿用之前的回答，不再调用主持人
+                    asked, previous_response = previous
+                    reply = parse_host_verdict(previous_response)["reply"]
+                    print(f"\n⚖️ 主持人（重复问题，同「{asked}」）: {reply}")
+                    game.log("主持人", f"这个问题之前问过了（{asked}）：{reply}")
+                elif question:
                     # 主持人回答
-                    host_history.append({
-                        "role": "user",
-                        "content": f"人类玩家的问题：{question_part}\n\n请根据你知道的答案，只回答：是/否/不重要/问得好，更具体些。保持简短。"
-                    })
+                    host_history.append("user", f"人类玩家的问题：{question_part}\n\n请根据你知道的答案，按约定的 JSON 格式给出判定，reply 保持简短。")
                     
-                    print(f"\n⚖️ 主持人思考中...", flush=True)
-                    host_response = call_model(host_history, temperature=0.3, max_tokens=8000)
+                    host_response = game.cached_answer(question_part, key=f"{round_num}:主持人:人类")
+                    if host_response is None:
+                        print(f"\n⚖️ 主持人思考中...", flush=True)
+                        host_response = call_model(game.context("主持人", host_history.messages()), temperature=HOST_TEMPERATURE, max_tokens=8000, game=game, key=f"{round_num}:主持人:人类", response_format=RESPONSE_FORMAT, role=("主持人",))
+                        game.remember_answer(question_part, host_response)
+                    verdict = parse_host_verdict(host_response)
+                    if is_answered(host_response):  # 调用失败 / 无法解析的回答不记入，相似的问题下次重新问主持人
+                        game.questions.add(question_part, host_response)
                     
-                    host_history.append({
-                        "role": "assistant",
-                        "content": host_response
-                    })
+                    host_history.append("assistant", host_response)
                     
-                    print(f"⚖️ 主持人: {host_response}")
+                    print(f"⚖️ 主持人: {verdict['reply']}")
                     
-                    conversation_log.append(f"【主持人】{host_response}")
+                    game.log("主持人", verdict["reply"])
                     
                     # 🔊 播放主持人语音（支持中断）
-                    speak_text(host_response, "主持人", interruptible=True)
+                    if not game.replaying:
+                        speak_text(verdict["reply"], "主持人", interruptible=True)
                     
-                    # 检查是否猜对
-                    if any(keyword in host_response for keyword in ["完全正确", "猜对了", "答案就是", "恭喜", "你们破解了"]):
+                    # 检查是否猜对（以主持人的结构化判定为准）
+                    if verdict["solved"]:
                         print("\n" + "="*70)
                         print("🎉 恭喜你破解了谜题！")
                         print("="*70)
                         print(f"\n📝 完整答案：\n{puzzle['answer']}")
                         print("="*70)
                         print(f"\n✅ 成功破解！共用 {round_num} 轮对话")
+                        game.outcome = "solved"
                         break
             else:
                 # 跳过或其他输入
@@ -598,12 +1008,13 @@ def play_multi_agent_game():
             current_player = (current_player + 1) % 3
             
             # 每三轮暂停一下
-            if round_num % 3 == 0 and round_num < max_rounds:
+            if not game.replaying and round_num % 3 == 0 and round_num < max_rounds:
                 print("\n" + "-"*70)
                 input("按 Enter 继续下一轮...")
         
         else:
             # for 循环正常结束（没有 break），说明达到最大轮数
+            game.outcome = "max_rounds"
             print("\n" + "="*70)
             print("⏰ 达到最大轮数限制")
             print("="*70)
@@ -611,27 +1022,71 @@ def play_multi_agent_game():
             print("="*70)
         
         # 无论是 break 还是正常结束，都打印 Token 统计
+        if game.questions.reused:
+            print(f"\n♻️ 重复问题 {game.questions.reused} 次，直接沿用了之前的回答（未调用主持人）")
+        if game.cached_answers:
+            print(f"♻️ 答案缓存命中 {game.cached_answers} 次（未调用主持人）")
         token_counter.print_summary()
+        get_router().print_summary()
+        tts_breakers.print_summary()
                 
     except KeyboardInterrupt:
+        game.outcome = "interrupted"
         print("\n\n⚠️ 游戏被中断")
         print(f"\n📝 答案：{puzzle['answer']}")
         # 打印 Token 统计
         token_counter.print_summary()
     except Exception as e:
+        game.outcome = "error"
+        game.error = f"{type(e).__name__}: {e}"
         print(f"\n❌ 错误: {type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
         # 打印 Token 统计
         token_counter.print_summary()
+    finally:
+        game.close()
 
 
 # ============ 主程序 ============
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多 Agent 海龟汤推理游戏（带语音，人类玩家参与）")
+    parser.add_argument("--resume", action="store_true", help="从存档的最后一步继续，不重新调用已完成的轮次")
+    parser.add_argument("--checkpoint", default=None, help="存档文件路径（默认 checkpoints/turtle_soup_tts.jsonl）")
+    parser.add_argument("--no-checkpoint", action="store_true", help="不写存档")
+    parser.add_argument("--store", default=DEFAULT_DB, help=f"转录库路径（默认 {DEFAULT_DB}）")
+    parser.add_argument("--no-store", action="store_true", help="不写转录库")
+    parser.add_argument("--answer-cache", default=DEFAULT_CACHE_DIR, help=f"主持人答案缓存目录（默认 {DEFAULT_CACHE_DIR}）")
+    parser.add_argument("--no-answer-cache", action="store_true", help="不使用答案缓存，每个问题都调用主持人")
+    parser.add_argument("--no-warmup", action="store_true", help="选题期间不预热连接和前缀缓存")
+    parser.add_argument("--no-speculate", action="store_true", help="不在人类输入期间提前生成下一名 AI 玩家的发言")
+    parser.add_argument("--input-timeout", type=float, default=None, help="选择操作的等待秒数，超时视为跳过（默认一直等待）")
+    parser.add_argument("--memory-budget", type=int, default=None, help="每个角色发给模型的历史最多多少 token，较早的对话在后台合并成摘要（默认不限）")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL 题库路径（默认内置题目；首次打开时在旁边建索引）")
+    parser.add_argument("--tag", default=None, help="随机选题时只抽带这个标签的题")
+    parser.add_argument("--difficulty", type=int, default=None, help="随机选题时只抽这个难度的题")
+    args = parser.parse_args()
+    
+    store = None if args.no_store else TranscriptStore(args.store)
     try:
-        play_multi_agent_game()
+        play_multi_agent_game(GameSession(
+            checkpoint_path=None if args.no_checkpoint else (args.checkpoint or default_checkpoint_path("turtle_soup_tts")),
+            resume=args.resume,
+            store=store,
+            answer_cache_dir=None if args.no_answer_cache else args.answer_cache,
+            speculate=not args.no_speculate,
+            input_timeout=args.input_timeout,
+            warmup=not args.no_warmup,
+            memory_budget=args.memory_budget,
+            corpus=puzzle_corpus(args.corpus),
+            tag=args.tag,
+            difficulty=args.difficulty,
+        ))
     except Exception as e:
         print(f"\n❌ 程序错误: {type(e).__name__}: {e}")
+    finally:
+        if store:
+            store.close()
     
     print("\n" + "="*70)
     print("感谢观看！👋")
@@ -0,0 +1,147 @@
+# 选题期间的后台预热：玩家看菜单、输入题号的这段时间里，提前把冷启动的开销付掉
+#
+#   1. 建立到各角色所用端点的连接（TCP + TLS），用的是路由器（model_router.py）里各端点的客户端，
+#      之后 call_model 经路由器发出的调用直接复用连接池里的这条连接
+#   2. 提前生成各题的主持人提示词并计算 token 数
+#   3. 对最可能被选中的题目发一次 max_tokens=1 的请求，让服务端的前缀缓存（prompt cache）
+#      提前缓存主持人 / 玩家的系统提示词，第一次真正的调用直接命中缓存；预热请求发给该角色
+#      当前排在第一位的线路（模型 + 端点），与真正调用时的选择一致
+#
+# 预热全部在后台线程里进行，失败只记录、不影响游戏；选定题目后如果这道题还没预热，
+# 会在第一名玩家思考期间补上（主持人的第一次调用在玩家提问之后）。
+import threading
+import time
+
+from answer_cache import cache_path
+from token_accounting import count_tokens
+
+PRIME_PUZZLES = 2  # 选题期间最多预热几道题的主持人提示词
+
+
+def likely_puzzles(titles, answer_cache_dir=None, first=None):
+    """按被选中的可能性排序题目：继续上次存档的题目最优先，其次是答案缓存里问题最多（玩得最多）的题"""
+    def popularity(title):
+        if not answer_cache_dir:
+            return 0
+        try:
+            with open(cache_path(title, answer_cache_dir), encoding="utf-8") as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    ranked = sorted(titles, key=popularity, reverse=True)  # sorted 是稳定的，同样热门时保持菜单顺序
+    if first in ranked:
+        ranked.remove(first)
+        ranked.insert(0, first)
+    return ranked
+
+
+class Warmup:
+    """一次预热
+
+    router: 模型路由器（get_router()）；default_model / model 与 call_model 传给路由器的相同
+    host_prompts: {题目: 主持人提示词}；player_prompts: {玩家名: 系统提示词}（与题目无关）
+    counter: 预热请求的 token 计入哪个 TokenCounter（为空时不计）
+    """
+
+    def __init__(self, router, default_model, host_prompts, player_prompts=None, model=None, counter=None, prime=True,
+                 host_roles=("主持人",)):
+        self.router = router
+        self.default_model = default_model
+        self.model = model
+        self.host_prompts = host_prompts
+        self.counter = counter
+        self.prime_enabled = prime
+        self.host_route = self.route(host_roles)
+        self.player_routes = [(self.route((name, "玩家")), prompt) for name, prompt in (player_prompts or {}).items()]
+        self.prompt_tokens = {}  # 题目 -> 主持人提示词 token 数
+        self.requested = set()   # 已经发出（或正在发）预热请求的 (线路, 系统提示词)
+        self.primed = set()      # 预热成功的 (线路, 系统提示词)
+        self.connect_time = None
+        self.errors = []
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def route(self, roles):
+        """角色这次调用会先尝试的线路"""
+        routes = self.router.routes(roles, self.default_model, self.model)
+        return routes[self.router.rank(routes)[0]]
+
+    def start(self, likely_titles):
+        """在后台开始预热，立即返回"""
+        self._spawn(self._run, likely_titles)
+        return self
+
+    def ensure(self, title, prompt=None):
+        """题目已选定：这道题还没预热时在后台补上（prompt 为不在 host_prompts 里的题目的主持人提示词）"""
+        prompt = self.host_prompts.setdefault(title, prompt) if prompt else self.host_prompts.get(title)
+        if self.prime_enabled and prompt and (self.host_route.name, prompt) not in self.requested:
+            self._spawn(self._prime, self.host_route, prompt)
+
+    def report(self, title):
+        """一行预热情况（只报告已经完成的部分，不等待后台线程）"""
+        parts = []
+        if self.connect_time is not None:
+            parts.append(f"连接 {self.connect_time:.2f}s")
+        if title in self.prompt_tokens:
+            parts.append(f"主持人提示词 {self.prompt_tokens[title]} tokens")
+        if (self.host_route.name, self.host_prompts.get(title)) in self.primed:
+            parts.append(f"已预热前缀缓存（{self.host_route.name}）")
+        if self.errors:
+            parts.append(f"{len(self.errors)} 项失败（{self.errors[0]}）")
+        return f"🔥 预热: {'，'.join(parts) or '进行中'}"
+
+    def join(self, timeout=None):
+        for thread in list(self.threads):
+            thread.join(timeout)
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, name="warmup", daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def _run(self, likely_titles):
+        self._connect()
+        for title, prompt in list(self.host_prompts.items()):
+            self.prompt_tokens[title] = count_tokens(prompt, self.host_route.model)
+        if not self.prime_enabled:
+            return
+        for title in likely_titles[:PRIME_PUZZLES]:
+            self._prime(self.host_route, self.host_prompts[title])
+        for route, prompt in self.player_routes:
+            self._prime(route, prompt)
+
+    def _connect(self):
+        """和各角色用到的每个端点各建立一次连接"""
+        start = time.perf_counter()
+        endpoints = {}
+        for route in [self.host_route] + [route for route, _ in self.player_routes]:
+            endpoints.setdefault(route.endpoint, route)
+        for endpoint, route in endpoints.items():
+            try:
+                self.router.client(route).models.list()
+            except Exception as e:  # 有的兼容接口没有 /models，连接本身通常已经建立
+                self.errors.append(f"连接 {endpoint}: {type(e).__name__}")
+        self.connect_time = time.perf_counter() - start
+
+    def _prime(self, route, system_prompt):
+        with self.lock:
+            if (route.name, system_prompt) in self.requested:
+                return
+            self.requested.add((route.name, system_prompt))
+        limit = self.router.limits.get(route.endpoint)
+        estimated = count_tokens(system_prompt, route.model) + 16
+        if limit:
+            limit.acquire(estimated)  # 预热请求同样占用端点的每分钟 token 额度
+        try:
+            response = self.router.client(route).chat.completions.create(
+                model=route.model,
+                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": "准备开始"}],
+                max_tokens=1,
+                temperature=0,
+            )
+            if self.counter and getattr(response, "usage", None):
+                self.counter.add(response.usage)
+            self.primed.add((route.name, system_prompt))
+        except Exception as e:
+            self.errors.append(f"预热 {route.name}: {type(e).__name__}")